@@ -1,22 +1,57 @@
-﻿from gradio.blocks import Blocks
+﻿import time
 
-from src.config.config_loader import initialize_data
-from src.state.state_model import StateModel
-from src.ui.interface import create_gradio_interface
-from src.utils.env_manager import save_initial_environ
-from src.utils.logging_manager import setup_logging, suppress_warnings
+# *start of the startup timings, taken before the heavy imports below
+STARTED_AT: float = time.perf_counter()
 
-if __name__ == "__main__":
+from gradio.blocks import Blocks  # noqa: E402
+
+from src.config.config_loader import initialize_data  # noqa: E402
+from src.state.state_model import StateModel  # noqa: E402
+from src.ui.interface import create_gradio_interface  # noqa: E402
+from src.utils.env_manager import save_initial_environ  # noqa: E402
+from src.utils.logging_manager import setup_logging, suppress_warnings  # noqa: E402
+from src.utils.startup_timer import StartupTimer  # noqa: E402
+
+
+def main(server_port: int = 7859, block: bool = True) -> StartupTimer:
+    """
+    Starts the app and logs the time of each startup phase until the server is listening.
+
+    Args:
+        server_port (int, optional): Port of the Gradio server. Defaults to 7859.
+        block (bool, optional): Serve until interrupted; if False, the server is closed once it
+                                listens (used by `src.benchmarks.startup`). Defaults to True.
+
+    Returns:
+        StartupTimer: The startup phases.
+    """
+    timer: StartupTimer = StartupTimer(STARTED_AT)
+    timer.mark("imports")
     suppress_warnings()
     setup_logging()
 
-    # !Set Gradio-State Init
-    state: StateModel = StateModel()
-    # !save initial env info to gradio state
-    save_initial_environ(state)
-    # !Initializes the data within the provided StateModel instance.
-    initialize_data(state)
-    # !Create UI Component
-    demo: Blocks = create_gradio_interface(state)
-    # !Start UI defined by above Blocks
-    demo.launch(server_port=7859, share=False)
+    with timer.phase("state"):
+        # !Set Gradio-State Init
+        state: StateModel = StateModel()
+        # !save initial env info to gradio state
+        save_initial_environ(state)
+    with timer.phase("initialize_data"):
+        # !Initializes the data within the provided StateModel instance.
+        initialize_data(state)
+    with timer.phase("create_interface"):
+        # !Create UI Component
+        demo: Blocks = create_gradio_interface(state)
+    with timer.phase("launch"):
+        # !Start UI defined by above Blocks
+        demo.launch(server_port=server_port, share=False, prevent_thread_lock=True)
+    timer.log()
+
+    if block:
+        demo.block_thread()
+    else:
+        demo.close()
+    return timer
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,62 @@ function run() {
   version_node.innerHTML = "MS Global Hackathon 2024 Demo App";
   version_node.style = "position: fixed; top: 10px; right: 10px;";
   main_parent.appendChild(version_node);
+
+  // Level of detail of large relationship graphs (see graph_visualization.py):
+  // zooming in switches to the detail layer, zooming back out to the overview.
+  // Gradio does not expose Plotly globally, so the figure's own buttons are clicked.
+  const switch_level_of_detail = (plot, event) => {
+    const lod = plot.layout && plot.layout.meta && plot.layout.meta.lod;
+    if (!lod) return;
+
+    let level = null;
+    if (event["xaxis.autorange"]) {
+      level = 0;
+    } else if ("xaxis.range[0]" in event && "xaxis.range[1]" in event) {
+      const zoomed = Math.abs(event["xaxis.range[1]"] - event["xaxis.range[0]"]);
+      const full = Math.abs(lod.x_range[1] - lod.x_range[0]) || 1;
+      level = zoomed / full < lod.expand_ratio ? 1 : 0;
+    }
+    if (level === null || plot._lod_level === level) return;
+
+    const buttons = plot.querySelectorAll("g.updatemenu-button");
+    if (buttons.length !== lod.buttons.length) return;
+    plot._lod_level = level;
+    buttons[level].dispatchEvent(new MouseEvent("click", { bubbles: true }));
+  };
+
+  const watch_plots = () => {
+    document.querySelectorAll(".js-plotly-plot").forEach((plot) => {
+      if (plot._lod_watched || typeof plot.on !== "function") return;
+      plot._lod_watched = true;
+      plot.on("plotly_relayout", (event) => switch_level_of_detail(plot, event));
+      // a new figure in the same plot starts at the overview
+      plot.on("plotly_react", () => {
+        plot._lod_level = 0;
+      });
+    });
+  };
+  // Context tables (see publish_context_tables in search_engine.py): a response sends a
+  // placeholder per panel, the first page is requested once its panel is open.
+  const load_context_tables = () => {
+    document.querySelectorAll(".context-table-pending").forEach((pending) => {
+      if (pending.offsetParent === null) return; // panel closed
+      if (pending.dataset.requested === pending.dataset.response) return;
+      const panel = pending.closest(".context-table-panel");
+      const load = panel && panel.querySelector(".context-table-load");
+      if (!load) return;
+      pending.dataset.requested = pending.dataset.response;
+      load.click();
+    });
+  };
+
+  new MutationObserver(() => {
+    watch_plots();
+    load_context_tables();
+  }).observe(document.body, {
+    childList: true,
+    subtree: true,
+    attributes: true,
+    attributeFilter: ["class", "style"],
+  });
 }
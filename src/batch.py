@@ -0,0 +1,242 @@
+﻿"""
+Runs a JSONL file of queries against a GraphRAG index without the Gradio UI.
+
+Usage:
+    python -m src.batch --input queries.jsonl --output results.jsonl --concurrency 4
+    python -m src.batch --input queries.jsonl --output results.parquet --folder 20240923-101940
+
+Each input line is a JSON object with a "query" and optionally "id", "query_type" (global/local),
+"community_level" and "response_type" (defaults come from the command line). Queries go through
+the same search path as the chat (`create_search_engine`), with at most `--concurrency` running at
+once. One JSON line per finished query (answer, context ids, LLM calls, prompt tokens, latency) is
+appended to the output (or to `<output>.partial.jsonl` for a parquet output, converted when the run
+ends), so an interrupted run resumes where it stopped: queries with an "ok" result are skipped,
+failed ones are run again.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+import pandas as pd
+from graphrag.query.structured_search.base import BaseSearch, SearchResult
+
+from src.config.config_loader import initialize_data
+from src.search.search_engine import create_search_engine
+from src.state.state_model import StateModel
+from src.utils.env_manager import save_initial_environ
+from src.utils.logging_manager import setup_logging, suppress_warnings
+
+
+def query_id(spec: dict[str, Any]) -> str:
+    """The id of an input query: its "id" field, or a hash of its query settings."""
+    if spec.get("id") not in (None, ""):
+        return str(spec["id"])
+    payload: str = json.dumps(
+        {
+            key: spec.get(key)
+            for key in ("query", "query_type", "community_level", "response_type")
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_queries(path: str, defaults: dict[str, Any]) -> list[dict[str, Any]]:
+    """Reads the input JSONL, filling missing settings with `defaults` and assigning ids."""
+    queries: list[dict[str, Any]] = []
+    with open(path, encoding="utf-8") as fi:
+        for line_number, line in enumerate(fi, start=1):
+            if not line.strip():
+                continue
+            spec: dict[str, Any] = json.loads(line)
+            if not spec.get("query"):
+                raise SystemExit(f"{path}:{line_number}: missing \"query\"")
+            spec = {**defaults, **{k: v for k, v in spec.items() if v is not None}}
+            spec["community_level"] = str(spec["community_level"])
+            spec["id"] = query_id(spec)
+            queries.append(spec)
+    return queries
+
+
+def read_results(journal_path: str) -> dict[str, dict[str, Any]]:
+    """Reads the results written so far, the last result of an id wins."""
+    results: dict[str, dict[str, Any]] = {}
+    if not os.path.exists(journal_path):
+        return results
+    with open(journal_path, encoding="utf-8") as fi:
+        for line in fi:
+            try:
+                result: dict[str, Any] = json.loads(line)
+            except json.JSONDecodeError:
+                # !the last line of a killed run may be cut off
+                continue
+            results[result["id"]] = result
+    return results
+
+
+def context_ids(context_data: Any) -> dict[str, list[str]]:
+    """Ids of the context records (reports, entities, relationships, sources...) used by a search."""
+    if not isinstance(context_data, dict):
+        return {}
+    return {
+        name: [str(record_id) for record_id in records["id"].tolist()]
+        for name, records in context_data.items()
+        if isinstance(records, pd.DataFrame) and "id" in records.columns
+    }
+
+
+async def run_query(
+    state: StateModel, spec: dict[str, Any], folder: str
+) -> dict[str, Any]:
+    """Runs one query and returns its result record (status "error" if it failed)."""
+    record: dict[str, Any] = {
+        "id": spec["id"],
+        "query": spec["query"],
+        "query_type": spec["query_type"],
+        "community_level": spec["community_level"],
+        "response_type": spec["response_type"],
+        "folder": folder,
+    }
+    start: float = time.perf_counter()
+    try:
+        # *loading the index and building the context builder are blocking, keep them off the event loop
+        search_engine: BaseSearch = await asyncio.to_thread(
+            create_search_engine,
+            state,
+            spec["query_type"],
+            spec["community_level"],
+            spec["response_type"],
+            folder,
+        )
+        result: SearchResult = await search_engine.asearch(spec["query"])
+        record.update(
+            status="ok",
+            answer=result.response,
+            error=None,
+            context_ids=context_ids(result.context_data),
+            llm_calls=result.llm_calls,
+            prompt_tokens=result.prompt_tokens,
+        )
+        if getattr(search_engine, "pruning_stats", None):
+            record["pruning"] = search_engine.pruning_stats
+    except Exception as e:
+        logging.exception(f"query {spec['id']} failed")
+        record.update(
+            status="error",
+            answer=None,
+            error=f"{type(e).__name__}: {e}",
+            context_ids={},
+            llm_calls=0,
+            prompt_tokens=0,
+        )
+    record["latency_seconds"] = round(time.perf_counter() - start, 3)
+    record["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return record
+
+
+async def run_batch(
+    state: StateModel,
+    queries: list[dict[str, Any]],
+    journal_path: str,
+    folder: str,
+    concurrency: int,
+) -> None:
+    """Runs the queries with bounded parallelism, appending each result to the journal as it finishes."""
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+    done: int = 0
+
+    async def run(spec: dict[str, Any], journal) -> None:
+        nonlocal done
+        async with semaphore:
+            record: dict[str, Any] = await run_query(state, spec, folder)
+        # *single event loop: writes of finished queries never interleave
+        journal.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        journal.flush()
+        done += 1
+        logging.info(
+            f"[{done}/{len(queries)}] {record['id']} {record['status']} in {record['latency_seconds']}s"
+        )
+
+    os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        await asyncio.gather(*[run(spec, journal) for spec in queries])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--input", required=True, help="JSONL file of queries")
+    parser.add_argument("--output", required=True, help="results file (.jsonl or .parquet)")
+    parser.add_argument("--concurrency", type=int, default=4, help="queries running at once")
+    parser.add_argument("--folder", help="index output folder (default: the latest)")
+    parser.add_argument("--root-dir", default="graphdata", help="graphdata root directory")
+    parser.add_argument("--query-type", default="global", choices=["global", "local"])
+    parser.add_argument("--community-level", default="2")
+    parser.add_argument("--response-type", default="Multiple Paragraphs")
+    args = parser.parse_args()
+
+    suppress_warnings()
+    setup_logging()
+
+    state: StateModel = StateModel()
+    state.root_dir = os.path.abspath(args.root_dir)
+    save_initial_environ(state)
+    initialize_data(state)
+    if state.param is None:
+        raise SystemExit(f"Could not load the GraphRAG settings of {state.root_dir}")
+    folder: str = args.folder or state.timestamp
+    if folder is None:
+        raise SystemExit(f"No index output folder found in {state.root_dir}")
+    state.timestamp = folder
+
+    queries: list[dict[str, Any]] = read_queries(
+        args.input,
+        {
+            "query_type": args.query_type,
+            "community_level": args.community_level,
+            "response_type": args.response_type,
+        },
+    )
+    to_parquet: bool = args.output.endswith(".parquet")
+    journal_path: str = f"{args.output}.partial.jsonl" if to_parquet else args.output
+
+    finished: dict[str, dict[str, Any]] = read_results(journal_path)
+    pending: list[dict[str, Any]] = [
+        spec
+        for spec in queries
+        if finished.get(spec["id"], {}).get("status") != "ok"
+    ]
+    logging.info(
+        f"batch: {len(queries)} queries, {len(queries) - len(pending)} already done, "
+        f"{len(pending)} to run on {folder} (concurrency {args.concurrency})"
+    )
+    asyncio.run(
+        run_batch(state, pending, journal_path, folder, max(1, args.concurrency))
+    )
+
+    results: dict[str, dict[str, Any]] = read_results(journal_path)
+    if to_parquet:
+        frame: pd.DataFrame = pd.DataFrame(
+            [results[spec["id"]] for spec in queries if spec["id"] in results]
+        )
+        # *nested columns are kept as JSON text
+        for column in ("context_ids", "pruning"):
+            if column in frame.columns:
+                frame[column] = frame[column].map(
+                    lambda value: json.dumps(value) if isinstance(value, dict) else None
+                )
+        frame.to_parquet(args.output, index=False)
+    failed: int = sum(
+        1 for spec in queries if results.get(spec["id"], {}).get("status") != "ok"
+    )
+    logging.info(f"batch done: {len(queries) - failed} ok, {failed} failed -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+﻿"""
+Checks the blob sync (skip, resume, restart, MD5) against Azurite or the local Blob stand-in.
+
+Usage:
+    python -m src.benchmarks.blob_sync --files 20 --size-kb 2048
+    python -m src.benchmarks.blob_sync --connection-string "UseDevelopmentStorage=true"
+
+Without a connection string the checks run against `src.benchmarks.mock_blob_storage`; with
+`UseDevelopmentStorage=true` they run against a local Azurite (`azurite-blob --loose`). A fresh
+container is filled with random index blobs through the Azure SDK, synced with `sync_blobs` into
+a temporary directory, and deleted afterwards. Checks:
+
+- a first sync downloads every blob, a second one skips them all (manifest);
+- a `.part` left with the blob's ETag is resumed from its size;
+- a `.part` left with an older ETag is discarded and the changed blob downloaded from the start;
+- a blob whose content does not match its Content-MD5 fails and leaves no file behind.
+
+The first sync's throughput is reported too. Exits with 1 if a check fails.
+"""
+
+import argparse
+import os
+import secrets
+import shutil
+import tempfile
+from collections.abc import Callable
+from typing import Any
+
+from azure.storage.blob import BlobProperties, ContainerClient, ContentSettings
+from tabulate import tabulate
+
+from src.benchmarks.mock_blob_storage import MockBlobStorage
+from src.utils.blob_storage import (
+    PARTIAL_SUFFIX,
+    BlobSyncStats,
+    get_container_client,
+    list_index_blobs,
+    sync_blobs,
+)
+from src.utils.logging_manager import setup_logging
+
+FOLDER: str = "output/20240101-000000/artifacts"
+
+
+class SyncCheck:
+    """
+    Runs the checks on one container and a local directory.
+
+    Attributes:
+        container_client (ContainerClient): The container the blobs are uploaded to.
+        dest_dir (str): Local graphdata root the blobs are synced into.
+        contents (dict[str, bytes]): Uploaded content per blob name.
+        results (list[dict[str, Any]]): Outcome of every check.
+    """
+
+    def __init__(self, container_client: ContainerClient, dest_dir: str):
+        self.container_client: ContainerClient = container_client
+        self.dest_dir: str = dest_dir
+        self.contents: dict[str, bytes] = {}
+        self.results: list[dict[str, Any]] = []
+
+    def upload(self, name: str, data: bytes, content_md5: bytes | None = None) -> None:
+        self.container_client.upload_blob(
+            name,
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(content_md5=content_md5)
+            if content_md5
+            else None,
+        )
+        self.contents[name] = data
+
+    def local_path(self, name: str) -> str:
+        return os.path.join(self.dest_dir, *name.split("/"))
+
+    def blob(self, name: str) -> BlobProperties:
+        return next(blob for blob in list_index_blobs(self.container_client) if blob.name == name)
+
+    def sync(self, names: list[str] | None = None) -> BlobSyncStats:
+        blobs: list[BlobProperties] = list_index_blobs(self.container_client)
+        return sync_blobs(
+            self.container_client,
+            [blob for blob in blobs if names is None or blob.name in names],
+            self.dest_dir,
+        )
+
+    def matches(self, name: str) -> bool:
+        path: str = self.local_path(name)
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as fi:
+            return fi.read() == self.contents[name]
+
+    def leave_partial(self, name: str, data: bytes, etag: str) -> None:
+        """Leaves the files of an interrupted download of a blob: `.part` and the ETag it was started with."""
+        os.remove(self.local_path(name))
+        with open(self.local_path(name) + PARTIAL_SUFFIX, "wb") as fo:
+            fo.write(data)
+        with open(self.local_path(name) + PARTIAL_SUFFIX + ".etag", "w", encoding="utf-8") as fo:
+            fo.write(etag)
+
+    def check(self, name: str, run: Callable[[], tuple[bool, BlobSyncStats]]) -> None:
+        try:
+            ok, stats = run()
+            self.results.append({"check": name, "ok": ok, "stats": str(stats)})
+        except Exception as e:
+            self.results.append({"check": name, "ok": False, "stats": f"{type(e).__name__}: {e}"})
+
+
+def run_checks(check: SyncCheck, files: int, size: int) -> BlobSyncStats:
+    """
+    Runs every check in order (each one builds on the files the previous ones left).
+
+    Returns:
+        BlobSyncStats: The first sync, for its throughput.
+    """
+    names: list[str] = [f"{FOLDER}/table_{i}.parquet" for i in range(files)]
+    for name in names:
+        check.upload(name, os.urandom(size))
+    first: BlobSyncStats = BlobSyncStats()
+
+    def first_sync() -> tuple[bool, BlobSyncStats]:
+        nonlocal first
+        first = check.sync(names)
+        return first.downloaded == files and all(map(check.matches, names)), first
+
+    def second_sync() -> tuple[bool, BlobSyncStats]:
+        stats: BlobSyncStats = check.sync(names)
+        return stats.skipped == files and stats.downloaded == 0 and stats.bytes == 0, stats
+
+    def resume() -> tuple[bool, BlobSyncStats]:
+        name: str = names[0]
+        check.leave_partial(name, check.contents[name][: size // 2], check.blob(name).etag)
+        stats: BlobSyncStats = check.sync(names)
+        return (
+            stats.resumed == 1
+            and stats.bytes == size - size // 2
+            and stats.skipped == files - 1
+            and check.matches(name)
+        ), stats
+
+    def restart() -> tuple[bool, BlobSyncStats]:
+        name: str = names[-1]
+        old_data: bytes = check.contents[name]
+        old_etag: str = check.blob(name).etag
+        check.upload(name, os.urandom(size))
+        check.leave_partial(name, old_data[: size // 2], old_etag)
+        stats: BlobSyncStats = check.sync(names)
+        return (
+            stats.downloaded == 1
+            and stats.resumed == 0
+            and stats.bytes == size
+            and check.matches(name)
+        ), stats
+
+    def md5_mismatch() -> tuple[bool, BlobSyncStats]:
+        name: str = f"{FOLDER}/corrupt.parquet"
+        check.upload(name, os.urandom(size), content_md5=os.urandom(16))
+        stats: BlobSyncStats = check.sync([name])
+        leftovers: list[str] = [
+            path
+            for path in (
+                check.local_path(name),
+                check.local_path(name) + PARTIAL_SUFFIX,
+                check.local_path(name) + PARTIAL_SUFFIX + ".etag",
+            )
+            if os.path.exists(path)
+        ]
+        return stats.failed == 1 and not leftovers, stats
+
+    check.check("first sync downloads every blob", first_sync)
+    check.check("unchanged blobs are skipped", second_sync)
+    check.check(".part with the same ETag is resumed", resume)
+    check.check(".part of a changed blob is restarted", restart)
+    check.check("MD5 mismatch is discarded", md5_mismatch)
+    return first
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--connection-string", help="e.g. UseDevelopmentStorage=true (default: local stand-in)")
+    parser.add_argument("--files", type=int, default=8, help="blobs uploaded")
+    parser.add_argument("--size-kb", type=int, default=512, help="size of every blob")
+    parser.add_argument("--keep", action="store_true", help="keep the container and the local directory")
+    args = parser.parse_args()
+    setup_logging("WARNING")
+
+    mock: MockBlobStorage | None = None
+    connection_string: str | None = args.connection_string
+    if connection_string is None:
+        mock = MockBlobStorage().start()
+        connection_string = mock.connection_string
+
+    container_name: str = f"blob-sync-check-{secrets.token_hex(4)}"
+    container_client: ContainerClient = get_container_client(connection_string, container_name)
+    container_client.create_container()
+    dest_dir: str = tempfile.mkdtemp(prefix="graphrag-blob-sync-")
+    check: SyncCheck = SyncCheck(container_client, dest_dir)
+    try:
+        first: BlobSyncStats = run_checks(check, args.files, args.size_kb * 1024)
+    finally:
+        if not args.keep:
+            container_client.delete_container()
+            shutil.rmtree(dest_dir, ignore_errors=True)
+        if mock is not None:
+            mock.stop()
+
+    print(
+        tabulate(
+            [(result["check"], "ok" if result["ok"] else "FAILED", result["stats"]) for result in check.results],
+            headers=["check", "result", "sync"],
+        )
+    )
+    print(f"\nfirst sync: {first.throughput_mb_s:.1f} MB/s ({first})")
+    if args.keep:
+        print(f"container {container_name}, local directory {dest_dir}")
+    if not all(result["ok"] for result in check.results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+﻿"""
+A local in-memory stand-in for the Azure Blob Storage REST API, enough for `sync_blobs`.
+
+Usage:
+    python -m src.benchmarks.mock_blob_storage --port 10000
+
+Serves the Azurite development account (`devstoreaccount1`, see `connection_string`) and answers
+the calls the Azure SDK makes to create or delete a container, upload a blob in one request, list
+blobs (with a prefix and an optional delimiter) and download a blob (ranged, with an If-Match ETag
+condition). Requests are not authenticated. Like the service, a blob gets a new ETag on every
+upload and keeps the Content-MD5 it was uploaded with (the MD5 of its content if none was given).
+For a check against a real emulator, use Azurite and `UseDevelopmentStorage=true` instead.
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import itertools
+import re
+import threading
+from dataclasses import dataclass
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# *Azurite's well-known development account
+ACCOUNT_NAME: str = "devstoreaccount1"
+ACCOUNT_KEY: str = (
+    "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+)
+
+
+@dataclass
+class MockBlob:
+    """
+    A stored blob.
+
+    Attributes:
+        data (bytes): Content of the blob.
+        etag (str): ETag of the current version (quoted).
+        content_md5 (str | None): Base64 Content-MD5 property.
+        last_modified (str): Upload time (RFC 1123).
+    """
+
+    data: bytes
+    etag: str
+    content_md5: str | None
+    last_modified: str
+
+
+class MockBlobStorage:
+    """
+    Runs the stand-in on a background thread.
+
+    Attributes:
+        containers (dict[str, dict[str, MockBlob]]): Blobs per container.
+        url (str): Blob endpoint of the account.
+        connection_string (str): Connection string for `get_container_client`.
+        requests (dict[str, int]): Number of requests served per kind (put, list, get).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.containers: dict[str, dict[str, MockBlob]] = {}
+        self.requests: dict[str, int] = {"put": 0, "list": 0, "get": 0}
+        self._lock: threading.Lock = threading.Lock()
+        self._versions: itertools.count = itertools.count(1)
+        self._httpd: ThreadingHTTPServer = ThreadingHTTPServer(
+            (host, port), _handler_class(self)
+        )
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/{ACCOUNT_NAME}"
+
+    @property
+    def connection_string(self) -> str:
+        return (
+            f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT_NAME};"
+            f"AccountKey={ACCOUNT_KEY};BlobEndpoint={self.url};"
+        )
+
+    def start(self) -> "MockBlobStorage":
+        """Starts serving on a daemon thread."""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-blob-storage", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockBlobStorage":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def put(
+        self, container: str, name: str, data: bytes, content_md5: str | None = None
+    ) -> MockBlob:
+        """Stores a new version of a blob."""
+        blob: MockBlob = MockBlob(
+            data=data,
+            etag=f'"0x{next(self._versions):016X}"',
+            content_md5=content_md5
+            or base64.b64encode(hashlib.md5(data).digest()).decode("ascii"),
+            last_modified=formatdate(usegmt=True),
+        )
+        with self._lock:
+            self.containers.setdefault(container, {})[name] = blob
+        return blob
+
+    def get(self, container: str, name: str) -> MockBlob | None:
+        with self._lock:
+            return self.containers.get(container, {}).get(name)
+
+    def list(self, container: str, prefix: str) -> list[tuple[str, MockBlob]]:
+        with self._lock:
+            return sorted(
+                (name, blob)
+                for name, blob in self.containers.get(container, {}).items()
+                if name.startswith(prefix)
+            )
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+
+def list_blobs_xml(
+    container: str, prefix: str, delimiter: str, blobs: list[tuple[str, MockBlob]]
+) -> bytes:
+    """The List Blobs response; with a delimiter, names continuing past it become `BlobPrefix` entries."""
+    items: list[str] = []
+    prefixes: set[str] = set()
+    for name, blob in blobs:
+        rest: str = name[len(prefix) :]
+        if delimiter and delimiter in rest:
+            prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+            continue
+        items.append(
+            f"<Blob><Name>{html.escape(name)}</Name><Properties>"
+            f"<Last-Modified>{blob.last_modified}</Last-Modified><Etag>{blob.etag}</Etag>"
+            f"<Content-Length>{len(blob.data)}</Content-Length>"
+            "<Content-Type>application/octet-stream</Content-Type>"
+            f"<Content-MD5>{blob.content_md5 or ''}</Content-MD5>"
+            "<BlobType>BlockBlob</BlobType></Properties></Blob>"
+        )
+    items.extend(
+        f"<BlobPrefix><Name>{html.escape(name)}</Name></BlobPrefix>"
+        for name in sorted(prefixes)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<EnumerationResults ContainerName="{html.escape(container)}">'
+        f"<Prefix>{html.escape(prefix)}</Prefix><Blobs>{''.join(items)}</Blobs>"
+        "<NextMarker /></EnumerationResults>"
+    ).encode("utf-8")
+
+
+def _handler_class(server: MockBlobStorage) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def do_PUT(self) -> None:
+            container, name, query = self._route()
+            data: bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            server.count("put")
+            if query.get("restype") == "container" or not name:
+                with server._lock:
+                    server.containers.setdefault(container, {})
+                self._empty(201, {"ETag": '"0x0"', "Last-Modified": formatdate(usegmt=True)})
+                return
+            blob: MockBlob = server.put(
+                container, name, data, self.headers.get("x-ms-blob-content-md5")
+            )
+            self._empty(
+                201,
+                {
+                    "ETag": blob.etag,
+                    "Last-Modified": blob.last_modified,
+                    "Content-MD5": base64.b64encode(hashlib.md5(data).digest()).decode("ascii"),
+                    "x-ms-request-server-encrypted": "false",
+                },
+            )
+
+        def do_DELETE(self) -> None:
+            container, name, _ = self._route()
+            with server._lock:
+                if name:
+                    server.containers.get(container, {}).pop(name, None)
+                else:
+                    server.containers.pop(container, None)
+            self._empty(202, {})
+
+        def do_GET(self) -> None:
+            container, name, query = self._route()
+            if query.get("comp") == "list":
+                server.count("list")
+                body: bytes = list_blobs_xml(
+                    container,
+                    query.get("prefix", ""),
+                    query.get("delimiter", ""),
+                    server.list(container, query.get("prefix", "")),
+                )
+                self._body(200, body, {"Content-Type": "application/xml"})
+                return
+
+            server.count("get")
+            blob: MockBlob | None = server.get(container, name)
+            if blob is None:
+                self._error(404, "BlobNotFound")
+                return
+            if_match: str | None = self.headers.get("If-Match")
+            if if_match and if_match not in ("*", blob.etag):
+                self._error(412, "ConditionNotMet")
+                return
+
+            size: int = len(blob.data)
+            start, end = 0, size - 1
+            requested: str | None = self.headers.get("x-ms-range") or self.headers.get("Range")
+            match: re.Match | None = re.match(r"bytes=(\d+)-(\d*)", requested or "")
+            if match is not None:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+                if start >= size and size:
+                    self._error(416, "InvalidRange")
+                    return
+            headers: dict[str, str] = {
+                "Content-Type": "application/octet-stream",
+                "ETag": blob.etag,
+                "Last-Modified": blob.last_modified,
+                "x-ms-blob-type": "BlockBlob",
+            }
+            if blob.content_md5:
+                # *a ranged GET returns the MD5 of the whole blob in its own header
+                headers["x-ms-blob-content-md5" if match else "Content-MD5"] = blob.content_md5
+            if match is not None:
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self._body(206 if match else 200, blob.data[start : end + 1], headers)
+
+        def _route(self) -> tuple[str, str, dict[str, str]]:
+            url = urlsplit(self.path)
+            # *path: /<account>/<container>/<blob name>
+            parts: list[str] = unquote(url.path).lstrip("/").split("/", 2)
+            query: dict[str, str] = {
+                key: values[0] for key, values in parse_qs(url.query).items()
+            }
+            return (
+                parts[1] if len(parts) > 1 else "",
+                parts[2] if len(parts) > 2 else "",
+                query,
+            )
+
+        def _body(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _empty(self, status: int, headers: dict[str, str]) -> None:
+            self._body(status, b"", headers)
+
+        def _error(self, status: int, code: str) -> None:
+            body: bytes = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                f"<Error><Code>{code}</Code><Message>{code}</Message></Error>"
+            ).encode("utf-8")
+            self._body(
+                status, body, {"Content-Type": "application/xml", "x-ms-error-code": code}
+            )
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10000)
+    args = parser.parse_args()
+
+    server: MockBlobStorage = MockBlobStorage(host=args.host, port=args.port)
+    print(f"mock Blob Storage on {server.url} (Ctrl+C to stop)")
+    print(f"connection string: {server.connection_string}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
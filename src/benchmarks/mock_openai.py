@@ -0,0 +1,273 @@
+﻿"""
+A local OpenAI-compatible stub server (chat completions and embeddings) for benchmarks.
+
+Usage:
+    python -m src.benchmarks.mock_openai --port 8765 --latency-ms 400 --tokens 200 --token-ms 5
+
+Answers both the OpenAI (`/v1/chat/completions`) and the Azure OpenAI
+(`/openai/deployments/<deployment>/chat/completions`) routes, streamed or not. Global search map
+prompts get a JSON list of key points, other prompts get `--tokens` words. Embeddings are
+deterministic per input text. Latency is `--latency-ms` before the first token plus `--token-ms`
+per token, so LLM time in a benchmark is known and the rest is the app's own overhead.
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import numpy as np
+
+
+@dataclass
+class MockOpenAIConfig:
+    """
+    Behaviour of the stub server.
+
+    Attributes:
+        latency_ms (float): Delay before the first token (or the whole response).
+        token_ms (float): Delay per generated token.
+        tokens (int): Number of tokens (words) in a completion.
+        embedding_ms (float): Delay of an embedding request.
+        embedding_dim (int): Dimensions of the returned embeddings.
+    """
+
+    latency_ms: float = 300.0
+    token_ms: float = 5.0
+    tokens: int = 200
+    embedding_ms: float = 50.0
+    embedding_dim: int = 1536
+
+
+class MockOpenAIServer:
+    """
+    Runs the stub server on a background thread.
+
+    Attributes:
+        config (MockOpenAIConfig): Latency and output settings.
+        url (str): Base URL to use as `api_base`.
+        requests (dict[str, int]): Number of requests served per kind (chat, stream, embeddings).
+    """
+
+    def __init__(
+        self,
+        config: MockOpenAIConfig | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.config: MockOpenAIConfig = config or MockOpenAIConfig()
+        self.requests: dict[str, int] = {"chat": 0, "stream": 0, "embeddings": 0}
+        self._lock: threading.Lock = threading.Lock()
+        self._httpd: ThreadingHTTPServer = ThreadingHTTPServer(
+            (host, port), _handler_class(self)
+        )
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOpenAIServer":
+        """Starts serving on a daemon thread."""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-openai", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+
+def completion_text(messages: list[dict[str, Any]], tokens: int) -> str:
+    """The completion of a prompt: map key points for global search map prompts, else plain words."""
+    system: str = str(messages[0].get("content", "")) if messages else ""
+    if '"points"' in system:
+        # *a graphrag map prompt, answer with parsable key points citing a report
+        return json.dumps(
+            {
+                "points": [
+                    {
+                        "description": " ".join(["finding"] * max(1, tokens // 4))
+                        + f" [Data: Reports ({i})]",
+                        "score": 50 + 10 * i,
+                    }
+                    for i in range(1, 4)
+                ]
+            }
+        )
+    return " ".join(f"word{i % 50}" for i in range(tokens)) + " [Data: Reports (1, 2)]"
+
+
+def embedding_vector(text: str, dim: int) -> list[float]:
+    """A deterministic unit-length pseudo embedding of a text."""
+    seed: int = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector: np.ndarray = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _handler_class(server: MockOpenAIServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            body: dict[str, Any] = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}"
+            )
+            path: str = self.path.split("?")[0]
+            if path.endswith("/chat/completions"):
+                self._chat(body)
+            elif path.endswith("/embeddings"):
+                self._embeddings(body)
+            else:
+                self._json(404, {"error": {"message": f"unknown route {path}"}})
+
+        def _chat(self, body: dict[str, Any]) -> None:
+            config: MockOpenAIConfig = server.config
+            text: str = completion_text(body.get("messages", []), config.tokens)
+            words: list[str] = text.split(" ")
+            model: str = body.get("model", "mock")
+            time.sleep(config.latency_ms / 1000)
+            if not body.get("stream"):
+                server.count("chat")
+                time.sleep(config.token_ms * len(words) / 1000)
+                self._json(
+                    200,
+                    {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": text},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 0,
+                            "completion_tokens": len(words),
+                            "total_tokens": len(words),
+                        },
+                    },
+                )
+                return
+
+            server.count("stream")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, word in enumerate(words):
+                delta: str = word if i == 0 else f" {word}"
+                self._chunk(
+                    {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {"index": 0, "delta": {"content": delta}, "finish_reason": None}
+                        ],
+                    }
+                )
+                time.sleep(config.token_ms / 1000)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _embeddings(self, body: dict[str, Any]) -> None:
+            server.count("embeddings")
+            time.sleep(server.config.embedding_ms / 1000)
+            inputs: Any = body.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            self._json(
+                200,
+                {
+                    "object": "list",
+                    "model": body.get("model", "mock"),
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": i,
+                            "embedding": embedding_vector(
+                                str(value), server.config.embedding_dim
+                            ),
+                        }
+                        for i, value in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                },
+            )
+
+        def _json(self, status: int, payload: dict[str, Any]) -> None:
+            data: bytes = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, payload: dict[str, Any]) -> None:
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+        def _write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--embedding-ms", type=float, default=50.0)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    server: MockOpenAIServer = MockOpenAIServer(
+        MockOpenAIConfig(
+            latency_ms=args.latency_ms,
+            token_ms=args.token_ms,
+            tokens=args.tokens,
+            embedding_ms=args.embedding_ms,
+            embedding_dim=args.embedding_dim,
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    print(f"mock OpenAI server on {server.url} (Ctrl+C to stop)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+﻿"""The git revision benchmark results are recorded against (imports nothing of the app)."""
+
+import subprocess
+
+
+def git_revision() -> str | None:
+    """The current commit of the working tree, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
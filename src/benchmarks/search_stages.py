@@ -0,0 +1,450 @@
+﻿"""
+Measures where time goes in global and local searches, stage by stage, without calling Azure.
+
+Usage:
+    python -m src.benchmarks.search_stages --scales 1 4 16 --iterations 5 --output search_stages.json
+    python -m src.benchmarks.search_stages --compare previous.json --output search_stages.json
+
+The sample index (graphdata/output/20240923-101940 by default) is copied to a temporary root,
+scaled up `--scales` times with renamed copies of every entity, relationship, community and text
+unit, and given random entity embeddings. The LLM and embedding calls go to a local stub server
+(`src.benchmarks.mock_openai`) with a fixed latency, so the stage timings show the app's own
+overhead next to a known LLM time.
+
+Stages: read_df, read_compiled (the same tables from the `compile_index` snapshot),
+get_context_builder, embedding, build_context, map, reduce, completion, render_html,
+visualize_relationships (p50/p95/mean in ms, warm-up excluded).
+The JSON output can be compared with the output of a previous version (`--compare`). The
+`create_knowledge_graph` and `visualize_graph` stages of earlier results no longer exist (the
+relationship rows are plotted directly), so they are not compared with `visualize_relationships`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Generator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from graphrag.config import create_graphrag_config
+from graphrag.query.structured_search.base import BaseSearch, SearchResult
+from tabulate import tabulate
+
+from src.benchmarks.mock_openai import MockOpenAIConfig, MockOpenAIServer
+from src.benchmarks.revision import git_revision
+from src.graph.graph_layout import GraphLayout
+from src.graph.graph_visualization import visualize_relationships
+from src.search.search_engine import (
+    create_search_engine,
+    render_global_reports,
+    render_local_html,
+)
+from src.state.state_model import StateModel
+from src.utils.compiled_index import compile_index, open_compiled_index
+from src.utils.context_tables import ContextTable
+from src.utils.df_manager import TABLES, get_artifacts_signature, read_df
+from src.utils.graphrag_context_manager import get_context_builder
+from src.utils.logging_manager import setup_logging
+
+SAMPLE_ARTIFACTS: str = "graphdata/output/20240923-101940/artifacts"
+QUERIES: list[str] = [
+    "What are the main topics of these documents?",
+    "How is content safety handled?",
+    "Which models can be deployed and how?",
+]
+
+
+class StageTimer:
+    """Collects the durations of named stages."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.recording: bool = True
+
+    @contextmanager
+    def measure(self, stage: str) -> Generator[None, None, None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.recording:
+                self.samples[stage].append((time.perf_counter() - start) * 1000)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """p50/p95/mean (ms) and sample count per stage."""
+        return {
+            stage: {
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "mean_ms": round(float(np.mean(values)), 3),
+                "n": len(values),
+            }
+            for stage, values in self.samples.items()
+        }
+
+
+def _suffix(value: Any, copy: int) -> Any:
+    return value if copy == 0 or value is None else f"{value} #{copy}"
+
+
+def _suffix_list(values: Any, copy: int) -> Any:
+    if values is None or copy == 0:
+        return values
+    return [f"{value} #{copy}" for value in values]
+
+
+def _offset_community(series: pd.Series, offset: int) -> pd.Series:
+    if offset == 0:
+        return series
+    numeric: pd.Series = pd.to_numeric(series, errors="coerce")
+    shifted: pd.Series = (numeric + offset).where(numeric >= 0, numeric)
+    if series.dtype == object:
+        return shifted.map(lambda value: None if pd.isna(value) else str(int(value)))
+    return shifted.astype(series.dtype)
+
+
+def build_scaled_index(
+    source_artifacts: str, artifacts: str, scale: int, dim: int, seed: int = 0
+) -> dict[str, int]:
+    """
+    Writes an index made of `scale` renamed copies of the source index, with random entity embeddings.
+
+    Returns:
+        dict[str, int]: Row counts of the written tables.
+    """
+    os.makedirs(artifacts, exist_ok=True)
+    source: dict[str, pd.DataFrame] = {
+        name: pd.read_parquet(os.path.join(source_artifacts, f"{TABLES[name]}.parquet"))
+        for name in ("entity_df", "relationship_df", "text_unit_df", "report_df")
+    }
+    communities: pd.Series = pd.to_numeric(
+        source["entity_df"]["community"], errors="coerce"
+    )
+    community_offset: int = int(np.nan_to_num(communities.max())) + 1
+
+    copies: dict[str, list[pd.DataFrame]] = defaultdict(list)
+    for copy in range(scale):
+        offset: int = copy * community_offset
+
+        nodes: pd.DataFrame = source["entity_df"].copy()
+        for column in ("title", "id", "top_level_node_id"):
+            nodes[column] = nodes[column].map(lambda v: _suffix(v, copy))
+        nodes["source_id"] = nodes["source_id"].map(
+            lambda v: ",".join(_suffix_list(v.split(","), copy)) if v else v
+        )
+        nodes["community"] = _offset_community(nodes["community"], offset)
+        nodes["human_readable_id"] += copy * len(nodes)
+        copies["entity_df"].append(nodes)
+
+        reports: pd.DataFrame = source["report_df"].copy()
+        reports["id"] = reports["id"].map(lambda v: _suffix(v, copy))
+        reports["title"] = reports["title"].map(lambda v: _suffix(v, copy))
+        reports["community"] = _offset_community(reports["community"], offset)
+        copies["report_df"].append(reports)
+
+        relationships: pd.DataFrame = source["relationship_df"].copy()
+        for column in ("source", "target", "id"):
+            relationships[column] = relationships[column].map(lambda v: _suffix(v, copy))
+        relationships["text_unit_ids"] = relationships["text_unit_ids"].map(
+            lambda v: _suffix_list(v, copy)
+        )
+        relationships["human_readable_id"] = [
+            str(copy * len(relationships) + i) for i in range(len(relationships))
+        ]
+        copies["relationship_df"].append(relationships)
+
+        text_units: pd.DataFrame = source["text_unit_df"].copy()
+        text_units["id"] = text_units["id"].map(lambda v: _suffix(v, copy))
+        for column in ("entity_ids", "relationship_ids"):
+            text_units[column] = text_units[column].map(lambda v: _suffix_list(v, copy))
+        copies["text_unit_df"].append(text_units)
+
+    tables: dict[str, pd.DataFrame] = {
+        name: pd.concat(frames, ignore_index=True) for name, frames in copies.items()
+    }
+
+    # *one entity per node title, as create_final_entities, with random unit embeddings
+    nodes = tables["entity_df"].drop_duplicates(subset=["title"])
+    rng: np.random.Generator = np.random.default_rng(seed)
+    vectors: np.ndarray = rng.standard_normal((len(nodes), dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    tables["entity_embedding_df"] = pd.DataFrame(
+        {
+            "id": nodes["id"].to_numpy(),
+            "name": nodes["title"].to_numpy(),
+            "type": nodes["type"].to_numpy(),
+            "description": nodes["description"].to_numpy(),
+            "human_readable_id": np.arange(len(nodes)),
+            "text_unit_ids": [
+                v.split(",") if v else [] for v in nodes["source_id"]
+            ],
+            "description_embedding": list(vectors),
+        }
+    )
+
+    for name, frame in tables.items():
+        frame.to_parquet(os.path.join(artifacts, f"{TABLES[name]}.parquet"), index=False)
+    return {name: len(frame) for name, frame in tables.items()}
+
+
+async def bench_global(
+    state: StateModel, folder: str, timer: StageTimer, query: str, level: str
+) -> None:
+    """Times the stages of one global search."""
+    state.index_registry.context_cache.invalidate()
+    with timer.measure("global.get_context_builder"):
+        get_context_builder(state, "global", level, folder)
+    search_engine: BaseSearch = create_search_engine(
+        state, "global", level, "Multiple Paragraphs", folder
+    )
+
+    with timer.measure("global.build_context"):
+        context_chunks, context_records = search_engine.context_builder.build_context(
+            **search_engine.context_builder_params
+        )
+
+    # !the map cache would turn the map stage into disk reads
+    state.map_response_cache.clear()
+    with timer.measure("global.map"):
+        map_responses: list[SearchResult] = await asyncio.gather(
+            *[
+                search_engine._map_response_single_batch(
+                    context_data=data, query=query, **search_engine.map_llm_params
+                )
+                for data in context_chunks
+            ]
+        )
+    with timer.measure("global.reduce"):
+        reduce_response: SearchResult = await search_engine._reduce_response(
+            map_responses=map_responses,
+            query=query,
+            **search_engine.reduce_llm_params,
+        )
+    with timer.measure("global.render_html"):
+        render_first_pages(
+            render_global_reports(
+                context_records.get("reports", pd.DataFrame()),
+                reduce_response.response,
+            )
+        )
+
+
+async def bench_local(
+    state: StateModel, folder: str, timer: StageTimer, query: str, level: str
+) -> None:
+    """Times the stages of one local search."""
+    state.index_registry.context_cache.invalidate()
+    with timer.measure("local.get_context_builder"):
+        get_context_builder(state, "local", level, folder)
+    search_engine: BaseSearch = create_search_engine(
+        state, "local", level, "Multiple Paragraphs", folder
+    )
+
+    # *the raw embedder, the query embedding cache would hide the API call
+    text_embedder: Any = search_engine.context_builder.text_embedder
+    with timer.measure("local.embedding"):
+        getattr(text_embedder, "embedder", text_embedder).embed(query)
+
+    state.query_embedding_cache.clear()
+    with timer.measure("local.build_context"):
+        context_text, context_records = search_engine.context_builder.build_context(
+            query=query, **search_engine.context_builder_params
+        )
+
+    with timer.measure("local.completion"):
+        await search_engine.llm.agenerate(
+            messages=[
+                {
+                    "role": "system",
+                    "content": search_engine.system_prompt.format(
+                        context_data=context_text,
+                        response_type=search_engine.response_type,
+                    ),
+                },
+                {"role": "user", "content": query},
+            ],
+            streaming=False,
+            **search_engine.llm_params,
+        )
+
+    with timer.measure("local.render_html"):
+        render_first_pages(render_local_html(context_records))
+    relationships: pd.DataFrame = context_records.get("relationships", pd.DataFrame())
+    if not relationships.empty:
+        # *the folder layout is computed once (like at the first local query), the plot only slices it
+        layout: GraphLayout = state.snapshot("local").graph_layout
+        with timer.measure("local.visualize_relationships"):
+            visualize_relationships(relationships, layout)
+
+
+def render_first_pages(tables: dict[str, ContextTable]) -> list[str]:
+    """The first page of every panel, as rendered when all information panels are open."""
+    return [table.render_page(0)[0] for table in tables.values()]
+
+
+def make_state(root_dir: str, api_base: str) -> StateModel:
+    """A session state whose LLM and embedding settings point to the stub server."""
+    state: StateModel = StateModel()
+    state.root_dir = root_dir
+    state.param = create_graphrag_config(
+        values={
+            "llm": {
+                "type": "azure_openai_chat",
+                "api_key": "mock",
+                "api_base": api_base,
+                "api_version": "2024-02-15-preview",
+                "deployment_name": "mock-chat",
+                "model": "gpt-4o",
+            },
+            "embeddings": {
+                "llm": {
+                    "type": "azure_openai_embedding",
+                    "api_key": "mock",
+                    "api_base": api_base,
+                    "api_version": "2024-02-15-preview",
+                    "deployment_name": "mock-embedding",
+                    "model": "text-embedding-3-small",
+                }
+            },
+        },
+        root_dir=root_dir,
+    )
+    return state
+
+
+async def bench_index(
+    state: StateModel,
+    folder: str,
+    artifacts: str,
+    iterations: int,
+    level: str,
+) -> dict[str, dict[str, float]]:
+    """Runs the global and local stages `iterations` times (after one warm-up run) on an index."""
+    timer: StageTimer = StageTimer()
+    state.timestamp = folder
+    signature: tuple = get_artifacts_signature(artifacts)
+    for iteration in range(iterations + 1):
+        # !the first run loads the index and builds the embedding index, it is not recorded
+        timer.recording = iteration > 0
+        query: str = QUERIES[iteration % len(QUERIES)]
+        for query_type in ("global", "local"):
+            with timer.measure(f"{query_type}.read_df"):
+                read_df(artifacts, query_type)
+            with timer.measure(f"{query_type}.read_compiled"):
+                read_df(
+                    artifacts,
+                    query_type,
+                    dict(open_compiled_index(artifacts, signature).tables),
+                )
+        await bench_global(state, folder, timer, query, level)
+        await bench_local(state, folder, timer, query, level)
+    return timer.summary()
+
+
+def print_report(results: dict, previous: dict | None) -> None:
+    """Prints the stage timings per index, with the change against a previous run if given."""
+    for index_name, index in results["indexes"].items():
+        rows: list[list] = []
+        for stage, timing in sorted(index["stages"].items()):
+            row: list = [stage, timing["p50_ms"], timing["p95_ms"], timing["n"]]
+            if previous is not None:
+                before: dict | None = (
+                    previous.get("indexes", {}).get(index_name, {}).get("stages", {}).get(stage)
+                )
+                row.append(
+                    f"{timing['p50_ms'] / before['p50_ms']:.2f}x"
+                    if before and before["p50_ms"]
+                    else "-"
+                )
+            rows.append(row)
+        headers: list[str] = ["stage", "p50 ms", "p95 ms", "n"]
+        if previous is not None:
+            headers.append(f"p50 vs {previous.get('revision') or 'previous'}")
+        print(f"\n{index_name} {index['sizes']}")
+        print(tabulate(rows, headers=headers, floatfmt=".2f"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--artifacts-folder", default=SAMPLE_ARTIFACTS, help="source graphrag artifacts folder")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4], help="copies of the source index")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--community-level", default="2")
+    parser.add_argument("--dim", type=int, default=1536, help="entity embedding dimensions")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="stub LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="stub LLM time per token")
+    parser.add_argument("--tokens", type=int, default=200, help="stub LLM tokens per completion")
+    parser.add_argument("--embedding-ms", type=float, default=50.0, help="stub embedding latency")
+    parser.add_argument("--output", default="search_stages.json", help="JSON results file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary index root")
+    args = parser.parse_args()
+    setup_logging("WARNING")
+
+    previous: dict | None = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fi:
+            previous = json.load(fi)
+
+    root_dir: str = tempfile.mkdtemp(prefix="graphrag-bench-")
+    config: MockOpenAIConfig = MockOpenAIConfig(
+        latency_ms=args.latency_ms,
+        token_ms=args.token_ms,
+        tokens=args.tokens,
+        embedding_ms=args.embedding_ms,
+        embedding_dim=args.dim,
+    )
+    results: dict[str, Any] = {
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "indexes": {},
+    }
+    loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+    try:
+        with MockOpenAIServer(config) as server:
+            state: StateModel = make_state(root_dir, server.url)
+            for scale in args.scales:
+                folder: str = f"scale-{scale}"
+                artifacts: str = os.path.join(root_dir, "output", folder, "artifacts")
+                sizes: dict[str, int] = build_scaled_index(
+                    args.artifacts_folder, artifacts, scale, args.dim
+                )
+                compile_index(artifacts)
+                print(f"benchmarking {folder}: {sizes}")
+                results["indexes"][folder] = {
+                    "sizes": sizes,
+                    # !one event loop for every run: pooled async clients belong to the loop that used them
+                    "stages": loop.run_until_complete(
+                        bench_index(
+                            state, folder, artifacts, args.iterations, args.community_level
+                        )
+                    ),
+                }
+            results["stub_requests"] = server.requests
+    finally:
+        loop.close()
+        if args.keep:
+            print(f"index root kept in {root_dir}")
+        else:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as fo:
+        json.dump(results, fo, indent=2)
+    print_report(results, previous)
+    print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
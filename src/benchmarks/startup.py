@@ -0,0 +1,176 @@
+﻿"""
+Measures the cold start of the app: import time per package and time until the server listens.
+
+Usage:
+    python -m src.benchmarks.startup --runs 3 --output startup.json
+    python -m src.benchmarks.startup --imports-only --top 30
+
+Every run is a fresh interpreter. The import breakdown comes from `python -X importtime -c "import app"`:
+for every top-level package, the cumulative time of its imports that were not made by the package itself
+(so packages imported by other packages are also counted in those, the times overlap). The startup
+phases (imports, state, initialize_data, create_interface, launch) are the `StartupTimer` of `app.main`,
+run on a free port and closed once the server listens.
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any
+
+from tabulate import tabulate
+
+from src.benchmarks.revision import git_revision
+from src.utils.logging_manager import setup_logging
+
+# *runs app.main in the child process and writes its phases to the file given as argv[1]
+STARTUP_SCRIPT: str = """
+import json, sys
+import app
+timer = app.main(server_port=int(sys.argv[2]), block=False)
+with open(sys.argv[1], "w", encoding="utf-8") as fo:
+    json.dump(timer.to_dict(), fo)
+"""
+
+
+def child_env() -> dict[str, str]:
+    """Environment of the measured processes: the current one, without Gradio's analytics calls."""
+    env: dict[str, str] = dict(os.environ)
+    env.setdefault("GRADIO_ANALYTICS_ENABLED", "False")
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (os.getcwd(), env.get("PYTHONPATH")) if path
+    )
+    return env
+
+
+def measure_imports(module: str = "app") -> tuple[float, dict[str, float]]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str, optional): Module to import. Defaults to "app".
+
+    Returns:
+        tuple[float, dict[str, float]]: Total import time of the module, and the time per
+                                        top-level package (ms).
+    """
+    completed: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=child_env(),
+        check=True,
+    )
+    return parse_importtime(completed.stderr, module)
+
+
+def parse_importtime(output: str, module: str) -> tuple[float, dict[str, float]]:
+    """Sums the `-X importtime` lines per top-level package (see the module docstring)."""
+    entries: list[tuple[int, str, float]] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth: int = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    total: float = 0.0
+    packages: dict[str, float] = defaultdict(float)
+    # *a module is printed after the modules it imports, so parents come first in reverse
+    parents: list[tuple[int, str]] = []
+    for depth, name, cumulative in reversed(entries):
+        while parents and parents[-1][0] >= depth:
+            parents.pop()
+        package: str = name.split(".")[0]
+        if name == module:
+            total = cumulative
+        elif not parents or parents[-1][1] != package:
+            packages[package] += cumulative
+        parents.append((depth, package))
+    return total, dict(packages)
+
+
+def measure_startup() -> dict[str, float]:
+    """Runs `app.main` in a fresh interpreter and returns its startup phases (ms)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path: str = os.path.join(tmp_dir, "startup.json")
+        completed: subprocess.CompletedProcess = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, output_path, str(port)],
+            capture_output=True,
+            text=True,
+            env=child_env(),
+        )
+        if completed.returncode != 0:
+            raise SystemExit(f"app startup failed:\n{completed.stderr[-4000:]}")
+        with open(output_path, encoding="utf-8") as fi:
+            return json.load(fi)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=20, help="packages shown in the import breakdown")
+    parser.add_argument("--imports-only", action="store_true", help="skip starting the server")
+    parser.add_argument("--output", default="startup.json", help="JSON results file")
+    args = parser.parse_args()
+    setup_logging("WARNING")
+
+    import_runs: list[tuple[float, dict[str, float]]] = [
+        measure_imports() for _ in range(args.runs)
+    ]
+    packages: dict[str, float] = {
+        package: statistics.median(run[1].get(package, 0.0) for run in import_runs)
+        for package in set().union(*(run[1] for run in import_runs))
+    }
+    results: dict[str, Any] = {
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "import_ms": round(statistics.median(run[0] for run in import_runs), 1),
+        "packages_ms": {
+            package: round(ms, 1)
+            for package, ms in sorted(packages.items(), key=lambda item: -item[1])
+        },
+    }
+    print(
+        tabulate(
+            list(results["packages_ms"].items())[: args.top],
+            headers=["package", "import ms (median)"],
+            floatfmt=".1f",
+        )
+    )
+    print(f"\nimport app: {results['import_ms']:.1f} ms")
+
+    if not args.imports_only:
+        startup_runs: list[dict[str, float]] = [measure_startup() for _ in range(args.runs)]
+        results["startup_ms"] = {
+            phase: round(statistics.median(run[phase] for run in startup_runs), 1)
+            for phase in startup_runs[0]
+        }
+        print()
+        print(
+            tabulate(
+                list(results["startup_ms"].items()),
+                headers=["phase", "ms (median)"],
+                floatfmt=".1f",
+            )
+        )
+
+    with open(args.output, "w", encoding="utf-8") as fo:
+        json.dump(results, fo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+﻿"""
+Compares the entity embedding backends (LanceDB vs the in-process NumPy matrix).
+
+Usage:
+    python -m src.benchmarks.vector_store --artifacts-folder graphdata/output/<folder>/artifacts
+    python -m src.benchmarks.vector_store --synthetic 200000 --dim 1536
+
+Query vectors are perturbed entity embeddings, so no embedding API is needed. The report shows
+build/open time, per-query latency (p50/p95) and the overlap of the NumPy top-k with LanceDB's.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from src.utils.df_manager import read_df
+from src.utils.embedding_index import COLLECTION_NAME, to_entity_documents
+from src.utils.logging_manager import setup_logging
+from src.utils.numpy_vector_store import NumpyVectorStore
+
+
+def load_entities(artifacts_folder: str) -> pd.DataFrame:
+    """Reads the `create_final_entities` columns the embedding index is built from."""
+    tables = read_df(artifacts_folder, "local")
+    if "entity_embedding_df" not in tables:
+        raise SystemExit(f"No create_final_entities parquet in {artifacts_folder}")
+    return tables["entity_embedding_df"].frame
+
+
+def synthetic_entities(count: int, dim: int, seed: int = 0) -> pd.DataFrame:
+    """Random unit-length embeddings shaped like `create_final_entities`."""
+    rng: np.random.Generator = np.random.default_rng(seed)
+    vectors: np.ndarray = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return pd.DataFrame(
+        {
+            "id": [f"e{i}" for i in range(count)],
+            "name": [f"ENTITY {i}" for i in range(count)],
+            "description": [""] * count,
+            "description_embedding": list(vectors),
+        }
+    )
+
+
+def make_queries(documents: list, count: int, seed: int = 0) -> np.ndarray:
+    """Entity embeddings with gaussian noise, as stand-ins for query embeddings."""
+    rng: np.random.Generator = np.random.default_rng(seed)
+    picks: np.ndarray = rng.choice(len(documents), size=count, replace=True)
+    queries: np.ndarray = np.asarray(
+        [documents[i].vector for i in picks], dtype=np.float32
+    )
+    queries += rng.normal(0, 0.02, queries.shape).astype(np.float32)
+    return queries
+
+
+def time_queries(search, queries: np.ndarray) -> tuple[list[list[str]], np.ndarray]:
+    """Runs `search` per query, returning the result ids and latencies in ms."""
+    results: list[list[str]] = []
+    latencies: list[float] = []
+    for query in queries:
+        start: float = time.perf_counter()
+        found = search(query.tolist())
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([result.document.id for result in found])
+    return results, np.asarray(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--artifacts-folder", help="graphrag artifacts folder")
+    parser.add_argument("--synthetic", type=int, help="use N random entities instead")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="top_k_mapped_entities * oversample")
+    parser.add_argument("--no-lancedb", action="store_true", help="only benchmark NumPy")
+    args = parser.parse_args()
+
+    setup_logging("WARNING")
+    if args.synthetic:
+        entity_embedding_df = synthetic_entities(args.synthetic, args.dim)
+    elif args.artifacts_folder:
+        entity_embedding_df = load_entities(args.artifacts_folder)
+    else:
+        parser.error("--artifacts-folder or --synthetic is required")
+
+    documents = to_entity_documents(entity_embedding_df)
+    queries: np.ndarray = make_queries(documents, args.queries)
+    rows: list[list] = []
+    baseline: list[list[str]] | None = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.no_lancedb:
+            from graphrag.vector_stores.lancedb import LanceDBVectorStore
+
+            lancedb_store = LanceDBVectorStore(collection_name=COLLECTION_NAME)
+            lancedb_store.connect(db_uri=f"{tmp}/lancedb")
+            start: float = time.perf_counter()
+            lancedb_store.load_documents(documents, overwrite=True)
+            build: float = time.perf_counter() - start
+            baseline, latencies = time_queries(
+                lambda q: lancedb_store.similarity_search_by_vector(q, args.k),
+                queries,
+            )
+            rows.append(["lancedb", build, *np.percentile(latencies, [50, 95]), 1.0])
+
+        for mmap in (False, True):
+            numpy_store = NumpyVectorStore(collection_name=COLLECTION_NAME, mmap=mmap)
+            numpy_store.connect(db_uri=f"{tmp}/numpy_index_{int(mmap)}")
+            start = time.perf_counter()
+            numpy_store.load_documents(documents, overwrite=True)
+            build = time.perf_counter() - start
+            results, latencies = time_queries(
+                lambda q: numpy_store.similarity_search_by_vector(q, args.k),
+                queries,
+            )
+            overlap: float = (
+                np.mean(
+                    [len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(results, baseline)]
+                )
+                if baseline is not None
+                else float("nan")
+            )
+            rows.append(
+                [f"numpy (mmap={mmap})", build, *np.percentile(latencies, [50, 95]), overlap]
+            )
+
+        start = time.perf_counter()
+        numpy_store.similarity_search_by_vectors(queries.tolist(), args.k)
+        batched: float = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append(["numpy batched (per query)", float("nan"), batched, batched, float("nan")])
+
+    print(
+        f"{len(documents)} entities x {len(documents[0].vector) if documents else 0} dims, "
+        f"{len(queries)} queries, k={args.k}"
+    )
+    print(
+        tabulate(
+            rows,
+            headers=["backend", "build s", "p50 ms", "p95 ms", "top-k overlap"],
+            floatfmt=".3f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
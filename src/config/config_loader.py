@@ -1,21 +1,24 @@
-﻿import logging
+﻿import json
+import logging
 import os
+from concurrent.futures import Future
 from datetime import datetime
+from pathlib import Path
 
-from graphrag.index.progress import PrintProgressReporter
-from graphrag.prompt_tune.loader.config import read_config_parameters
-from graphrag.vector_stores.lancedb import LanceDBVectorStore
+import yaml
+from graphrag.config import create_graphrag_config
+from graphrag.config.models import GraphRagConfig
 
 from src.state.state_model import StateModel
-from src.utils.df_manager import read_df
+from src.utils.env_manager import get_env_int
 
 
 def initialize_data(state: StateModel) -> None:
     """
     Initializes the data within the provided `StateModel` instance.
 
-    This function retrieves the latest output folder from the `StateModel`, reads data from the folder,
-    sets up a connection to a LanceDB vector store, and loads configuration parameters from a settings file.
+    This function loads configuration parameters from a settings file, retrieves the latest output folder
+    from the `StateModel` and loads it into the index registry.
     If any error occurs during the initialization process, it is logged.
 
     Args:
@@ -25,43 +28,135 @@ def initialize_data(state: StateModel) -> None:
         Exception: Any exceptions that occur during initialization are logged as errors.
 
     Process:
-        1. Finds the latest output folder and updates the `state.timestamp`.
-        2. Reads relevant DataFrames from the `artifacts` folder and updates the `StateModel`.
-        3. Initializes the `LanceDBVectorStore` for storing graphrag entity description embeddings.
-        4. Loads configuration parameters from the root directory's `settings.yaml`.
+        1. Loads configuration parameters from the root directory's `settings.yaml`.
+        2. Starts listing the index folders of the configured Blob Storage container in the background
+           (see `attach_configured_storage`), so the start-up does not wait for the network.
+        3. Selects the latest output folder (`select_latest_folder`), which updates `state.timestamp` and
+           starts loading the DataFrame columns global search needs from the `artifacts` folder into
+           `state.index_registry` and building the token encoder in the background, so the server
+           listens without waiting for them (the first query waits for the prefetch if it is still running;
+           the entity description embedding index is opened on the first local query).
+        4. Selects the latest folder again once the remote folders are listed, in case one is newer.
     """
     try:
-        # *Annotate as tuple
-        output: tuple[str, str] = find_latest_output_folder(
-            state
-        )  # Annotate as tuple
-        latest_output_folder, timestamp = output
-
-        state.timestamp = timestamp
-        artifacts_folder: str = os.path.join(latest_output_folder, "artifacts")
-        read_df(artifacts_folder, state)
-
-        LANCEDB_URI: str = f"{artifacts_folder}/lancedb"
-        state.description_embedding_store = LanceDBVectorStore(
-            collection_name="entity_description_embeddings",
-        )
-        state.description_embedding_store.connect(db_uri=LANCEDB_URI)
-
         # Note: read from .env and settings.yaml at same root dir.
-        state.param = read_config_parameters(
-            root=state.root_dir, reporter=PrintProgressReporter("")
-        )
+        state.param = read_settings(state.root_dir)
+        listing: Future | None = attach_configured_storage(state)
+        if listing is not None:
+            listing.add_done_callback(lambda future: on_remote_listed(state, future))
+
+        select_latest_folder(state)
 
     except Exception as e:
         logging.error(f"Error initializing data: {str(e)}")
 
 
+def select_latest_folder(state: StateModel) -> None:
+    """
+    Makes the latest output folder (see `find_latest_output_folder`) the selected one of new sessions.
+
+    Args:
+        state (StateModel): The initial application state.
+    """
+    # *Annotate as tuple
+    output: tuple[str, str] = find_latest_output_folder(state)  # Annotate as tuple
+    latest_output_folder, timestamp = output
+    if timestamp == state.timestamp:
+        return
+
+    state.timestamp = timestamp
+    # *the UI starts with global search, local-only columns are read on the first local query
+    state.index_registry.prefetch(
+        timestamp, "global", warmup=lambda _: state.token_encoder
+    )
+
+
+def on_remote_listed(state: StateModel, listing: Future) -> None:
+    """Logs the remote index folders once listed and selects the latest folder again (runs on the prefetch worker)."""
+    container_name: str = state.param.storage.container_name
+    error: BaseException | None = listing.exception()
+    if error is not None:
+        logging.warning(
+            f"Could not list the index folders of {container_name}, keeping the local folders only: {str(error)}"
+        )
+        return
+    logging.info(f"Index folders fetched on demand from {container_name}: {listing.result()}")
+    try:
+        select_latest_folder(state)
+    except Exception as e:
+        logging.error(f"Error selecting the latest output folder: {str(e)}")
+
+
+# *settings files graphrag looks for in the root directory, in order
+SETTINGS_FILES: tuple[str, ...] = ("settings.yaml", "settings.yml", "settings.json")
+
+
+def read_settings(root_dir: str) -> GraphRagConfig:
+    """
+    Reads the GraphRag configuration of a root directory, as graphrag's `read_config_parameters` does.
+
+    That helper lives in `graphrag.prompt_tune`, whose import pulls in the whole indexing pipeline
+    (UMAP, numba, graspologic...) and dominates the start-up time; parsing the settings only needs
+    `graphrag.config`. Without a settings file, the configuration comes from environment variables.
+
+    Args:
+        root_dir (str): Root directory holding `settings.yaml` and `.env`.
+
+    Returns:
+        GraphRagConfig: The parsed configuration.
+    """
+    for file_name in SETTINGS_FILES:
+        path: Path = Path(root_dir) / file_name
+        if path.exists():
+            logging.info(f"Reading settings from {path}")
+            text: str = path.read_bytes().decode(encoding="utf-8", errors="strict")
+            data: dict = (
+                json.loads(text) if path.suffix == ".json" else yaml.safe_load(text)
+            )
+            return create_graphrag_config(data, root_dir)
+    logging.info("Reading settings from environment variables")
+    return create_graphrag_config(root_dir=root_dir)
+
+
+def attach_configured_storage(state: StateModel) -> Future | None:
+    """
+    Starts listing the index folders of the storage configured in `settings.yaml`, fetched on their first query.
+
+    Only done in on-demand mode (env: GRAPHRAG_BLOB_ON_DEMAND, default 1) when both the connection
+    string and the container name are set. The listing runs on the index registry's prefetch workers;
+    if it fails, only the local folders are listed.
+
+    Returns:
+        Future | None: Resolves to the remote folders, most recent first (None if no storage is attached).
+    """
+    storage = state.param.storage
+    if not (
+        get_env_int("GRAPHRAG_BLOB_ON_DEMAND", 1) > 0
+        and storage.connection_string
+        and storage.container_name
+    ):
+        return None
+    try:
+        # *the Azure SDK is only imported when a storage is configured
+        from src.utils.blob_storage import get_container_client
+        from src.utils.remote_index import attach_remote_index
+
+        return attach_remote_index(
+            state,
+            get_container_client(storage.connection_string, storage.container_name),
+        )
+    except Exception as e:
+        logging.warning(f"Could not list the index folders of the storage: {str(e)}")
+        return None
+
+
 def find_latest_output_folder(state: StateModel) -> tuple[str, str]:
     """Finds the latest output folder from the 'output' directory in the given StateModel instance.
 
-    This function searches for the latest folder based on the creation time from the 'output'
-    directory inside the `state.root_dir`. It assumes that the folder names follow a timestamp format
-    (`"%Y%m%d-%H%M%S"`) and returns the path of the latest valid folder.
+    This function searches for the latest folder among the folders of the 'output' directory inside
+    the `state.root_dir` and the folders of the remote index (fetched on their first query, so they
+    may not exist locally yet). It assumes that the folder names follow a timestamp format
+    (`"%Y%m%d-%H%M%S"`) and returns the path of the latest valid folder by name.
 
     Args:
         state (StateModel): The StateModel instance managing the root directory and other related data.
@@ -69,7 +164,7 @@ def find_latest_output_folder(state: StateModel) -> tuple[str, str]:
     Raises:
         ValueError: If no output folders are found in the directory.
         ValueError: If no folders with valid timestamp names are found.
-        ValueError: If the 'artifacts' subfolder is missing from the latest valid output folder.
+        ValueError: If the 'artifacts' subfolder is missing from the latest valid local output folder.
 
     Returns:
         Tuple[str, str]:
@@ -77,22 +172,19 @@ def find_latest_output_folder(state: StateModel) -> tuple[str, str]:
             - The path of the latest output folder (str).
             - The name of the latest output folder (str).
     """
-    # !graphrag Index output folder list
+    output_dir: str = os.path.join(state.root_dir, "output")
+    # !graphrag Index output folder list, with the folders of the remote index
+    remote_folders: list[str] = state.index_registry.remote_folders()
     folders: list = [
         f
-        for f in os.listdir(os.path.join(state.root_dir, "output"))
-        if os.path.isdir(os.path.join(state.root_dir, "output", f))
+        for f in (os.listdir(output_dir) if os.path.isdir(output_dir) else [])
+        if os.path.isdir(os.path.join(output_dir, f))
     ]
+    folders = list(set(folders + remote_folders))
     if not folders:
         raise ValueError("No output folders found")
-    # Sort folders by creation time, most recent first
-    sorted_folders: list = sorted(
-        folders,
-        key=lambda x: os.path.getctime(
-            os.path.join(state.root_dir, "output", x)
-        ),
-        reverse=True,
-    )
+    # Sort folders by their timestamp name, most recent first (remote folders have no local creation time)
+    sorted_folders: list = sorted(folders, reverse=True)
     latest_folder: str | None = None
     for folder in sorted_folders:
         try:
@@ -104,8 +196,8 @@ def find_latest_output_folder(state: StateModel) -> tuple[str, str]:
             continue
     if latest_folder is None:
         raise ValueError("No valid timestamp folders found")
-    latest_path = os.path.join(state.root_dir, "output", latest_folder)
+    latest_path = os.path.join(output_dir, latest_folder)
     artifacts_path = os.path.join(latest_path, "artifacts")
-    if not os.path.exists(artifacts_path):
+    if latest_folder not in remote_folders and not os.path.exists(artifacts_path):
         raise ValueError(f"Artifacts folder not found in {latest_path}")
     return latest_path, latest_folder
@@ -0,0 +1,267 @@
+﻿import logging
+import os
+import time
+from typing import Any
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.utils.env_manager import get_env_int
+from src.utils.sidecar import read_sidecar, stat_file, write_sidecar
+
+# !bump this when the layout computation changes to force a recompute
+GRAPH_LAYOUT_VERSION: int = 2
+GRAPH_LAYOUT_DIR: str = "graph_layout"
+# *fixed seed, so a recomputed layout (and the placement of unknown nodes) is reproducible
+LAYOUT_SEED: int = 42
+
+
+class GraphLayout:
+    """
+    2-D positions of every entity of an index folder, computed once and sliced per query.
+
+    Local search plots only the relationships of its context, so instead of running a spring
+    layout per query, each query's subgraph takes the positions of its nodes from this map.
+    A node stays at the same place in every plot of the folder.
+
+    Attributes:
+        titles (pd.Index): Entity titles.
+        xy (np.ndarray): Positions, one (x, y) row per title.
+        communities (np.ndarray): Coarsest community of each entity ("" if unknown), used to
+                                    collapse entities in level-of-detail plots.
+    """
+
+    def __init__(
+        self,
+        titles: pd.Index,
+        xy: np.ndarray,
+        communities: np.ndarray | None = None,
+    ):
+        self.titles: pd.Index = titles
+        self.xy: np.ndarray = xy
+        self.communities: np.ndarray = (
+            communities
+            if communities is not None
+            else np.full(len(titles), "", dtype=object)
+        )
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def coordinates(
+        self, nodes: pd.Index, sources: np.ndarray, targets: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the positions and communities of a subgraph's nodes.
+
+        Nodes missing from the folder layout (e.g. relationships with entities that have no
+        node row) are placed by a spring layout around the fixed known nodes.
+
+        Args:
+            nodes (pd.Index): Node titles of the subgraph.
+            sources (np.ndarray): Source node index (into `nodes`) of every edge.
+            targets (np.ndarray): Target node index (into `nodes`) of every edge.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (x, y) per node, and community per node ("" if unknown).
+        """
+        rows: np.ndarray = self.titles.get_indexer(nodes)
+        known: np.ndarray = rows >= 0
+        xy: np.ndarray = np.zeros((len(nodes), 2))
+        xy[known] = self.xy[rows[known]]
+        communities: np.ndarray = np.full(len(nodes), "", dtype=object)
+        communities[known] = self.communities[rows[known]]
+        if known.all():
+            return xy, communities
+
+        G: nx.Graph = nx.Graph()
+        G.add_nodes_from(range(len(nodes)))
+        G.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        fixed: list[int] = np.flatnonzero(known).tolist()
+        pos: dict[int, np.ndarray] = (
+            nx.spring_layout(
+                G,
+                dim=2,
+                pos={i: xy[i] for i in fixed},
+                fixed=fixed,
+                seed=LAYOUT_SEED,
+            )
+            if fixed
+            else nx.spring_layout(G, dim=2, seed=LAYOUT_SEED)
+        )
+        for i in np.flatnonzero(~known).tolist():
+            xy[i] = pos[i]
+        return xy, communities
+
+
+def load_graph_layout(
+    relationships_path: str,
+    relationship_df: pd.DataFrame,
+    nodes_path: str | None = None,
+) -> GraphLayout:
+    """
+    Returns the layout of an index folder, from its sidecar or computed (and stored) if missing or stale.
+
+    Positions come from the `x`/`y` columns of `create_final_nodes` when graphrag computed them
+    (UMAP enabled), otherwise from one seeded spring layout of the whole relationship graph.
+    The top-level community of every entity is stored along, for level-of-detail plots.
+    They are stored in `<artifacts_folder>/graph_layout/<relationships artifact>.layout.parquet`,
+    stamped with the file stats of both artifacts (env: GRAPHRAG_GRAPH_LAYOUT_ITERATIONS sets the
+    spring layout iterations, default 50).
+
+    Args:
+        relationships_path (str): Path of the `create_final_relationships` artifact.
+        relationship_df (pd.DataFrame): Its DataFrame, with at least `source` and `target`.
+        nodes_path (str | None, optional): Path of the `create_final_nodes` artifact. Defaults to None.
+
+    Returns:
+        GraphLayout: Position per entity title.
+    """
+    artifact: str = os.path.splitext(os.path.basename(relationships_path))[0]
+    sidecar_path: str = os.path.join(
+        os.path.dirname(relationships_path),
+        GRAPH_LAYOUT_DIR,
+        f"{artifact}.layout.parquet",
+    )
+    stamp: dict = {
+        "version": GRAPH_LAYOUT_VERSION,
+        "seed": LAYOUT_SEED,
+        "relationships": stat_file(relationships_path),
+        "nodes": stat_file(nodes_path) if nodes_path else None,
+    }
+    df: pd.DataFrame | None = read_sidecar(
+        sidecar_path, stamp, ["title", "x", "y", "community"]
+    )
+    if df is None:
+        start: float = time.perf_counter()
+        df = compute_graph_layout(relationship_df, nodes_path)
+        write_sidecar(sidecar_path, stamp, df)
+        logging.info(
+            f"Computed graph layout of {len(df)} nodes "
+            f"in {time.perf_counter() - start:.3f}s -> {sidecar_path}"
+        )
+    return GraphLayout(
+        pd.Index(df["title"]),
+        df[["x", "y"]].to_numpy(dtype=np.float64),
+        df["community"].to_numpy(dtype=object),
+    )
+
+
+def compute_graph_layout(
+    relationship_df: pd.DataFrame, nodes_path: str | None = None
+) -> pd.DataFrame:
+    """
+    Positions (title, x, y) and coarsest community of every entity.
+
+    Positions are graphrag's node coordinates when set, else a spring layout of the relationships.
+    """
+    nodes: pd.DataFrame = pd.DataFrame(columns=["title", "x", "y", "community"])
+    if nodes_path:
+        names: list[str] = pq.read_schema(nodes_path).names
+        columns: list[str] = [
+            column for column in ("title", "x", "y", "level", "community") if column in names
+        ]
+        if "title" in columns:
+            nodes = pd.read_parquet(nodes_path, columns=columns)
+            if "level" in nodes.columns:
+                # *the coarsest level first, so each title keeps its top-level community
+                nodes = nodes.sort_values("level", kind="stable")
+            nodes = nodes.drop_duplicates(subset=["title"])
+    communities: pd.Series = (
+        nodes.set_index("title")["community"].fillna("").astype(str)
+        if "community" in nodes.columns
+        else pd.Series(dtype=object)
+    )
+
+    # !graphrag writes all-zero coordinates when UMAP is disabled
+    if {"x", "y"} <= set(nodes.columns) and (
+        nodes["x"].nunique() > 1 or nodes["y"].nunique() > 1
+    ):
+        layout: pd.DataFrame = nodes[["title", "x", "y"]].astype(
+            {"x": "float64", "y": "float64"}
+        )
+    else:
+        G: nx.Graph = nx.Graph()
+        if not relationship_df.empty:
+            G.add_weighted_edges_from(
+                zip(
+                    relationship_df["source"],
+                    relationship_df["target"],
+                    relationship_df["weight"]
+                    if "weight" in relationship_df.columns
+                    else [1.0] * len(relationship_df),
+                )
+            )
+        pos: dict[Any, np.ndarray] = spring_positions(
+            G, iterations=get_env_int("GRAPHRAG_GRAPH_LAYOUT_ITERATIONS", 50)
+        )
+        layout = pd.DataFrame(
+            {
+                "title": list(pos),
+                "x": [float(xy[0]) for xy in pos.values()],
+                "y": [float(xy[1]) for xy in pos.values()],
+            }
+        )
+    layout["community"] = (
+        layout["title"].map(communities).fillna("").astype(str)
+        if len(communities)
+        else ""
+    )
+    return layout.reset_index(drop=True)
+
+
+def spring_positions(
+    G: nx.Graph,
+    iterations: int = 50,
+    seed: int = LAYOUT_SEED,
+    block_size: int = 512,
+) -> dict[Any, np.ndarray]:
+    """
+    Seeded Fruchterman-Reingold positions of a graph, as `nx.spring_layout` computes them.
+
+    For large graphs networkx falls back to a per-node Python loop (about 30s for 3k nodes);
+    here the all-pairs repulsion is computed in dense blocks of `block_size` nodes and the
+    attraction along the edges at once, which is an order of magnitude faster.
+    """
+    nodes: list[Any] = list(G.nodes())
+    n: int = len(nodes)
+    if n <= 500:
+        return nx.spring_layout(G, dim=2, seed=seed, iterations=iterations)
+
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodes, weight="weight").tocoo()
+    rows: np.ndarray = adjacency.row
+    cols: np.ndarray = adjacency.col
+    weights: np.ndarray = adjacency.data.astype(np.float64)
+
+    pos: np.ndarray = np.random.RandomState(seed).rand(n, 2)
+    k: float = np.sqrt(1.0 / n)
+    temperature: float = 0.1 * float(np.max(pos.max(axis=0) - pos.min(axis=0)))
+    cooling: float = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement: np.ndarray = np.zeros((n, 2))
+        # *float32 per-axis blocks: the repulsion is the O(n^2) part of every iteration
+        x: np.ndarray = pos[:, 0].astype(np.float32)
+        y: np.ndarray = pos[:, 1].astype(np.float32)
+        for start in range(0, n, block_size):
+            dx: np.ndarray = x[start : start + block_size, None] - x[None, :]
+            dy: np.ndarray = y[start : start + block_size, None] - y[None, :]
+            force: np.ndarray = dx * dx + dy * dy
+            np.maximum(force, 1e-4, out=force)
+            np.divide(k * k, force, out=force)
+            displacement[start : start + block_size, 0] += (dx * force).sum(axis=1)
+            displacement[start : start + block_size, 1] += (dy * force).sum(axis=1)
+        delta: np.ndarray = pos[rows] - pos[cols]
+        distance: np.ndarray = np.maximum(np.sqrt((delta**2).sum(axis=1)), 0.01)
+        np.add.at(displacement, rows, -delta * (weights * distance / k)[:, None])
+
+        length: np.ndarray = np.maximum(np.sqrt((displacement**2).sum(axis=1)), 0.01)
+        step: np.ndarray = displacement * (temperature / length)[:, None]
+        pos += step
+        temperature -= cooling
+        if np.linalg.norm(step) / n < 1e-4:
+            break
+
+    pos = nx.rescale_layout(pos)
+    return dict(zip(nodes, pos))
@@ -1,71 +1,371 @@
 ﻿from typing import Any
 
 import networkx as nx
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from plotly.basedatatypes import BaseFigure
 
+from src.graph.graph_layout import LAYOUT_SEED, GraphLayout
+from src.utils.env_manager import get_env_int
 
-def visualize_graph(G) -> BaseFigure:
-
-    BACKGROUND_COLOR = "#2D2A2E"
-    NODE_COLOR = "#66D9EF"
-    EDGE_COLOR = "#A6E22E"
-    TEXT_COLOR = "#F8F8F2"
-
-    pos: dict[Any, Any] = nx.spring_layout(G, dim=2)
-
-    edge_x: list = []
-    edge_y: list = []
-    edge_texts: dict[Any, Any] = nx.get_edge_attributes(G, "description")
-    to_display_edge_texts = []
-    for edge in G.edges():
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        edge_x.append(x0)
-        edge_x.append(x1)
-        edge_x.append(None)
-        edge_y.append(y0)
-        edge_y.append(y1)
-        edge_y.append(None)
-        to_display_edge_texts.append(edge_texts[edge])
-
-    edge_trace = go.Scatter(
-        x=edge_x,
-        y=edge_y,
-        text=to_display_edge_texts,
+BACKGROUND_COLOR: str = "#2D2A2E"
+NODE_COLOR: str = "#66D9EF"
+EDGE_COLOR: str = "#A6E22E"
+TEXT_COLOR: str = "#F8F8F2"
+AGGREGATE_COLOR: str = "#FD971F"
+
+# *zoomed in below this share of the overview's x range, the browser switches to the detail layer
+LOD_EXPAND_RATIO: float = 0.3
+LOD_OVERVIEW: str = "Overview"
+LOD_DETAIL: str = "Detail"
+
+
+def visualize_relationships(
+    relationships: pd.DataFrame, layout: GraphLayout | None = None
+) -> BaseFigure:
+    """
+    Plots the relationships of a search context as a WebGL graph.
+
+    The relationship rows go straight to coordinate arrays (no networkx graph per query) and are
+    drawn with `Scattergl`. Above GRAPHRAG_GRAPH_LOD_NODES nodes (default 300) the plot opens at an
+    overview level of detail: the most connected nodes stay, the others are collapsed into one
+    aggregate node per community. The full graph, capped at its GRAPHRAG_GRAPH_MAX_EDGES heaviest
+    relationships (default 2000), is a hidden detail layer that the figure's Overview/Detail
+    buttons (and zooming in the app, see `main.js`) switch to, so the payload and the browser's
+    render time stay bounded for any context size.
+
+    Args:
+        relationships (pd.DataFrame): Relationship rows with `source` and `target`, and optionally
+                                        `description` and `weight`.
+        layout (GraphLayout | None, optional): Positions of the index folder's entities.
+                                                Defaults to None (seeded spring layout of the rows).
+
+    Returns:
+        BaseFigure: The plotly figure.
+    """
+    max_nodes: int = max(1, get_env_int("GRAPHRAG_GRAPH_LOD_NODES", 300))
+    max_edges: int = max(1, get_env_int("GRAPHRAG_GRAPH_MAX_EDGES", 2000))
+
+    graph: _RelationshipArrays = _RelationshipArrays.from_relationships(
+        relationships, layout
+    )
+    if len(graph.nodes) <= max_nodes:
+        return _figure(_graph_traces(graph))
+
+    detail: _RelationshipArrays = graph.heaviest(max_edges)
+    overview: _RelationshipArrays
+    aggregates: pd.DataFrame
+    overview, aggregates = graph.collapse(max_nodes)
+
+    # *the aggregates are nodes of the overview's edges, drawn by their own trace
+    overview_traces: list[Any] = _graph_traces(
+        overview, node_count=len(overview.nodes) - len(aggregates)
+    ) + [_aggregate_trace(aggregates)]
+    detail_traces: list[Any] = _graph_traces(detail)
+    for trace in detail_traces:
+        trace.visible = False
+
+    visible_overview: list[bool] = [True] * len(overview_traces) + [False] * len(
+        detail_traces
+    )
+    visible_detail: list[bool] = [not visible for visible in visible_overview]
+    fig: BaseFigure = _figure(overview_traces + detail_traces)
+    fig.update_layout(
+        updatemenus=[
+            dict(
+                type="buttons",
+                direction="right",
+                showactive=True,
+                active=0,
+                x=0,
+                xanchor="left",
+                y=1.08,
+                yanchor="top",
+                bgcolor=BACKGROUND_COLOR,
+                font=dict(color=TEXT_COLOR),
+                buttons=[
+                    dict(
+                        label=LOD_OVERVIEW,
+                        method="restyle",
+                        args=[{"visible": visible_overview}],
+                    ),
+                    dict(
+                        label=LOD_DETAIL,
+                        method="restyle",
+                        args=[{"visible": visible_detail}],
+                    ),
+                ],
+            )
+        ],
+        # *read by main.js to switch the level of detail on zoom
+        meta=dict(
+            lod=dict(
+                buttons=[LOD_OVERVIEW, LOD_DETAIL],
+                x_range=[float(graph.xy[:, 0].min()), float(graph.xy[:, 0].max())],
+                expand_ratio=LOD_EXPAND_RATIO,
+                nodes=len(graph.nodes),
+                detail_edges=len(detail.sources),
+                total_edges=len(graph.sources),
+            )
+        ),
+    )
+    return fig
+
+
+class _RelationshipArrays:
+    """
+    A relationship graph as flat arrays: node titles and positions, and edges as node indices.
+
+    Attributes:
+        nodes (pd.Index): Node titles.
+        xy (np.ndarray): Position per node.
+        communities (np.ndarray): Community per node ("" if unknown).
+        sources (np.ndarray): Source node index per edge.
+        targets (np.ndarray): Target node index per edge.
+        descriptions (np.ndarray): Hover text per edge.
+        weights (np.ndarray): Weight per edge.
+    """
+
+    def __init__(
+        self,
+        nodes: pd.Index,
+        xy: np.ndarray,
+        communities: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        descriptions: np.ndarray,
+        weights: np.ndarray,
+    ):
+        self.nodes: pd.Index = nodes
+        self.xy: np.ndarray = xy
+        self.communities: np.ndarray = communities
+        self.sources: np.ndarray = sources
+        self.targets: np.ndarray = targets
+        self.descriptions: np.ndarray = descriptions
+        self.weights: np.ndarray = weights
+
+    @classmethod
+    def from_relationships(
+        cls, relationships: pd.DataFrame, layout: GraphLayout | None
+    ) -> "_RelationshipArrays":
+        # *undirected like the networkx graph: a repeated pair keeps its last row
+        source: pd.Series = relationships["source"].astype(str)
+        target: pd.Series = relationships["target"].astype(str)
+        pairs: pd.DataFrame = pd.DataFrame(
+            {
+                "a": np.minimum(source.to_numpy(), target.to_numpy()),
+                "b": np.maximum(source.to_numpy(), target.to_numpy()),
+            }
+        )
+        rows: np.ndarray = np.flatnonzero(
+            ~pairs.duplicated(keep="last").to_numpy()
+        )
+        source = source.iloc[rows]
+        target = target.iloc[rows]
+
+        codes: np.ndarray
+        nodes: pd.Index
+        codes, nodes = pd.factorize(pd.concat([source, target], ignore_index=True))
+        sources: np.ndarray = codes[: len(rows)]
+        targets: np.ndarray = codes[len(rows) :]
+
+        descriptions: np.ndarray = (
+            relationships["description"].iloc[rows].fillna("").astype(str).to_numpy()
+            if "description" in relationships.columns
+            else np.full(len(rows), "", dtype=object)
+        )
+        # !local search context records hold every value as a string
+        weights: np.ndarray = (
+            pd.to_numeric(relationships["weight"].iloc[rows], errors="coerce")
+            .fillna(1.0)
+            .to_numpy(dtype=np.float64)
+            if "weight" in relationships.columns
+            else np.ones(len(rows))
+        )
+
+        if layout is not None:
+            xy, communities = layout.coordinates(nodes, sources, targets)
+        else:
+            G: nx.Graph = nx.Graph()
+            G.add_nodes_from(range(len(nodes)))
+            G.add_edges_from(zip(sources.tolist(), targets.tolist()))
+            pos: dict[int, np.ndarray] = nx.spring_layout(G, dim=2, seed=LAYOUT_SEED)
+            xy = np.array([pos[i] for i in range(len(nodes))]).reshape(-1, 2)
+            communities = np.full(len(nodes), "", dtype=object)
+        return cls(nodes, xy, communities, sources, targets, descriptions, weights)
+
+    @property
+    def degrees(self) -> np.ndarray:
+        """Number of neighbours per node (a self-loop counts once)."""
+        loops: np.ndarray = self.sources == self.targets
+        return np.bincount(
+            np.concatenate([self.sources, self.targets[~loops]]),
+            minlength=len(self.nodes),
+        )
+
+    def heaviest(self, max_edges: int) -> "_RelationshipArrays":
+        """The subgraph of the `max_edges` heaviest edges (and their nodes)."""
+        if len(self.sources) <= max_edges:
+            return self
+        edges: np.ndarray = np.sort(
+            np.argsort(-self.weights, kind="stable")[:max_edges]
+        )
+        return self._subgraph(edges)
+
+    def collapse(
+        self, max_nodes: int
+    ) -> tuple["_RelationshipArrays", pd.DataFrame]:
+        """
+        The overview of the graph: its `max_nodes // 2` most connected nodes, with the other nodes
+        collapsed into one aggregate per community (placed at the centroid of its members).
+
+        Returns:
+            tuple: The overview graph (the kept nodes, then one node per aggregate, with merged
+                    edges), and the aggregates (title, x, y, members, hover text).
+        """
+        keep_count: int = max(1, max_nodes // 2)
+        order: np.ndarray = np.argsort(-self.degrees, kind="stable")
+        kept: np.ndarray = np.zeros(len(self.nodes), dtype=bool)
+        kept[order[:keep_count]] = True
+
+        communities: pd.Series = pd.Series(self.communities).where(
+            pd.Series(self.communities) != "", "other"
+        )
+        groups: pd.DataFrame = pd.DataFrame(
+            {
+                "community": communities[~kept].to_numpy(),
+                "x": self.xy[~kept, 0],
+                "y": self.xy[~kept, 1],
+                "title": self.nodes[~kept],
+            }
+        )
+        aggregates: pd.DataFrame = (
+            groups.groupby("community", sort=True)
+            .agg(
+                x=("x", "mean"),
+                y=("y", "mean"),
+                members=("title", "size"),
+                sample=("title", lambda titles: ", ".join(titles[:5])),
+            )
+            .reset_index()
+        )
+        aggregates["title"] = "community " + aggregates["community"].astype(str)
+        aggregates["text"] = (
+            aggregates["title"]
+            + ": "
+            + aggregates["members"].astype(str)
+            + " entities ("
+            + aggregates["sample"]
+            + ", ...)"
+        )
+
+        # *overview node index: kept nodes first, then one per aggregate
+        kept_index: np.ndarray = np.flatnonzero(kept)
+        representative: np.ndarray = np.empty(len(self.nodes), dtype=np.int64)
+        representative[kept_index] = np.arange(len(kept_index))
+        representative[~kept] = len(kept_index) + pd.Index(
+            aggregates["community"]
+        ).get_indexer(communities[~kept])
+
+        sources: np.ndarray = representative[self.sources]
+        targets: np.ndarray = representative[self.targets]
+        edges: pd.DataFrame = pd.DataFrame(
+            {
+                "a": np.minimum(sources, targets),
+                "b": np.maximum(sources, targets),
+                "weight": self.weights,
+                "description": self.descriptions,
+            }
+        )
+        edges = edges[edges["a"] != edges["b"]]
+        merged: pd.DataFrame = (
+            edges.groupby(["a", "b"], sort=False)
+            .agg(
+                weight=("weight", "sum"),
+                count=("weight", "size"),
+                description=("description", "last"),
+            )
+            .reset_index()
+        )
+        merged["description"] = merged["description"].where(
+            merged["count"] == 1,
+            merged["count"].astype(str) + " relationships",
+        )
+
+        overview: _RelationshipArrays = _RelationshipArrays(
+            nodes=self.nodes[kept_index].append(pd.Index(aggregates["title"])),
+            xy=np.vstack([self.xy[kept_index], aggregates[["x", "y"]].to_numpy()]),
+            communities=np.concatenate(
+                [self.communities[kept_index], aggregates["community"].to_numpy()]
+            ),
+            sources=merged["a"].to_numpy(),
+            targets=merged["b"].to_numpy(),
+            descriptions=merged["description"].to_numpy(),
+            weights=merged["weight"].to_numpy(),
+        )
+        return overview, aggregates
+
+    def _subgraph(self, edges: np.ndarray) -> "_RelationshipArrays":
+        used: np.ndarray = np.unique(
+            np.concatenate([self.sources[edges], self.targets[edges]])
+        )
+        index: np.ndarray = np.full(len(self.nodes), -1, dtype=np.int64)
+        index[used] = np.arange(len(used))
+        return _RelationshipArrays(
+            nodes=self.nodes[used],
+            xy=self.xy[used],
+            communities=self.communities[used],
+            sources=index[self.sources[edges]],
+            targets=index[self.targets[edges]],
+            descriptions=self.descriptions[edges],
+            weights=self.weights[edges],
+        )
+
+
+def _graph_traces(
+    graph: _RelationshipArrays, node_count: int | None = None
+) -> list[Any]:
+    """Edge lines, edge hover points and node markers of a graph (of its first `node_count` nodes)."""
+    count: int = len(graph.sources)
+    # *5 decimals are well below a pixel and halve the coordinates in the JSON payload
+    xy: np.ndarray = np.round(graph.xy, 5)
+    # *one segment per edge, separated by NaN gaps: x0, x1, nan, x0, x1, nan...
+    segments: np.ndarray = np.full((count, 3, 2), np.nan)
+    segments[:, 0] = xy[graph.sources]
+    segments[:, 1] = xy[graph.targets]
+    midpoints: np.ndarray = (segments[:, 0] + segments[:, 1]) / 2
+
+    edge_trace = go.Scattergl(
+        x=segments[:, :, 0].ravel(),
+        y=segments[:, :, 1].ravel(),
         line=dict(width=0.5, color=EDGE_COLOR),
-        hoverinfo="text",
+        hoverinfo="skip",
         mode="lines",
     )
-    node_x = []
-    node_y = []
-    for node in G.nodes():
-        x, y = pos[node]
-        node_x.append(x)
-        node_y.append(y)
-
-    node_adjacencies = []
-    node_text = []
-    node_size = []
-    for _, adjacencies in enumerate(G.adjacency()):
-        degree = len(adjacencies[1])
-        node_adjacencies.append(degree)
-        node_text.append(adjacencies[0])
-        node_size.append(
-            20 if degree < 5 else (35 if degree < 10 else 65)
-        )  # *Node size
-
-    node_trace = go.Scatter(
-        x=node_x,
-        y=node_y,
+    # *lines have no per-edge hover, invisible markers at the midpoints carry the descriptions
+    edge_hover_trace = go.Scattergl(
+        x=midpoints[:, 0],
+        y=midpoints[:, 1],
+        text=graph.descriptions,
+        mode="markers",
+        hoverinfo="text",
+        marker=dict(size=6, color=EDGE_COLOR, opacity=0),
+    )
+
+    shown: int = len(graph.nodes) if node_count is None else node_count
+    degrees: np.ndarray = graph.degrees[:shown]
+    node_trace = go.Scattergl(
+        x=xy[:shown, 0],
+        y=xy[:shown, 1],
         mode="markers+text",
         hoverinfo="text",
-        text=node_text,
+        text=graph.nodes[:shown].to_numpy(),
         marker=dict(
             showscale=True,
             colorscale=[[0, NODE_COLOR], [1, NODE_COLOR]],
-            size=node_size,  # *Node size based on degree
-            color=[len(list(G.adj[node])) for node in G.nodes()],
+            size=np.where(degrees < 5, 20, np.where(degrees < 10, 35, 65)),  # *Node size based on degree
+            color=degrees,
             line_width=2,
         ),
         textfont=dict(
@@ -75,9 +375,31 @@ def visualize_graph(G) -> BaseFigure:
         ),
         textposition="top center",
     )
+    return [edge_trace, edge_hover_trace, node_trace]
+
+
+def _aggregate_trace(aggregates: pd.DataFrame) -> Any:
+    """Markers of the collapsed communities of an overview, sized by their number of members."""
+    return go.Scattergl(
+        x=np.round(aggregates["x"].to_numpy(), 5),
+        y=np.round(aggregates["y"].to_numpy(), 5),
+        mode="markers+text",
+        hoverinfo="text",
+        hovertext=aggregates["text"].to_numpy(),
+        text=aggregates["title"].to_numpy(),
+        marker=dict(
+            size=np.clip(20 + 5 * np.sqrt(aggregates["members"].to_numpy()), 20, 65),
+            color=AGGREGATE_COLOR,
+            line_width=2,
+        ),
+        textfont=dict(family="Courier New, monospace", size=12, color=TEXT_COLOR),
+        textposition="top center",
+    )
+
 
+def _figure(traces: list[Any]) -> BaseFigure:
     fig: BaseFigure = go.Figure(
-        data=[edge_trace, node_trace],
+        data=traces,
         layout=go.Layout(
             showlegend=False,
             hovermode="closest",
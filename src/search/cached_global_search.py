@@ -0,0 +1,177 @@
+﻿import hashlib
+import json
+import logging
+import threading
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from diskcache import Cache
+from graphrag.query.context_builder.conversation_history import (
+    ConversationHistory,
+)
+from graphrag.query.structured_search.base import SearchResult
+from graphrag.query.structured_search.global_search.search import (
+    GlobalSearch,
+    GlobalSearchResult,
+)
+
+from src.utils.embedding_cache import normalize_query_text
+from src.utils.tracing import span
+
+# !bump this when the cached map result layout changes
+MAP_CACHE_VERSION: int = 1
+
+
+class CachedGlobalSearch(GlobalSearch):
+    """
+    `GlobalSearch` whose map phase is served from a content-addressed cache when possible.
+
+    Each map call is keyed by the hash of (normalized query, batch context text, map prompt,
+    LLM model/deployment, map LLM params). On a hit the parsed key points are returned without
+    calling the LLM, so a repeated global query only pays for the reduce call. Batches are
+    reproducible because the community context is shuffled with a fixed random state.
+
+    Only map results holding at least one answer are stored: graphrag turns LLM errors and
+    unparsable responses into a single empty answer, and those must be retried next time.
+
+    Attributes:
+        map_cache (Cache): Disk cache of map results shared by the process (see `shared_resources`).
+        map_cache_hits (int): Map batches of this search served from the cache.
+        map_cache_misses (int): Map batches of this search sent to the LLM.
+    """
+
+    def __init__(self, *args: Any, map_cache: Cache, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.map_cache: Cache = map_cache
+        self.map_cache_hits: int = 0
+        self.map_cache_misses: int = 0
+        self._map_cache_lock: threading.Lock = threading.Lock()
+
+    async def asearch(
+        self,
+        query: str,
+        conversation_history: ConversationHistory | None = None,
+        **kwargs: Any,
+    ) -> GlobalSearchResult:
+        """Perform a global search, logging the map cache hit rate."""
+        result: GlobalSearchResult = await super().asearch(
+            query, conversation_history, **kwargs
+        )
+        self.log_map_cache_stats()
+        return result
+
+    async def astream_search(
+        self,
+        query: str,
+        conversation_history: ConversationHistory | None = None,
+    ) -> AsyncGenerator:
+        """Stream the global search response, logging the map cache hit rate once the map phase is done."""
+        logged: bool = False
+        async for chunk in super().astream_search(query, conversation_history):
+            if not logged:
+                self.log_map_cache_stats()
+                logged = True
+            yield chunk
+
+    def log_map_cache_stats(self) -> None:
+        """Logs the hit rate of this search and the cumulative hit rate of the cache."""
+        batches: int = self.map_cache_hits + self.map_cache_misses
+        hits, misses = self.map_cache.stats()
+        lookups: int = hits + misses
+        logging.info(
+            f"map response cache: {self.map_cache_hits}/{batches} batches hit, "
+            f"cumulative hit rate {hits / lookups if lookups else 0.0:.2%} "
+            f"({hits}/{lookups}), {self.map_cache.volume() / 1024**2:.2f} MB"
+        )
+
+    async def _map_response_single_batch(
+        self,
+        context_data: str,
+        query: str,
+        **llm_kwargs,
+    ) -> SearchResult:
+        """Generate answer for a single chunk of community reports, reusing a cached answer if any."""
+        with span("global.map_batch", batch_chars=len(context_data)) as map_span:
+            key: str = self._map_cache_key(context_data, query, llm_kwargs)
+            cached: list[dict[str, Any]] | None = self.map_cache.get(key)
+            with self._map_cache_lock:
+                if cached is None:
+                    self.map_cache_misses += 1
+                else:
+                    self.map_cache_hits += 1
+            map_span.set_attribute("cache_hit", cached is not None)
+
+            if cached is not None:
+                map_span.set_attributes(key_points=len(cached), prompt_tokens=0)
+                return SearchResult(
+                    response=cached,
+                    context_data=context_data,
+                    context_text=context_data,
+                    completion_time=0.0,
+                    llm_calls=0,
+                    prompt_tokens=0,
+                )
+
+            result: SearchResult = await super()._map_response_single_batch(
+                context_data=context_data, query=query, **llm_kwargs
+            )
+            answered: bool = isinstance(result.response, list) and any(
+                isinstance(point, dict) and point.get("answer")
+                for point in result.response
+            )
+            map_span.set_attributes(
+                key_points=len(result.response) if answered else 0,
+                prompt_tokens=result.prompt_tokens,
+            )
+            if answered:
+                self.map_cache.set(key, result.response)
+        return result
+
+    async def _reduce_response(
+        self,
+        map_responses: list[SearchResult],
+        query: str,
+        **llm_kwargs,
+    ) -> SearchResult:
+        """Combine the map responses into the final answer, traced as a "global.reduce" span."""
+        with span(
+            "global.reduce", map_responses=len(map_responses), streaming=False
+        ) as reduce_span:
+            result: SearchResult = await super()._reduce_response(
+                map_responses, query, **llm_kwargs
+            )
+            reduce_span.set_attribute("prompt_tokens", result.prompt_tokens)
+        return result
+
+    async def _stream_reduce_response(
+        self,
+        map_responses: list[SearchResult],
+        query: str,
+        **llm_kwargs,
+    ) -> AsyncGenerator[str, None]:
+        """Stream the final answer from the map responses, traced as a "global.reduce" span."""
+        with span(
+            "global.reduce", map_responses=len(map_responses), streaming=True
+        ):
+            async for chunk in super()._stream_reduce_response(
+                map_responses, query, **llm_kwargs
+            ):
+                yield chunk
+
+    def _map_cache_key(
+        self, context_data: str, query: str, llm_kwargs: dict[str, Any]
+    ) -> str:
+        payload: str = json.dumps(
+            {
+                "version": MAP_CACHE_VERSION,
+                "query": normalize_query_text(query),
+                "context_data": context_data,
+                "map_system_prompt": self.map_system_prompt,
+                "model": getattr(self.llm, "model", None),
+                "deployment_name": getattr(self.llm, "deployment_name", None),
+                "llm_params": llm_kwargs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,271 @@
+﻿import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+from graphrag.model.community_report import CommunityReport
+from graphrag.model.entity import Entity
+from graphrag.query.context_builder.conversation_history import (
+    ConversationHistory,
+)
+from graphrag.query.llm.text_utils import num_tokens
+from graphrag.query.structured_search.base import SearchResult
+from graphrag.query.structured_search.global_search.community_context import (
+    GlobalCommunityContext,
+)
+from graphrag.query.structured_search.global_search.search import (
+    GlobalSearchResult,
+)
+
+from src.search.cached_global_search import CachedGlobalSearch
+from src.utils.env_manager import get_env_int
+from src.utils.traced_context import TracedGlobalCommunityContext
+
+
+@dataclass
+class GlobalPruningConfig:
+    """
+    Knobs of the pruned global search mode.
+
+    Attributes:
+        max_batches (int): Map at most this many report batches (0: no limit).
+        max_context_tokens (int): Map batches until their tokens exceed this budget (0: no limit).
+        wave_size (int): Batches mapped concurrently before checking for early termination.
+        stop_score (int): Score (0-100) from which a map key point counts as confident.
+        stop_points (int): Stop mapping once this many confident key points were found (0: never stop early).
+    """
+
+    max_batches: int = 8
+    max_context_tokens: int = 0
+    wave_size: int = 4
+    stop_score: int = 80
+    stop_points: int = 5
+
+    @classmethod
+    def from_env(cls) -> "GlobalPruningConfig | None":
+        """
+        Reads the pruning knobs from environ, or returns None if GRAPHRAG_GLOBAL_PRUNING is not set to 1.
+
+        Knobs: GRAPHRAG_GLOBAL_MAX_BATCHES, GRAPHRAG_GLOBAL_MAX_CONTEXT_TOKENS, GRAPHRAG_GLOBAL_WAVE_SIZE,
+        GRAPHRAG_GLOBAL_STOP_SCORE and GRAPHRAG_GLOBAL_STOP_POINTS.
+        """
+        if get_env_int("GRAPHRAG_GLOBAL_PRUNING", 0) != 1:
+            return None
+        return cls(
+            max_batches=get_env_int("GRAPHRAG_GLOBAL_MAX_BATCHES", cls.max_batches),
+            max_context_tokens=get_env_int(
+                "GRAPHRAG_GLOBAL_MAX_CONTEXT_TOKENS", cls.max_context_tokens
+            ),
+            wave_size=max(1, get_env_int("GRAPHRAG_GLOBAL_WAVE_SIZE", cls.wave_size)),
+            stop_score=get_env_int("GRAPHRAG_GLOBAL_STOP_SCORE", cls.stop_score),
+            stop_points=get_env_int("GRAPHRAG_GLOBAL_STOP_POINTS", cls.stop_points),
+        )
+
+
+def rank_community_reports(
+    reports: list[CommunityReport], entities: list[Entity] | None
+) -> list[CommunityReport]:
+    """
+    Orders community reports from most to least relevant to any question.
+
+    Reports are sorted by community weight (distinct text units of the community's entities, as
+    graphrag's "occurrence weight") and then by report rank, both descending.
+    """
+    text_units: dict[str, set[str]] = {}
+    for entity in entities or []:
+        for community_id in entity.community_ids or []:
+            text_units.setdefault(community_id, set()).update(
+                entity.text_unit_ids or []
+            )
+    return sorted(
+        reports,
+        key=lambda report: (
+            len(text_units.get(report.community_id, ())),
+            report.rank or 0.0,
+        ),
+        reverse=True,
+    )
+
+
+class PrunedGlobalSearch(CachedGlobalSearch):
+    """
+    `CachedGlobalSearch` that can map only the most relevant community reports.
+
+    Without `pruning` it behaves as `CachedGlobalSearch`. With it, reports are ordered by weight and
+    rank instead of shuffled, so the first batches hold the most relevant communities. Only the
+    first `max_batches` / `max_context_tokens` batches are mapped, in waves of `wave_size`, and
+    mapping stops after the wave in which `stop_points` key points scored at least `stop_score`.
+
+    Attributes:
+        pruning (GlobalPruningConfig | None): The pruning knobs, None to map every batch.
+        pruning_stats (dict): Batch counts of the last search (total, selected, mapped, skipped, stopped early).
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        pruning: GlobalPruningConfig | None = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.pruning: GlobalPruningConfig | None = pruning
+        self.pruning_stats: dict = {}
+
+    async def asearch(
+        self,
+        query: str,
+        conversation_history: ConversationHistory | None = None,
+        **kwargs: Any,
+    ) -> GlobalSearchResult:
+        """Perform a global search, mapping only the selected batches in pruned mode."""
+        if self.pruning is None:
+            return await super().asearch(query, conversation_history, **kwargs)
+
+        start_time: float = time.time()
+        context_chunks, context_records, map_responses = await self._pruned_map(
+            query, conversation_history
+        )
+        self.log_map_cache_stats()
+        reduce_response: SearchResult = await self._reduce_response(
+            map_responses=map_responses,
+            query=query,
+            **self.reduce_llm_params,
+        )
+        return GlobalSearchResult(
+            response=reduce_response.response,
+            context_data=context_records,
+            context_text=context_chunks,
+            map_responses=map_responses,
+            reduce_context_data=reduce_response.context_data,
+            reduce_context_text=reduce_response.context_text,
+            completion_time=time.time() - start_time,
+            llm_calls=sum(response.llm_calls for response in map_responses)
+            + reduce_response.llm_calls,
+            prompt_tokens=sum(response.prompt_tokens for response in map_responses)
+            + reduce_response.prompt_tokens,
+        )
+
+    async def astream_search(
+        self,
+        query: str,
+        conversation_history: ConversationHistory | None = None,
+    ) -> AsyncGenerator:
+        """Stream the global search response, mapping only the selected batches in pruned mode."""
+        if self.pruning is None:
+            async for chunk in super().astream_search(query, conversation_history):
+                yield chunk
+            return
+
+        _, context_records, map_responses = await self._pruned_map(
+            query, conversation_history
+        )
+        self.log_map_cache_stats()
+        # *context records first, as GlobalSearch does, then the reduce tokens
+        yield context_records
+        async for response in self._stream_reduce_response(
+            map_responses=map_responses,
+            query=query,
+            **self.reduce_llm_params,
+        ):
+            yield response
+
+    async def _pruned_map(
+        self, query: str, conversation_history: ConversationHistory | None
+    ) -> tuple[list[str], dict[str, pd.DataFrame], list[SearchResult]]:
+        context_chunks, context_records = self._build_ranked_context(
+            conversation_history
+        )
+        if isinstance(context_chunks, str):
+            context_chunks = [context_chunks]
+        selected: list[str] = self._select_batches(context_chunks)
+
+        if self.callbacks:
+            for callback in self.callbacks:
+                callback.on_map_response_start(selected)  # type: ignore
+
+        map_responses: list[SearchResult] = []
+        stopped_early: bool = False
+        for start in range(0, len(selected), self.pruning.wave_size):
+            map_responses.extend(
+                await asyncio.gather(
+                    *[
+                        self._map_response_single_batch(
+                            context_data=data, query=query, **self.map_llm_params
+                        )
+                        for data in selected[start : start + self.pruning.wave_size]
+                    ]
+                )
+            )
+            if self._is_confident(map_responses):
+                stopped_early = len(map_responses) < len(selected)
+                break
+
+        if self.callbacks:
+            for callback in self.callbacks:
+                callback.on_map_response_end(map_responses)
+
+        self.pruning_stats = {
+            "batches": len(context_chunks),
+            "selected": len(selected),
+            "mapped": len(map_responses),
+            "skipped": len(context_chunks) - len(map_responses),
+            "stopped_early": stopped_early,
+        }
+        logging.info(f"pruned global search: {self.pruning_stats}")
+        return context_chunks, context_records, map_responses
+
+    def _build_ranked_context(
+        self, conversation_history: ConversationHistory | None
+    ) -> tuple[str | list[str], dict[str, pd.DataFrame]]:
+        params: dict[str, Any] = {**self.context_builder_params, "shuffle_data": False}
+        builder = self.context_builder
+        if not isinstance(builder, GlobalCommunityContext):
+            return builder.build_context(
+                conversation_history=conversation_history, **params
+            )
+        # *a builder over the ranked reports, so batches are cut from the most relevant reports first
+        ranked: GlobalCommunityContext = TracedGlobalCommunityContext(
+            community_reports=rank_community_reports(
+                builder.community_reports, builder.entities
+            ),
+            entities=builder.entities,
+            token_encoder=builder.token_encoder,
+            random_state=builder.random_state,
+        )
+        return ranked.build_context(conversation_history=conversation_history, **params)
+
+    def _select_batches(self, context_chunks: list[str]) -> list[str]:
+        selected: list[str] = (
+            context_chunks[: self.pruning.max_batches]
+            if self.pruning.max_batches > 0
+            else list(context_chunks)
+        )
+        if self.pruning.max_context_tokens <= 0:
+            return selected
+
+        budget: list[str] = []
+        tokens: int = 0
+        for chunk in selected:
+            tokens += num_tokens(chunk, self.token_encoder)
+            # !the first batch is always mapped, even if it alone exceeds the budget
+            if budget and tokens > self.pruning.max_context_tokens:
+                break
+            budget.append(chunk)
+        return budget
+
+    def _is_confident(self, map_responses: list[SearchResult]) -> bool:
+        if self.pruning.stop_points <= 0:
+            return False
+        confident: int = sum(
+            1
+            for response in map_responses
+            if isinstance(response.response, list)
+            for point in response.response
+            if isinstance(point, dict)
+            and point.get("answer")
+            and float(point.get("score", 0) or 0) >= self.pruning.stop_score
+        )
+        return confident >= self.pruning.stop_points
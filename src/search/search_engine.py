@@ -1,8 +1,9 @@
 ﻿import logging
 import re
-from typing import Literal, LiteralString
+import time
+from collections.abc import AsyncGenerator
 
-import networkx as nx
+import gradio as gr
 import pandas as pd
 from graphrag.query.context_builder.builders import (
     GlobalContextBuilder,
@@ -11,17 +12,36 @@ from graphrag.query.context_builder.builders import (
 from graphrag.query.context_builder.entity_extraction import (
     EntityVectorStoreKey,
 )
-from graphrag.query.llm.oai.chat_openai import ChatOpenAI
-from graphrag.query.llm.oai.typing import OpenaiApiType
-from graphrag.query.structured_search.base import BaseSearch, SearchResult
-from graphrag.query.structured_search.global_search.search import GlobalSearch
+from graphrag.query.structured_search.base import BaseSearch
 from graphrag.query.structured_search.local_search.search import LocalSearch
 from plotly.basedatatypes import BaseFigure
 
-from src.graph.graph_creation import create_knowledge_graph
-from src.graph.graph_visualization import visualize_graph
+from src.graph.graph_layout import GraphLayout
+from src.graph.graph_visualization import visualize_relationships
+from src.search.pruned_global_search import (
+    GlobalPruningConfig,
+    PrunedGlobalSearch,
+)
+from src.state.shared_resources import get_llm_rate_controller
 from src.state.state_model import StateModel
+from src.utils.context_tables import PANELS, ContextTable
 from src.utils.graphrag_context_manager import get_context_builder
+from src.utils.rate_limiter import LLMRateController, RateLimitedLLM
+from src.utils.tracing import NoopSpan, Span, aiter_in_span, span
+
+# *(state, chatbot history, query input, entity, relationship, source and report placeholders, plot)
+# *panels that did not change since the previous yield are sent as `gr.update()` (no-op)
+MessageOutputs = tuple[
+    StateModel,
+    list,
+    str,
+    str | dict,
+    str | dict,
+    str | dict,
+    str | dict,
+    BaseFigure | dict | None,
+]
+UNCHANGED_PANELS: tuple[dict, ...] = tuple(gr.update() for _ in range(5))
 
 
 async def send_message(
@@ -32,47 +52,25 @@ async def send_message(
     community_level: str,
     response_type: str,
     selected_folder: str,
-) -> (
-    tuple[
-        StateModel,
-        list,
-        str,
-        Literal["<p>No Entities due to Global Search</p>"],
-        Literal["<p>No Relationship due to Global Search</p>"],
-        Literal["<p>No Source due to Global Search</p>"],
-        str,
-        None,
-    ]
-    | tuple[
-        StateModel,
-        list,
-        str,
-        str | LiteralString,
-        str | LiteralString,
-        str | LiteralString,
-        str | LiteralString,
-        BaseFigure | None,
-    ]
-    | tuple[
-        StateModel,
-        list,
-        str,
-        Literal["<p>No Entities</p>"],
-        Literal["<p>No Relationship</p>"],
-        Literal["<p>No Source</p>"],
-        Literal["<p>No Report</p>"],
-        None,
-    ]
-):
+) -> AsyncGenerator[MessageOutputs, None]:
     """
-    Sends a query to a language model and retrieves the corresponding response
+    Sends a query to a language model and streams the corresponding response
     along with contextual information.
 
     This function handles both global and local queries by interacting with
     different search engines based on the specified query type. It constructs
-    context builders, processes the search results, and prepares the
+    context builders, streams the search results, and prepares the
     display outputs for entities, relationships, sources, and reports.
 
+    The answer is streamed token by token into the chat history (reduce phase for
+    global search, completion for local search). The information panels are filled
+    as soon as the search context is known, before the first token arrives. The context
+    tables stay server-side: the panels get a placeholder and are rendered page by page
+    when opened (see `publish_context_tables`).
+
+    With GRAPHRAG_TRACE_FILE set, the request is traced as a "chat.request" span holding the
+    spans of the folder switch, context building, LLM calls and rendering (see `src.utils.tracing`).
+
     Args:
         state (StateModel): The current state of the application, containing
                             parameters and context for the query.
@@ -86,238 +84,154 @@ async def send_message(
         response_type (str): The expected format and type of the response.
         selected_folder (str): The folder from which to read the output data.
 
-    Returns:
+    Yields:
         tuple: A tuple containing:
             - state (StateModel): Updated state after processing the query.
-            - history (list): Updated history including the new query and response.
+            - history (list): Updated history including the new query and the response so far.
             - str: An empty string (placeholder).
-            - str: HTML formatted string for entity display.
-            - str: HTML formatted string for relationship display.
-            - str: HTML formatted string for source display.
-            - str: HTML formatted string for report display.
+            - str: HTML placeholder for entity display.
+            - str: HTML placeholder for relationship display.
+            - str: HTML placeholder for source display.
+            - str: HTML placeholder for report display.
             - BaseFigure or None: A plotly figure for visualizing the graph, or None
                                     if no relationships were found.
 
     Raises:
         Exception: Logs any exceptions that occur during the processing of the query.
     """
+    with span(
+        "chat.request",
+        query_type=query_type,
+        community_level=community_level,
+        response_type=response_type,
+        folder=selected_folder,
+        query_chars=len(query),
+    ) as request_span:
+        # !Gradio may resume each step in another context, keep the nested spans under this one
+        async for outputs in aiter_in_span(
+            _stream_message(
+                state,
+                query_type,
+                query,
+                history,
+                community_level,
+                response_type,
+                selected_folder,
+                request_span,
+            ),
+            request_span,
+        ):
+            yield outputs
+
+
+async def _stream_message(
+    state: StateModel,
+    query_type: str,
+    query: str,
+    history: list,
+    community_level: str,
+    response_type: str,
+    selected_folder: str,
+    request_span: Span | NoopSpan,
+) -> AsyncGenerator[MessageOutputs, None]:
+    # !while a search generator is suspended its innermost span stays current, so attributes of
+    # !the request are set on `request_span` itself rather than on `current_span()`
     logging.info(f"query_type: {query_type}")
     logging.info(f"community_level: {community_level}")
     logging.info(f"response_type: {response_type}")
     logging.info(f"param: {state.param}")
 
-    api_key: str | None = state.param.llm.api_key
-    llm_model: str = state.param.llm.model
-    llm_deployment: str | None = state.param.llm.deployment_name
-    api_base: str | None = state.param.llm.api_base
-    api_version: str | None = state.param.llm.api_version
-
-    llm: ChatOpenAI = ChatOpenAI(
-        api_key=api_key,
-        model=llm_model,
-        deployment_name=llm_deployment,
-        api_base=api_base,
-        api_version=api_version,
-        api_type=OpenaiApiType.AzureOpenAI,
-        max_retries=10,
+    # !show the question right away, the answer is filled in while it streams
+    history.append((query, ""))
+    yield (
+        state,
+        history,
+        str(""),
+        "<p>Searching...</p>",
+        "<p>Searching...</p>",
+        "<p>Searching...</p>",
+        "<p>Searching...</p>",
+        None,
     )
 
-    # !get GraphRag Search context Builder
-    context_builder: GlobalContextBuilder | LocalContextBuilder = (
-        get_context_builder(
-            state, query_type, community_level, selected_folder
+    try:
+        # !get GraphRag Search context Builder and search engine
+        search_engine: BaseSearch = create_search_engine(
+            state, query_type, community_level, response_type, selected_folder
         )
-    )
 
-    try:
         if query_type == "global":
+            df: pd.DataFrame = pd.DataFrame()
+            response: str = ""
+            start: float = time.perf_counter()
+            # !the first chunk is the context records (after the map phase), then reduce tokens
+            async for chunk in search_engine.astream_search(query):
+                if isinstance(chunk, dict):
+                    df = chunk.get("reports", pd.DataFrame())
+                    yield (
+                        state,
+                        history,
+                        str(""),
+                        *publish_context_tables(state, render_global_reports(df, "")),
+                        None,
+                    )
+                    continue
 
-            context_builder_params: dict = {
-                "use_community_summary": False,  # !False means using full community reports. True means using community short summaries.
-                "shuffle_data": True,
-                "include_community_rank": True,
-                "min_community_rank": 0,
-                "community_rank_name": "rank",
-                "include_community_weight": True,
-                "community_weight_name": "occurrence weight",
-                "normalize_community_weight": True,
-                "max_tokens": 2000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
-                "context_name": "Reports",
-            }
-
-            map_llm_params: dict = {
-                "max_tokens": 1000,
-                "temperature": 0.0,
-            }
-
-            reduce_llm_params: dict = {
-                "max_tokens": 1000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 1000-1500)
-                "temperature": 0.0,
-            }
-
-            search_engine: BaseSearch = GlobalSearch(
-                llm=llm,
-                context_builder=context_builder,
-                token_encoder=state.token_encoder,
-                max_data_tokens=2000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
-                map_llm_params=map_llm_params,
-                reduce_llm_params=reduce_llm_params,
-                allow_general_knowledge=False,  # !set this to True will add instruction to encourage the LLM to incorporate general knowledge in the response, which may increase hallucinations, but could be useful in some use cases.
-                json_mode=False,  # !set this to False if your LLM model does not support JSON mode.
-                context_builder_params=context_builder_params,
-                concurrent_coroutines=32,
-                response_type=f"{response_type}",  # !free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
-            )
-
-            result: SearchResult = await search_engine.asearch(query)
-
-            df: pd.DataFrame = result.context_data["reports"]
-            # !extract Reports[xx]
-            ids: list[str] = re.findall(
-                r"Reports\s*\(([\d,\s]*)", result.response
-            )
-            all_ids: list = []
-            for id_group in ids:
-                all_ids.extend(
-                    [
-                        str(id.strip())
-                        for id in id_group.split(",")
-                        if id.strip()
-                    ]
-                )
-            # !extract df from related Report
-            related_df: pd.DataFrame = df[df["id"].isin(all_ids)]
-            report_html_display: str = (
-                related_df.to_html(index=False)
-                if not related_df.empty
-                else "<p>No Data Available</p>"
-            )
-            history.append((query, result.response))
+                if not response:
+                    record_first_token(request_span, start)
+                response += chunk
+                history[-1] = (query, response)
+                # *only the chat changes while tokens stream
+                yield (state, history, str(""), *UNCHANGED_PANELS)
 
-            return (
+            # !keep only the reports cited in the final answer
+            yield (
                 state,
                 history,
                 str(""),
-                "<p>No Entities due to Global Search</p>",
-                "<p>No Relationship due to Global Search</p>",
-                "<p>No Source due to Global Search</p>",
-                report_html_display,
+                *publish_context_tables(
+                    state, render_global_reports(df, response), replace=True
+                ),
                 None,
             )
+            request_span.set_attribute("response_chars", len(response))
+            return
 
         elif query_type == "local":
-            local_context_params: dict = {
-                "text_unit_prop": 0.5,
-                "community_prop": 0.1,
-                "conversation_history_max_turns": 5,
-                "conversation_history_user_turns_only": True,
-                "top_k_mapped_entities": 10,
-                "top_k_relationships": 10,
-                "include_entity_rank": False,
-                "include_relationship_weight": False,
-                "include_community_rank": False,
-                "return_candidate_context": False,
-                "embedding_vectorstore_key": EntityVectorStoreKey.ID,
-                "max_tokens": 3000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
-            }
-            llm_params: dict = {
-                "max_tokens": 1000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 1000=1500)
-                "temperature": 0.0,
-            }
-
-            search_engine: BaseSearch = LocalSearch(
-                llm=llm,
-                context_builder=context_builder,
-                token_encoder=state.token_encoder,
-                llm_params=llm_params,
-                context_builder_params=local_context_params,
-                response_type=f"{response_type}",  # !free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
-            )
-
-            result: SearchResult = await search_engine.asearch(query)
-            context_records: dict[str, pd.DataFrame] = result.context_data
-            entities: pd.DataFrame = context_records.get(
-                "entities", pd.DataFrame()
-            )
-            relationships: pd.DataFrame = context_records.get(
-                "relationships", pd.DataFrame()
-            )
-            reports: pd.DataFrame = context_records.get(
-                "reports", pd.DataFrame()
-            )
-            sources: pd.DataFrame = context_records.get(
-                "sources", pd.DataFrame()
-            )
-
-            entity_html_display: str = ""
-            if not entities.empty:
-                entity_html_display += entities[
-                    ["entity", "description"]
-                ].to_html(index=False)
-            else:
-                entity_html_display += f"\n\n<h5>No Entities found</h5>"
-
-            relationship_html_display: str = ""
-            if not relationships.empty:
-                relationship_html_display += relationships[
-                    ["source", "target", "description"]
-                ].to_html(index=False)
-            else:
-                relationship_html_display += (
-                    f"\n\n<h5>No Relationships found</h5>"
-                )
-
-            source_html_display: str = ""
-            if not sources.empty:
-                for _, row in sources.iterrows():
-                    output: tuple[str, str] = row["id"], row["text"]
-                    title, content = output
-                    source_html_display += (
-                        f"\n\n<h5>Source <b>#{title}</b></h5>\n"
+            response: str = ""
+            start: float = time.perf_counter()
+            # !the first chunk is the context records, then completion tokens
+            async for chunk in search_engine.astream_search(query):
+                if isinstance(chunk, dict):
+                    # *nodes are placed from the folder's precomputed layout, not laid out per query
+                    tables, plot_panel = render_local_context(
+                        chunk, state.snapshot("local").graph_layout
                     )
-                    source_html_display += content
-            else:
-                source_html_display += f"\n\n<h5>No Sources found</h5>"
-
-            report_html_display: str = ""
-            if not reports.empty:
-                for _, row in reports.iterrows():
-                    output: tuple[str, str] = row["title"], row["content"]
-                    title, content = output
-                    report_html_display += (
-                        f"\n\n<h5>Report <b>{title}</b></h5>\n"
+                    yield (
+                        state,
+                        history,
+                        str(""),
+                        *publish_context_tables(state, tables),
+                        plot_panel,
                     )
-                    report_html_display += content
-            else:
-                report_html_display += f"\n\n<h5>No Report found</h5>"
+                    continue
 
-            history.append((query, result.response))
-
-            # !Plog GraphRag Graph Visualization
-            if not relationships.empty:
-                G: nx.Graph = create_knowledge_graph(relationships)
-                plot_panel: BaseFigure = visualize_graph(G)
-            else:
-                plot_panel: None | BaseFigure = None
-
-            return (
-                state,
-                history,
-                str(""),
-                entity_html_display,
-                relationship_html_display,
-                source_html_display,
-                report_html_display,
-                plot_panel,
-            )
+                if not response:
+                    record_first_token(request_span, start)
+                response += chunk
+                history[-1] = (query, response)
+                # *only the chat changes while tokens stream
+                yield (state, history, str(""), *UNCHANGED_PANELS)
+            request_span.set_attribute("response_chars", len(response))
+            return
 
     except Exception as e:
         error_message = f"An error occurred: {str(e)}"
         logging.error(error_message)
         logging.exception("Exception details:")
-        history.append((query, error_message))
+        history[-1] = (query, error_message)
 
-    return (
+    yield (
         state,
         history,
         str(""),
@@ -327,3 +241,340 @@ async def send_message(
         "<p>No Report</p>",
         None,
     )
+
+
+def record_first_token(request_span: Span | NoopSpan, start: float) -> None:
+    """Logs the time to the first answer token and records it on the request span."""
+    seconds: float = time.perf_counter() - start
+    logging.info(f"time to first token: {seconds:.2f}s")
+    request_span.set_attribute("time_to_first_token_ms", round(seconds * 1000, 3))
+
+
+def create_search_engine(
+    state: StateModel,
+    query_type: str,
+    community_level: str,
+    response_type: str,
+    selected_folder: str,
+) -> BaseSearch:
+    """
+    Creates the GraphRag search engine of a query, as used by the chat and the batch runner.
+
+    The LLM client comes from the process-wide client pool and goes through the shared rate
+    controller of its deployment; the context builder comes from the index registry.
+
+    Args:
+        state (StateModel): The current state of the application (settings, shared resources).
+        query_type (str): The type of query ('global' or 'local').
+        community_level (str): The level of community context to be considered in the search.
+        response_type (str): The expected format and type of the response.
+        selected_folder (str): The folder from which to read the output data.
+
+    Returns:
+        BaseSearch: A `PrunedGlobalSearch` or a `LocalSearch`.
+
+    Raises:
+        ValueError: If the query type is neither 'global' nor 'local'.
+    """
+    if query_type not in ("global", "local"):
+        raise ValueError(f"Unknown query type: {query_type}")
+
+    api_key: str | None = state.param.llm.api_key
+    llm_model: str = state.param.llm.model
+    llm_deployment: str | None = state.param.llm.deployment_name
+    api_base: str | None = state.param.llm.api_base
+    api_version: str | None = state.param.llm.api_version
+
+    # !concurrency and 429 retries are handled by the deployment's shared rate controller,
+    # !the client itself must not retry (its blind backoff would hide the 429s from the controller)
+    controller: LLMRateController = get_llm_rate_controller(
+        api_base,
+        llm_deployment or llm_model,
+        tokens_per_minute=state.param.llm.tokens_per_minute,
+        requests_per_minute=state.param.llm.requests_per_minute,
+        max_concurrency=state.param.llm.concurrent_requests,
+    )
+    logging.info(f"llm rate controller: {controller.stats()}")
+    # *the chat client is pooled per configuration, so its HTTP connections survive between messages
+    llm: RateLimitedLLM = RateLimitedLLM(
+        state.client_pool.chat(
+            api_key=api_key,
+            model=llm_model,
+            deployment_name=llm_deployment,
+            api_base=api_base,
+            api_version=api_version,
+            max_retries=0,
+        ),
+        controller=controller,
+        token_encoder=state.token_encoder,
+        max_retries=state.param.llm.max_retries,
+        max_retry_wait=state.param.llm.max_retry_wait,
+    )
+
+    # !get GraphRag Search context Builder
+    context_builder: GlobalContextBuilder | LocalContextBuilder = (
+        get_context_builder(
+            state, query_type, community_level, selected_folder
+        )
+    )
+
+    if query_type == "global":
+        context_builder_params: dict = {
+            "use_community_summary": False,  # !False means using full community reports. True means using community short summaries.
+            "shuffle_data": True,
+            "include_community_rank": True,
+            "min_community_rank": 0,
+            "community_rank_name": "rank",
+            "include_community_weight": True,
+            "community_weight_name": "occurrence weight",
+            "normalize_community_weight": True,
+            "max_tokens": 2000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
+            "context_name": "Reports",
+        }
+
+        map_llm_params: dict = {
+            "max_tokens": 1000,
+            "temperature": 0.0,
+        }
+
+        reduce_llm_params: dict = {
+            "max_tokens": 1000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 1000-1500)
+            "temperature": 0.0,
+        }
+
+        # *map results of unchanged (query, report batch, params) are reused from the disk cache
+        # *with GRAPHRAG_GLOBAL_PRUNING=1 only the best ranked report batches are mapped
+        return PrunedGlobalSearch(
+            llm=llm,
+            context_builder=context_builder,
+            token_encoder=state.token_encoder,
+            max_data_tokens=2000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
+            map_llm_params=map_llm_params,
+            reduce_llm_params=reduce_llm_params,
+            allow_general_knowledge=False,  # !set this to True will add instruction to encourage the LLM to incorporate general knowledge in the response, which may increase hallucinations, but could be useful in some use cases.
+            json_mode=False,  # !set this to False if your LLM model does not support JSON mode.
+            context_builder_params=context_builder_params,
+            concurrent_coroutines=controller.concurrency.max_limit,  # *the rate controller narrows this adaptively
+            response_type=f"{response_type}",  # !free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
+            map_cache=state.map_response_cache,
+            pruning=GlobalPruningConfig.from_env(),
+        )
+
+    else:
+        local_context_params: dict = {
+            "text_unit_prop": 0.5,
+            "community_prop": 0.1,
+            "conversation_history_max_turns": 5,
+            "conversation_history_user_turns_only": True,
+            "top_k_mapped_entities": 10,
+            "top_k_relationships": 10,
+            "include_entity_rank": False,
+            "include_relationship_weight": False,
+            "include_community_rank": False,
+            "return_candidate_context": False,
+            "embedding_vectorstore_key": EntityVectorStoreKey.ID,
+            "max_tokens": 3000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 5000)
+        }
+        llm_params: dict = {
+            "max_tokens": 1000,  # !change this based on the token limit you have on your model (if you are using a model with 8k limit, a good setting could be 1000=1500)
+            "temperature": 0.0,
+        }
+
+        return LocalSearch(
+            llm=llm,
+            context_builder=context_builder,
+            token_encoder=state.token_encoder,
+            llm_params=llm_params,
+            context_builder_params=local_context_params,
+            response_type=f"{response_type}",  # !free form text describing the response type and format, can be anything, e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
+        )
+
+
+def render_global_reports(df: pd.DataFrame, response: str) -> dict[str, ContextTable]:
+    """
+    Builds the information panel tables of a global search: its community reports.
+
+    Args:
+        df (pd.DataFrame): The "reports" context records of the search.
+        response (str): The answer so far. If not empty, only the reports it cites
+                        (`Reports (1, 2, ...)`) are kept.
+
+    Returns:
+        dict[str, ContextTable]: Table per panel (see `PANELS`).
+    """
+    with span(
+        "render.html", panel="global_reports", rows=len(df), filtered=bool(response)
+    ):
+        tables: dict[str, ContextTable] = {
+            "entities": ContextTable(
+                pd.DataFrame(), empty_html="<p>No Entities due to Global Search</p>"
+            ),
+            "relationships": ContextTable(
+                pd.DataFrame(), empty_html="<p>No Relationship due to Global Search</p>"
+            ),
+            "sources": ContextTable(
+                pd.DataFrame(), empty_html="<p>No Source due to Global Search</p>"
+            ),
+        }
+        if df.empty or not response:
+            tables["reports"] = ContextTable(df, columns=list(df.columns))
+            return tables
+
+        # !extract Reports[xx]
+        ids: list[str] = re.findall(r"Reports\s*\(([\d,\s]*)", response)
+        all_ids: list = []
+        for id_group in ids:
+            all_ids.extend(
+                [str(id.strip()) for id in id_group.split(",") if id.strip()]
+            )
+        # !extract df from related Report
+        related_df: pd.DataFrame = df[df["id"].isin(all_ids)]
+        tables["reports"] = ContextTable(related_df, columns=list(df.columns))
+        return tables
+
+
+def render_local_context(
+    context_records: dict[str, pd.DataFrame],
+    layout: GraphLayout | None = None,
+) -> tuple[dict[str, ContextTable], BaseFigure | None]:
+    """
+    Renders the context records of a local search for the information panels.
+
+    Args:
+        context_records (dict[str, pd.DataFrame]): The context records of the search
+                                                    (entities, relationships, sources, reports).
+        layout (GraphLayout | None, optional): Entity positions of the index folder for the graph.
+                                                Defaults to None (layout the subgraph itself).
+
+    Returns:
+        tuple: The panel tables (see `render_local_html`), and the relationship graph
+                figure (None if no relationships were found).
+    """
+    relationships: pd.DataFrame = context_records.get(
+        "relationships", pd.DataFrame()
+    )
+
+    # !Plog GraphRag Graph Visualization
+    if not relationships.empty:
+        with span(
+            "graph.plot",
+            relationships=len(relationships),
+            precomputed=layout is not None,
+        ) as graph_span:
+            plot_panel: BaseFigure | None = visualize_relationships(
+                relationships, layout
+            )
+            graph_span.set_attributes(
+                traces=len(plot_panel.data),
+                lod=bool(plot_panel.layout.meta),
+            )
+    else:
+        plot_panel = None
+
+    return render_local_html(context_records), plot_panel
+
+
+def render_local_html(
+    context_records: dict[str, pd.DataFrame],
+) -> dict[str, ContextTable]:
+    """
+    Builds the entity, relationship, source and report panel tables of a local search.
+
+    Args:
+        context_records (dict[str, pd.DataFrame]): The context records of the search.
+
+    Returns:
+        dict[str, ContextTable]: Table per panel (see `PANELS`).
+    """
+    with span(
+        "render.html",
+        panel="local_context",
+        rows={
+            name: len(records)
+            for name, records in context_records.items()
+            if isinstance(records, pd.DataFrame)
+        },
+    ):
+        return {
+            "entities": ContextTable(
+                context_records.get("entities", pd.DataFrame()),
+                columns=["entity", "description"],
+                empty_html="\n\n<h5>No Entities found</h5>",
+            ),
+            "relationships": ContextTable(
+                context_records.get("relationships", pd.DataFrame()),
+                columns=["source", "target", "description"],
+                empty_html="\n\n<h5>No Relationships found</h5>",
+            ),
+            "sources": ContextTable(
+                context_records.get("sources", pd.DataFrame()),
+                section=("id", "text", "Source <b>#{}</b>"),
+                empty_html="\n\n<h5>No Sources found</h5>",
+            ),
+            "reports": ContextTable(
+                context_records.get("reports", pd.DataFrame()),
+                section=("title", "content", "Report <b>{}</b>"),
+                empty_html="\n\n<h5>No Report found</h5>",
+            ),
+        }
+
+
+def publish_context_tables(
+    state: StateModel, tables: dict[str, ContextTable], replace: bool = False
+) -> tuple[str, str, str, str]:
+    """
+    Keeps the panel tables of a response server-side and returns the placeholder of every panel.
+
+    The browser gets a few bytes per panel instead of the rendered tables; `main.js` asks for the
+    first page (`show_context_page`) once a panel with a placeholder is open, so a closed panel is
+    never rendered.
+
+    Args:
+        state (StateModel): The session state, which keeps the id of the response's tables.
+        tables (dict[str, ContextTable]): Table per panel (see `PANELS`).
+        replace (bool, optional): Replace the tables last published by the session (an update of the
+                                    same response) instead of storing new ones. Defaults to False.
+
+    Returns:
+        tuple: Placeholder HTML of the entity, relationship, source and report panels.
+    """
+    state.context_tables_id = state.context_tables.put(
+        tables, state.context_tables_id if replace else None
+    )
+    return tuple(
+        tables[panel].empty_html
+        if not len(tables[panel])
+        else (
+            f'<div class="context-table-pending" data-response="{state.context_tables_id}">'
+            f"{len(tables[panel])} rows</div>"
+        )
+        for panel in PANELS
+    )
+
+
+def show_context_page(
+    state: StateModel, page: int, panel: str, step: int | None = None
+) -> tuple[str, int]:
+    """
+    Renders a page of an information panel of the session's last response.
+
+    Args:
+        state (StateModel): The session state.
+        page (int): The page shown now.
+        panel (str): The panel (see `PANELS`).
+        step (int | None, optional): Pages to move by (-1, 1). Defaults to None (first page).
+
+    Returns:
+        tuple[str, int]: HTML of the page and its index.
+    """
+    table: ContextTable | None = state.context_tables.get(
+        state.context_tables_id, panel
+    )
+    if table is None:
+        return "<p>No Data Available</p>", 0
+    with span(
+        "render.page", panel=panel, rows=len(table), page=page, step=step
+    ) as page_span:
+        html, shown = table.render_page(0 if step is None else int(page) + step)
+        page_span.set_attributes(shown=shown, html_chars=len(html))
+        return html, shown
@@ -0,0 +1,506 @@
+﻿import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+import pandas as pd
+import tiktoken
+
+from src.graph.graph_layout import GraphLayout, load_graph_layout
+from src.utils.compiled_index import CompiledIndex, open_compiled_index
+from src.utils.context_cache import ContextBuilderCache
+from src.utils.df_manager import (
+    TABLES,
+    estimate_df_bytes,
+    get_artifacts_signature,
+    read_df,
+)
+from src.utils.embedding_index import (
+    VECTOR_STORE_BACKENDS,
+    ensure_entity_embedding_index,
+    get_vector_store_backend,
+)
+from src.utils.env_manager import get_env_int
+from src.utils.lazy_table import LazyTable
+from src.utils.level_partitions import LevelPartitions
+from src.utils.token_counts import (
+    TOKEN_COUNT_COLUMNS,
+    PrecountedTokenEncoder,
+    load_token_counts,
+)
+from src.utils.tracing import span
+
+if TYPE_CHECKING:
+    # *the Azure SDKs are only imported when a remote index is attached or a vector store is opened
+    from graphrag.vector_stores import BaseVectorStore
+
+    from src.utils.remote_index import RemoteIndex
+
+
+class IndexSnapshot:
+    """
+    Read-only data of one graphrag index folder, as loaded at a given artifacts signature.
+
+    A snapshot is never re-pointed at other artifacts: when the folder's files change, the
+    registry builds a new snapshot instead. Columns a query path has not needed yet are
+    still read lazily through the underlying `LazyTable`s, from the folder's compiled snapshot
+    when it was compiled from the current artifacts (see `compile_index`).
+
+    Attributes:
+        folder (str): Index folder name (e.g. "20240923-101940").
+        artifacts_folder (str): Path of the folder's `artifacts` directory.
+        signature (tuple): Artifacts signature the snapshot was loaded from.
+        remote (RemoteIndex | None): Blob Storage the folder's artifacts are fetched from on demand.
+        loaded_at (float): Unix time the snapshot was created.
+        last_access (float): Unix time of the last registry lookup.
+        hits (int): Number of registry lookups served by this snapshot.
+        load_seconds (float): Time spent reading artifacts for this snapshot.
+        nbytes (int): Estimated memory footprint of the materialized DataFrames.
+        compiled (CompiledIndex | None): The compiled snapshot the tables are mapped from, if any.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        artifacts_folder: str,
+        signature: tuple,
+        remote: "RemoteIndex | None" = None,
+    ):
+        self.folder: str = folder
+        self.artifacts_folder: str = artifacts_folder
+        self.signature: tuple = signature
+        self.remote: "RemoteIndex | None" = remote
+        self.loaded_at: float = time.time()
+        self.last_access: float = self.loaded_at
+        self.hits: int = 0
+        self.load_seconds: float = 0.0
+        self.nbytes: int = 0
+        self.compiled: CompiledIndex | None = None
+        self._tables: dict[str, LazyTable] | None = None
+        self._description_embedding_store: "BaseVectorStore | None" = None
+        self._level_partitions: LevelPartitions | None = None
+        self._graph_layout: GraphLayout | None = None
+        # *df name -> (frame counted, encoding name, token count per text)
+        self._token_counts: dict[str, tuple[pd.DataFrame, str, dict[str, int]]] = {}
+        self._empty_frames: dict[str, pd.DataFrame] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def ensure(self, query_type: str | None = None) -> None:
+        """
+        Materializes the columns the given query path needs (default: every column), and
+        precomputes the per-level report and entity partitions from them.
+        """
+        with self._lock:
+            loaded_before: int = self._loaded_columns()
+            start: float = time.perf_counter()
+            if self._tables is None:
+                self.compiled = open_compiled_index(self.artifacts_folder, self.signature)
+                if self.compiled is not None:
+                    self._tables = dict(self.compiled.tables)
+            self._tables = read_df(self.artifacts_folder, query_type, self._tables)
+            if self._loaded_columns() != loaded_before:
+                self._level_partitions = self._build_level_partitions()
+                self.load_seconds += time.perf_counter() - start
+                self.nbytes = estimate_df_bytes(
+                    *(table.frame for table in self._tables.values())
+                )
+
+    def _loaded_columns(self) -> int:
+        if self._tables is None:
+            return -1
+        return sum(len(table.frame.columns) for table in self._tables.values())
+
+    def frame(self, df_name: str) -> pd.DataFrame:
+        """Returns the materialized DataFrame of a table, or an empty one if the folder has none."""
+        table: LazyTable | None = (self._tables or {}).get(df_name)
+        if table is None:
+            # *same object on every call, so identity checks (e.g. level partitions) hold
+            return self._empty_frames.setdefault(df_name, pd.DataFrame())
+        return table.frame
+
+    @property
+    def entity_df(self) -> pd.DataFrame:
+        return self.frame("entity_df")
+
+    @property
+    def relationship_df(self) -> pd.DataFrame:
+        return self.frame("relationship_df")
+
+    @property
+    def text_unit_df(self) -> pd.DataFrame:
+        return self.frame("text_unit_df")
+
+    @property
+    def report_df(self) -> pd.DataFrame:
+        return self.frame("report_df")
+
+    @property
+    def entity_embedding_df(self) -> pd.DataFrame:
+        return self.frame("entity_embedding_df")
+
+    @property
+    def covariate_df(self) -> pd.DataFrame:
+        return self.frame("covariate_df")
+
+    @property
+    def description_embedding_store(self) -> "BaseVectorStore":
+        """The folder's persistent entity description embedding index, opened on first use."""
+        with self._lock:
+            if self._description_embedding_store is None:
+                # *an index stored along the artifacts is reused if its manifest matches
+                self.artifact(f"{VECTOR_STORE_BACKENDS[get_vector_store_backend()]}/")
+                self._description_embedding_store = (
+                    ensure_entity_embedding_index(
+                        self.artifacts_folder, self.frame("entity_embedding_df")
+                    )
+                )
+            return self._description_embedding_store
+
+    def artifact(self, name: str) -> str:
+        """
+        Local path of an artifact of the folder (e.g. "stats.json"), fetched from the remote index on first access.
+
+        A name ending with "/" is a directory (e.g. "lancedb/"), fetched with everything under it.
+        """
+        if self.remote is not None:
+            return self.remote.fetch(self.folder, name)
+        return os.path.join(self.artifacts_folder, *name.rstrip("/").split("/"))
+
+    @property
+    def graph_layout(self) -> GraphLayout:
+        """Positions of the folder's entities for the relationship plots, computed or read on first use."""
+        with self._lock:
+            if self._graph_layout is None:
+                tables: dict[str, LazyTable] = self._tables or {}
+                relationships: LazyTable | None = tables.get("relationship_df")
+                nodes: LazyTable | None = tables.get("entity_df")
+                if relationships is None:
+                    self._graph_layout = GraphLayout(pd.Index([]), np.zeros((0, 2)))
+                else:
+                    # !needs the relationship columns of the local query path
+                    relationships.load(["source", "target", "weight"])
+                    self._graph_layout = load_graph_layout(
+                        relationships.path,
+                        relationships.frame,
+                        nodes.path if nodes is not None else None,
+                    )
+            return self._graph_layout
+
+    @property
+    def level_partitions(self) -> LevelPartitions:
+        """Reports and entities of every community level, built from the columns loaded so far."""
+        with self._lock:
+            if self._level_partitions is None or not self._level_partitions.is_built_from(
+                self.entity_df, self.report_df, self.entity_embedding_df
+            ):
+                self._level_partitions = self._build_level_partitions()
+            return self._level_partitions
+
+    def token_encoder(self, token_encoder: tiktoken.Encoding) -> PrecountedTokenEncoder:
+        """
+        An encoder for the context builders that knows the token counts of the loaded report and text unit texts.
+
+        Counts are read from the artifacts' token count sidecars (written on the first load of the
+        folder) and re-read only when a table gains columns, e.g. text units on the first local query.
+        """
+        with self._lock:
+            counts: dict[str, int] = {}
+            for df_name, columns in TOKEN_COUNT_COLUMNS.items():
+                table: LazyTable | None = (self._tables or {}).get(df_name)
+                if table is None:
+                    continue
+                cached: tuple | None = self._token_counts.get(df_name)
+                if (
+                    cached is None
+                    or cached[0] is not table.frame
+                    or cached[1] != token_encoder.name
+                ):
+                    cached = (
+                        table.frame,
+                        token_encoder.name,
+                        load_token_counts(
+                            table.path, table.frame, columns, token_encoder
+                        ),
+                    )
+                    self._token_counts[df_name] = cached
+                counts.update(cached[2])
+            return PrecountedTokenEncoder(token_encoder, counts)
+
+    def _build_level_partitions(self) -> LevelPartitions:
+        return LevelPartitions(
+            self.entity_df,
+            self.report_df,
+            self.entity_embedding_df,
+            self.compiled.level_partitions() if self.compiled is not None else None,
+        )
+
+    def stats(self) -> dict:
+        """Residency stats of the snapshot."""
+        return {
+            "loaded_at": self.loaded_at,
+            "last_access": self.last_access,
+            "hits": self.hits,
+            "load_seconds": round(self.load_seconds, 3),
+            "nbytes": self.nbytes,
+            "compiled": self.compiled is not None,
+            "tables": {
+                df_name: list(self.frame(df_name).columns) for df_name in TABLES
+            },
+        }
+
+
+class IndexRegistry:
+    """
+    Keeps several graphrag index folders loaded at once, so switching folders is a lookup.
+
+    Snapshots are kept least-recently-used first and evicted when the estimated memory of
+    all snapshots exceeds the budget. The snapshot just requested is never evicted. Evicting
+    a folder also drops its cached context builders.
+
+    One registry per graphdata root is shared by every Gradio session (see `shared_resources`).
+    Folders can be loaded ahead of the first query with `prefetch`; `get` waits for an
+    in-flight prefetch of the same folder instead of loading it a second time.
+
+    Attributes:
+        output_dir (str): The graphrag `output` directory holding the index folders.
+        max_bytes (int): Memory budget for all snapshots (env: GRAPHRAG_INDEX_REGISTRY_MAX_MB, default 4096).
+        max_indexes (int): Maximum number of resident folders (env: GRAPHRAG_INDEX_REGISTRY_MAX_INDEXES, default 4).
+        context_cache (ContextBuilderCache): Context builders built from the resident snapshots.
+        loads (int): Number of snapshots loaded.
+        evictions (int): Number of snapshots evicted due to the budget.
+        prefetches (int): Number of prefetches started (env: GRAPHRAG_INDEX_PREFETCH_WORKERS sets the worker threads, default 2).
+        remote (RemoteIndex | None): Blob Storage the folders are fetched from on demand (None: local folders only, see `attach_remote`).
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        max_bytes: int | None = None,
+        max_indexes: int | None = None,
+    ):
+        self.output_dir: str = output_dir
+        self.max_bytes: int = (
+            max_bytes
+            if max_bytes is not None
+            else get_env_int("GRAPHRAG_INDEX_REGISTRY_MAX_MB", 4096) * 1024**2
+        )
+        self.max_indexes: int = (
+            max_indexes
+            if max_indexes is not None
+            else get_env_int("GRAPHRAG_INDEX_REGISTRY_MAX_INDEXES", 4)
+        )
+        self.context_cache: ContextBuilderCache = ContextBuilderCache()
+        self.loads: int = 0
+        self.evictions: int = 0
+        self.prefetches: int = 0
+        self.remote: "RemoteIndex | None" = None
+        self._snapshots: OrderedDict[str, IndexSnapshot] = OrderedDict()
+        self._lock: threading.RLock = threading.RLock()
+        self._folder_locks: dict[str, threading.Lock] = {}
+        self._inflight: dict[str, Future] = {}
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=get_env_int("GRAPHRAG_INDEX_PREFETCH_WORKERS", 2),
+            thread_name_prefix="index-prefetch",
+        )
+
+    def get(self, folder: str, query_type: str | None = None) -> IndexSnapshot:
+        """
+        Returns the snapshot of an index folder, loading it only if it is not resident or its artifacts changed.
+
+        Args:
+            folder (str): Index folder name under `output_dir`.
+            query_type (str | None, optional): "global" or "local" to make sure that query path's columns are loaded.
+                                                Defaults to None (every column).
+
+        Returns:
+            IndexSnapshot: The resident snapshot of the folder.
+        """
+        with self._lock:
+            inflight: Future | None = self._inflight.get(folder)
+        if inflight is not None:
+            # *the folder is being loaded in the background, reuse that load
+            try:
+                inflight.result()
+            except Exception as e:
+                logging.warning(f"index registry: prefetch of {folder} failed: {e}")
+        return self._load(folder, query_type)
+
+    def prefetch(
+        self,
+        folder: str,
+        query_type: str | None = None,
+        warmup: Callable[[IndexSnapshot], None] | None = None,
+    ) -> Future:
+        """
+        Starts loading an index folder in the background and returns immediately.
+
+        Args:
+            folder (str): Index folder name under `output_dir`.
+            query_type (str | None, optional): "global" or "local" to load only that query path's columns.
+                                                Defaults to None (every column).
+            warmup (Callable[[IndexSnapshot], None] | None, optional): Called with the loaded snapshot in the
+                                                                        background thread (e.g. to build context builders).
+                                                                        Defaults to None.
+
+        Returns:
+            Future: Resolves to the loaded snapshot. A prefetch of a folder already in flight is returned as is.
+        """
+        with self._lock:
+            inflight: Future | None = self._inflight.get(folder)
+            if inflight is not None:
+                return inflight
+
+            future: Future = self._executor.submit(
+                self._prefetch, folder, query_type, warmup
+            )
+            self._inflight[folder] = future
+            self.prefetches += 1
+        future.add_done_callback(lambda _: self._prefetch_done(folder, future))
+        logging.info(f"index registry: prefetching {folder} ({query_type})")
+        return future
+
+    def attach_remote(self, remote: "RemoteIndex") -> Future:
+        """
+        Fetches index folders from a Blob Storage container on demand, listing them in the background.
+
+        The remote is attached at once but only serves the folders it listed (none until the listing
+        completes), so neither the caller nor the queries of local folders wait for the network.
+        If the listing fails, the remote is detached again.
+
+        Args:
+            remote (RemoteIndex): The container's folders.
+
+        Returns:
+            Future: Resolves to the remote folders, most recent first.
+        """
+        self.remote = remote
+        logging.info(f"index registry: listing {remote.container_client.container_name}")
+        return self._executor.submit(self._list_remote, remote)
+
+    def remote_folders(self) -> list[str]:
+        """Folders of the attached remote, most recent first (empty if none or not listed yet)."""
+        remote: "RemoteIndex | None" = self.remote
+        return list(remote.folders) if remote is not None else []
+
+    def _list_remote(self, remote: "RemoteIndex") -> list[str]:
+        try:
+            return remote.list_folders()
+        except Exception:
+            with self._lock:
+                if self.remote is remote:
+                    self.remote = None
+            raise
+
+    def _prefetch(
+        self,
+        folder: str,
+        query_type: str | None,
+        warmup: Callable[[IndexSnapshot], None] | None,
+    ) -> IndexSnapshot:
+        start: float = time.perf_counter()
+        snapshot: IndexSnapshot = self._load(folder, query_type)
+        if warmup is not None:
+            warmup(snapshot)
+        logging.info(
+            f"index registry: prefetched {folder} in {time.perf_counter() - start:.3f}s"
+        )
+        return snapshot
+
+    def _prefetch_done(self, folder: str, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(folder) is future:
+                del self._inflight[folder]
+        if future.exception() is not None:
+            logging.error(
+                f"index registry: prefetch of {folder} failed: {future.exception()}"
+            )
+
+    def _load(self, folder: str, query_type: str | None) -> IndexSnapshot:
+        with span("index.load", folder=folder, query_type=query_type) as load_span:
+            remote: "RemoteIndex | None" = self.remote
+            if remote is not None:
+                # !before the signature: newly fetched tables are part of the artifacts
+                remote.ensure_tables(folder, query_type)
+            artifacts_folder: str = os.path.join(self.output_dir, folder, "artifacts")
+            signature: tuple = get_artifacts_signature(artifacts_folder)
+
+            with self._get_folder_lock(folder):
+                with self._lock:
+                    snapshot: IndexSnapshot | None = self._snapshots.get(folder)
+                    if snapshot is not None and snapshot.signature != signature:
+                        logging.info(f"index registry: artifacts of {folder} changed")
+                        self._drop(folder)
+                        snapshot = None
+                        load_span.set_attribute("artifacts_changed", True)
+                    if snapshot is not None:
+                        self._snapshots.move_to_end(folder)
+
+                if snapshot is None:
+                    snapshot = IndexSnapshot(
+                        folder, artifacts_folder, signature, remote
+                    )
+                    snapshot.ensure(query_type)
+                    with self._lock:
+                        self._snapshots[folder] = snapshot
+                        self.loads += 1
+                    logging.info(
+                        f"index registry: loaded {folder} in {snapshot.load_seconds:.3f}s ({snapshot.nbytes} bytes)"
+                    )
+                    load_span.set_attributes(resident=False, bytes=snapshot.nbytes)
+                else:
+                    # *no-op unless this query type needs columns that are not read yet
+                    snapshot.ensure(query_type)
+                    load_span.set_attributes(resident=True, bytes=snapshot.nbytes)
+
+            snapshot.hits += 1
+            snapshot.last_access = time.time()
+            self._evict(keep=folder)
+        return snapshot
+
+    def resident(self) -> list[str]:
+        """Names of the resident index folders, least recently used first."""
+        with self._lock:
+            return list(self._snapshots)
+
+    def stats(self) -> dict:
+        """Per-folder residency stats and the memory usage of the registry."""
+        with self._lock:
+            return {
+                "resident": {
+                    folder: snapshot.stats()
+                    for folder, snapshot in self._snapshots.items()
+                },
+                "nbytes": sum(s.nbytes for s in self._snapshots.values()),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "prefetches": self.prefetches,
+                "prefetching": list(self._inflight),
+                "remote": self.remote.stats() if self.remote is not None else None,
+                "context_cache": self.context_cache.stats(),
+            }
+
+    def _get_folder_lock(self, folder: str) -> threading.Lock:
+        with self._lock:
+            return self._folder_locks.setdefault(folder, threading.Lock())
+
+    def _drop(self, folder: str) -> None:
+        self._snapshots.pop(folder, None)
+        self.context_cache.invalidate(folder)
+
+    def _evict(self, keep: str) -> None:
+        with self._lock:
+            total: int = sum(s.nbytes for s in self._snapshots.values())
+            for folder in list(self._snapshots):
+                if total <= self.max_bytes and len(self._snapshots) <= self.max_indexes:
+                    break
+                if folder == keep:
+                    continue
+                total -= self._snapshots[folder].nbytes
+                self._drop(folder)
+                self.evictions += 1
+                logging.info(f"index registry: evicted {folder}")
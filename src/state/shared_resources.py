@@ -0,0 +1,204 @@
+﻿import logging
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import gradio as gr
+import tiktoken
+from diskcache import Cache
+from gradio.themes.base import ThemeClass
+
+from src.state.index_registry import IndexRegistry
+from src.utils.client_pool import OpenAIClientPool
+from src.utils.context_tables import ContextTableStore
+from src.utils.env_manager import get_env_int
+from src.utils.rate_limiter import LLMRateController
+
+# *one registry per graphdata root, shared by every Gradio session of the process
+_index_registries: dict[str, IndexRegistry] = {}
+_index_registries_lock: threading.Lock = threading.Lock()
+
+# *one admission controller per LLM deployment, shared by every Gradio session of the process
+_llm_rate_controllers: dict[tuple, LLMRateController] = {}
+_llm_rate_controllers_lock: threading.Lock = threading.Lock()
+
+
+def get_index_registry(root_dir: str) -> IndexRegistry:
+    """
+    Returns the process-wide index registry of a graphdata root directory.
+
+    Sessions only keep the root directory (their handle) and resolve the registry through
+    this function, so the loaded indexes are never copied into per-session state.
+
+    Args:
+        root_dir (str): Root directory holding the graphrag `output` folder.
+
+    Returns:
+        IndexRegistry: The registry shared by every session using this root directory.
+    """
+    key: str = os.path.abspath(root_dir)
+    with _index_registries_lock:
+        if key not in _index_registries:
+            _index_registries[key] = IndexRegistry(os.path.join(key, "output"))
+        return _index_registries[key]
+
+
+def get_llm_rate_controller(
+    api_base: str | None,
+    deployment_name: str | None,
+    tokens_per_minute: int = 0,
+    requests_per_minute: int = 0,
+    max_concurrency: int = 25,
+) -> LLMRateController:
+    """
+    Returns the process-wide rate controller of an LLM deployment.
+
+    The quota normally comes from the `llm` section of `settings.yaml` (`tokens_per_minute`,
+    `requests_per_minute`, `concurrent_requests`) and can be overridden with
+    GRAPHRAG_LLM_TOKENS_PER_MINUTE, GRAPHRAG_LLM_REQUESTS_PER_MINUTE and
+    GRAPHRAG_LLM_MAX_CONCURRENCY. A quota of 0 is unlimited. Changing the quota replaces the
+    controller of the deployment.
+
+    Args:
+        api_base (str | None): API base URL of the deployment.
+        deployment_name (str | None): Deployment (or model) name.
+        tokens_per_minute (int, optional): Tokens-per-minute quota. Defaults to 0.
+        requests_per_minute (int, optional): Requests-per-minute quota. Defaults to 0.
+        max_concurrency (int, optional): Upper bound of the adaptive concurrency limit. Defaults to 25.
+
+    Returns:
+        LLMRateController: The controller shared by every session calling this deployment.
+    """
+    quota: tuple[int, int, int] = (
+        get_env_int("GRAPHRAG_LLM_TOKENS_PER_MINUTE", tokens_per_minute),
+        get_env_int("GRAPHRAG_LLM_REQUESTS_PER_MINUTE", requests_per_minute),
+        get_env_int("GRAPHRAG_LLM_MAX_CONCURRENCY", max_concurrency),
+    )
+    key: tuple = (api_base, deployment_name)
+    with _llm_rate_controllers_lock:
+        controller: LLMRateController | None = _llm_rate_controllers.get(key)
+        if controller is None or controller.quota != quota:
+            controller = LLMRateController(
+                max_concurrency=quota[2],
+                tokens_per_minute=quota[0],
+                requests_per_minute=quota[1],
+            )
+            _llm_rate_controllers[key] = controller
+        return controller
+
+
+def get_llm_rate_controller_stats() -> dict[str, dict]:
+    """Current limit, queue depth and remaining quota of every LLM deployment in use."""
+    with _llm_rate_controllers_lock:
+        return {
+            f"{api_base}/{deployment_name}": controller.stats()
+            for (api_base, deployment_name), controller in _llm_rate_controllers.items()
+        }
+
+
+@lru_cache(maxsize=None)
+def get_openai_client_pool() -> OpenAIClientPool:
+    """Returns the process-wide pool of chat and embedding clients (kept-alive HTTP connections)."""
+    return OpenAIClientPool()
+
+
+@lru_cache(maxsize=None)
+def get_context_table_store() -> ContextTableStore:
+    """Returns the process-wide store of the context tables of recent chat responses."""
+    return ContextTableStore()
+
+
+@lru_cache(maxsize=None)
+def get_query_embedding_cache(root_dir: str) -> Cache:
+    """
+    Returns the process-wide disk cache of query embeddings of a graphdata root directory.
+
+    The cache lives in `<root_dir>/cache/query_embeddings` (env: GRAPHRAG_EMBEDDING_CACHE_DIR) and
+    evicts least-recently-used entries beyond GRAPHRAG_EMBEDDING_CACHE_MAX_MB (default 256).
+    """
+    cache_dir: str = os.environ.get(
+        "GRAPHRAG_EMBEDDING_CACHE_DIR",
+        os.path.join(os.path.abspath(root_dir), "cache", "query_embeddings"),
+    )
+    return Cache(
+        cache_dir,
+        size_limit=get_env_int("GRAPHRAG_EMBEDDING_CACHE_MAX_MB", 256) * 1024**2,
+        eviction_policy="least-recently-used",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_map_response_cache(root_dir: str) -> Cache:
+    """
+    Returns the process-wide disk cache of global search map results of a graphdata root directory.
+
+    The cache lives in `<root_dir>/cache/map_responses` (env: GRAPHRAG_MAP_CACHE_DIR) and evicts
+    least-recently-used entries beyond GRAPHRAG_MAP_CACHE_MAX_MB (default 256). Hit/miss
+    statistics are enabled so the hit rate can be logged.
+    """
+    cache_dir: str = os.environ.get(
+        "GRAPHRAG_MAP_CACHE_DIR",
+        os.path.join(os.path.abspath(root_dir), "cache", "map_responses"),
+    )
+    cache: Cache = Cache(
+        cache_dir,
+        size_limit=get_env_int("GRAPHRAG_MAP_CACHE_MAX_MB", 256) * 1024**2,
+        eviction_policy="least-recently-used",
+    )
+    cache.stats(enable=True)
+    return cache
+
+
+@lru_cache(maxsize=None)
+def get_token_encoder(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """
+    Returns the process-wide tiktoken encoder (building one parses ~100k BPE ranks).
+
+    The BPE file is downloaded once into TIKTOKEN_CACHE_DIR, which defaults to
+    `graphdata/cache/tiktoken` instead of tiktoken's temp directory so it survives container restarts.
+    """
+    os.environ.setdefault(
+        "TIKTOKEN_CACHE_DIR", os.path.join(os.getcwd(), "graphdata", "cache", "tiktoken")
+    )
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def get_theme(root_dir: str) -> ThemeClass:
+    """
+    Returns the custom Gradio theme (env: GRAPHRAG_THEME, default "lone17/kotaemon"), loaded once per process.
+
+    The theme is fetched from the Hugging Face hub only when it is not in `<root_dir>/cache/themes`
+    yet, and saved there, so later starts read it from disk and work offline. Without a cached copy
+    and without network, Gradio's default theme is used.
+    """
+    repo_name: str = os.environ.get("GRAPHRAG_THEME", "lone17/kotaemon")
+    theme_path: str = os.path.join(
+        os.path.abspath(root_dir), "cache", "themes", f"{repo_name.replace('/', '--')}.json"
+    )
+    if os.path.exists(theme_path):
+        try:
+            theme: ThemeClass = gr.Theme.load(theme_path)
+            theme.name = repo_name
+            return theme
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Ignore broken cached theme {theme_path}: {e}")
+    try:
+        theme = gr.Theme.from_hub(repo_name)
+    except Exception as e:
+        logging.warning(f"Could not fetch theme {repo_name}, use the default theme: {e}")
+        return gr.themes.Default()
+    try:
+        os.makedirs(os.path.dirname(theme_path), exist_ok=True)
+        theme.dump(theme_path)
+    except OSError as e:
+        logging.warning(f"Failed to cache theme {theme_path}: {e}")
+    return theme
+
+
+@lru_cache(maxsize=None)
+def read_asset(file_name: str) -> str:
+    """Returns the content of a file in the assets directory, read once per process."""
+    with (Path(__file__).parent.parent / "assets" / file_name).open() as fi:
+        return fi.read()
@@ -1,77 +1,114 @@
 ﻿import os
-from pathlib import Path
 
-import gradio as gr
-import pandas as pd
 import tiktoken
+from diskcache import Cache
 from gradio.themes.base import ThemeClass
 from graphrag.config.models import GraphRagConfig
-from graphrag.vector_stores.lancedb import LanceDBVectorStore
+
+from src.state.index_registry import IndexRegistry, IndexSnapshot
+from src.state.shared_resources import (
+    get_context_table_store,
+    get_index_registry,
+    get_llm_rate_controller_stats,
+    get_map_response_cache,
+    get_openai_client_pool,
+    get_query_embedding_cache,
+    get_theme,
+    get_token_encoder,
+    read_asset,
+)
+from src.utils.client_pool import OpenAIClientPool
+from src.utils.context_tables import ContextTableStore
 
 
 class StateModel:
     """
     A class to represent the state model for managing GraphRag/Gradio information.
 
+    The state only holds small per-session items (selected folder, settings). Loaded indexes,
+    the token encoder and the UI theme/assets are process-wide and resolved through properties,
+    so creating a Gradio session does not copy them.
+
     Attributes:
         initial_environ (dict[str, str] | None): Holds environment information (default: None).
-        entity_df (pd.DataFrame): DataFrame to store entity information.
-        relationship_df (pd.DataFrame): DataFrame to store relationship data between entities.
-        text_unit_df (pd.DataFrame): DataFrame for text unit data.
-        report_df (pd.DataFrame): DataFrame for report data.
-        entity_embedding_df (pd.DataFrame): DataFrame for entity embeddings.
-        covariate_df (pd.DataFrame): DataFrame to store covariate data.
-        token_encoder (tiktoken.core.Encoding): Token encoder for text tokenization.
-        description_embedding_store (LanceDBVectorStore | None): Store for description embeddings, default is None.
         timestamp (str | None): Placeholder for GraphRag reading folder name (default: None).
         param (GraphRagConfig | None): Settings from the GraphRag `settings.yaml` configuration file (default: None).
         root_dir (str): Root directory for storing graph data files (default: current working directory + "/graphdata").
-        _theme (ThemeClass): Custom Gradio theme loaded from the hub.
-        _css (str): Custom Gradio CSS loaded from the assets directory.
-        _js (str): Custom Gradio JavaScript loaded from the assets directory.
+        context_tables_id (str | None): Id of the context tables of the last response (default: None).
+        token_encoder (tiktoken.core.Encoding): Shared token encoder for text tokenization.
+        index_registry (IndexRegistry): Shared loaded index folders (DataFrames, embedding index, context builders)
+                                        of `root_dir`.
+        query_embedding_cache (Cache): Shared disk cache of local search query embeddings of `root_dir`.
+        map_response_cache (Cache): Shared disk cache of global search map results of `root_dir`.
+        client_pool (OpenAIClientPool): Shared chat and embedding clients (kept-alive connections).
+        context_tables (ContextTableStore): Shared context tables of recent responses, paged into the
+                                            information panels.
+        _theme (ThemeClass): Shared custom Gradio theme, fetched from the hub once and cached in `root_dir`.
+        _css (str): Shared custom Gradio CSS loaded from the assets directory.
+        _js (str): Shared custom Gradio JavaScript loaded from the assets directory.
 
     Methods:
         show() -> dict:
             Returns a dictionary representation of the current state model.
+        snapshot() -> IndexSnapshot:
+            Returns the loaded data of the selected index folder.
     """
 
     def __init__(self):
+        # !only small per-session items live here: Gradio deep-copies this object for every session
         self.initial_environ: dict[str, str] | None = None
-        self.entity_df: pd.DataFrame = pd.DataFrame()
-        self.relationship_df: pd.DataFrame = pd.DataFrame()
-        self.text_unit_df: pd.DataFrame = pd.DataFrame()
-        self.report_df: pd.DataFrame = pd.DataFrame()
-        self.entity_embedding_df: pd.DataFrame = pd.DataFrame()
-        self.covariate_df: pd.DataFrame = pd.DataFrame()
-        self.token_encoder: tiktoken.core.Encoding = tiktoken.get_encoding(
-            "cl100k_base"
-        )
-        self.description_embedding_store: LanceDBVectorStore | None = None
         self.timestamp: str | None = None
         self.param: GraphRagConfig | None = None
         self.root_dir: str = os.path.join(os.getcwd(), "graphdata")
+        self.context_tables_id: str | None = None
+
+    @property
+    def token_encoder(self) -> tiktoken.core.Encoding:
+        return get_token_encoder("cl100k_base")
+
+    @property
+    def index_registry(self) -> IndexRegistry:
+        # *the root directory is the session's handle to the process-wide registry
+        return get_index_registry(self.root_dir)
+
+    @property
+    def query_embedding_cache(self) -> Cache:
+        return get_query_embedding_cache(self.root_dir)
+
+    @property
+    def map_response_cache(self) -> Cache:
+        return get_map_response_cache(self.root_dir)
 
-        self._theme: ThemeClass = gr.Theme.from_hub("lone17/kotaemon")
-        with (
-            Path(__file__).parent.parent / "assets" / "main.css"
-        ).open() as fi:
-            self._css: str = fi.read()
-        with (
-            Path(__file__).parent.parent / "assets" / "main.js"
-        ).open() as fi:
-            self._js: str = fi.read()
+    @property
+    def client_pool(self) -> OpenAIClientPool:
+        return get_openai_client_pool()
+
+    @property
+    def context_tables(self) -> ContextTableStore:
+        return get_context_table_store()
+
+    @property
+    def _theme(self) -> ThemeClass:
+        return get_theme(self.root_dir)
+
+    @property
+    def _css(self) -> str:
+        return read_asset("main.css")
+
+    @property
+    def _js(self) -> str:
+        return read_asset("main.js")
 
     def show(self) -> dict:
         data = {
             "root_dir": self.root_dir,
-            "relationship_df": self.relationship_df.shape,
-            "text_unit_df": self.text_unit_df.shape,
-            "report_df": self.report_df.shape,
-            "entity_embedding_df": self.entity_embedding_df.shape,
-            "covariate_df": self.covariate_df.shape,
-            "token_encoder": self.token_encoder,
-            "description_embedding_store": self.description_embedding_store,
+            # *the name only: building the encoder reads ~100k BPE ranks (see `get_token_encoder`)
+            "token_encoder": "cl100k_base",
             "timestamp": self.timestamp,
+            "index_registry": self.index_registry.stats(),
+            "llm_rate_controllers": get_llm_rate_controller_stats(),
+            "client_pool": self.client_pool.stats(),
+            "context_tables": self.context_tables.stats(),
             "param": self.param,
             "_theme": self._theme,
             "_css": self._css,
@@ -79,3 +116,7 @@ class StateModel:
         }
 
         return data
+
+    def snapshot(self, query_type: str | None = None) -> IndexSnapshot:
+        """Returns the loaded data of the selected index folder (`timestamp`), loading it on first use."""
+        return self.index_registry.get(self.timestamp, query_type)
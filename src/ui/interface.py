@@ -1,13 +1,15 @@
 ﻿import logging
 import os
+from functools import partial
 
 import gradio as gr
 from gradio.blocks import Blocks
 from gradio.components.base import Component, FormComponent
 
-from src.search.search_engine import send_message
+from src.search.search_engine import send_message, show_context_page
 from src.state.state_model import StateModel
-from src.utils.blob_storage import download_idx_from_storage
+from src.utils.env_manager import get_env_int
+from src.utils.graphrag_context_manager import prefetch_index
 from src.utils.settings_manager import update_llm_settings
 
 
@@ -59,7 +61,8 @@ def create_gradio_interface(state: StateModel) -> Blocks:
                             selected_folder: FormComponent = gr.Dropdown(
                                 label="Select Index Folder to Chat With",
                                 choices=list_output_folders(
-                                    state.value.root_dir
+                                    state.value.root_dir,
+                                    state.value.index_registry.remote_folders(),
                                 ),
                                 value=state.value.timestamp,
                                 interactive=True,
@@ -117,24 +120,24 @@ def create_gradio_interface(state: StateModel) -> Blocks:
                                 label="Relationship Plot", open=False
                             ) as _:
                                 plot_panel: Component = gr.Plot(visible=True)
-                            with gr.Accordion(
-                                label="Entity Table", open=False
-                            ) as _:
-                                entity_html_display: Component = gr.HTML()
-                            with gr.Accordion(
-                                label="Relationship Table", open=False
-                            ) as _:
-                                relationship_html_display: Component = (
-                                    gr.HTML()
+                            # *tables are rendered page by page when their panel is opened
+                            entity_html_display: Component = create_context_panel(
+                                state, "Entity Table", "entities", open=False
+                            )
+                            relationship_html_display: Component = (
+                                create_context_panel(
+                                    state,
+                                    "Relationship Table",
+                                    "relationships",
+                                    open=False,
                                 )
-                            with gr.Accordion(
-                                label="Source Table", open=False
-                            ) as _:
-                                source_html_display: Component = gr.HTML()
-                            with gr.Accordion(
-                                label="Report Table", open=True
-                            ) as _:
-                                report_html_display: Component = gr.HTML()
+                            )
+                            source_html_display: Component = create_context_panel(
+                                state, "Source Table", "sources", open=False
+                            )
+                            report_html_display: Component = create_context_panel(
+                                state, "Report Table", "reports", open=True
+                            )
 
             with gr.Tab(
                 "Settings",
@@ -206,23 +209,39 @@ def create_gradio_interface(state: StateModel) -> Blocks:
                         label="CONTAINER_NAME",
                         value=state.value.param.storage.container_name,
                     )
+                    on_demand: FormComponent = gr.Checkbox(
+                        label="Fetch artifacts on demand (on first query of a folder)",
+                        value=get_env_int("GRAPHRAG_BLOB_ON_DEMAND", 1) > 0,
+                    )
                     download_idx_btn: Component = gr.Button(
                         "Download Index from Above Storage", variant="primary"
                     )
                     download_idx_btn.click(
-                        fn=download_idx_from_storage,
+                        fn=download_index,
                         inputs=[
                             state,
                             storage_connection_str,
                             storage_container_name,
+                            on_demand,
                         ],
                         outputs=[state],
+                    ).then(
+                        fn=refresh_output_folders,
+                        inputs=[state],
+                        outputs=[selected_folder],
                     )
 
         clear_chat_btn.click(
             fn=lambda: ([], ""), outputs=[chatbot, query_input]
         )
 
+        # *start loading the selected folder while the user types the query
+        selected_folder.change(
+            fn=prefetch_index,
+            inputs=[state, query_type, community_level, selected_folder],
+            outputs=None,
+        )
+
         query_input.submit(
             fn=send_message,
             inputs=[
@@ -247,6 +266,13 @@ def create_gradio_interface(state: StateModel) -> Blocks:
             ],
         )
 
+        # *the remote folders are listed in the background, after the layout may have been built
+        demo.load(
+            fn=refresh_output_folders,
+            inputs=[state],
+            outputs=[selected_folder],
+        )
+
         # Add this JavaScript to enable Shift+Enter functionality
         demo.load(
             js="""
@@ -271,23 +297,91 @@ def create_gradio_interface(state: StateModel) -> Blocks:
     return demo.queue()
 
 
-def list_output_folders(root_dir: str) -> list:
+def create_context_panel(
+    state: FormComponent, label: str, panel: str, open: bool
+) -> Component:
+    """
+    Creates an information panel showing one context table of the last response a page at a time.
+
+    The panel holds the page HTML, Previous/Next buttons and a hidden "load" button that
+    `main.js` clicks when the panel is open and shows a new response's placeholder.
+
+    Args:
+        state (FormComponent): The session state.
+        label (str): Label of the accordion.
+        panel (str): The context table shown (see `PANELS`).
+        open (bool): Whether the accordion starts open.
+
+    Returns:
+        Component: The HTML component, an output of `send_message`.
+    """
+    with gr.Accordion(label=label, open=open, elem_classes=["context-table-panel"]):
+        html_display: Component = gr.HTML()
+        page: FormComponent = gr.State(0)
+        with gr.Row():
+            previous_btn: Component = gr.Button("Previous", size="sm")
+            next_btn: Component = gr.Button("Next", size="sm")
+            load_btn: Component = gr.Button(
+                "Load", size="sm", elem_classes=["context-table-load"]
+            )
+
+    for button, step in ((load_btn, None), (previous_btn, -1), (next_btn, 1)):
+        button.click(
+            fn=partial(show_context_page, panel=panel, step=step),
+            inputs=[state, page],
+            outputs=[html_display, page],
+            show_progress="hidden",
+        )
+    return html_display
+
+
+def download_index(
+    state: StateModel,
+    storage_connection_str: str,
+    storage_container_name: str,
+    on_demand: bool,
+) -> StateModel:
+    """
+    Downloads the index from Azure Blob Storage (see `download_idx_from_storage`).
+
+    The Azure SDK is only imported when a download is requested, not when the app starts.
+    """
+    from src.utils.blob_storage import download_idx_from_storage
+
+    return download_idx_from_storage(
+        state, storage_connection_str, storage_container_name, on_demand
+    )
+
+
+def list_output_folders(root_dir: str, remote_folders: list[str] | None = None) -> list:
     """
     Lists the output folders from the specified root directory.
 
-    This function scans the "output" directory inside the specified root directory
-    and returns a list of folder names sorted in reverse chronological order.
+    This function scans the "output" directory inside the specified root directory, adds the
+    folders of the remote index (not fetched locally yet) and returns a list of folder names
+    sorted in reverse chronological order.
 
     Args:
         root_dir (str): The root directory where the output folders are stored.
+        remote_folders (list[str] | None, optional): Folders of the remote index. Defaults to None.
 
     Returns:
-        list: A list of folder names found in the "output" directory, sorted in reverse order.
+        list: A list of folder names found in the "output" directory or the remote index, sorted in reverse order.
     """
     output_dir: str = os.path.join(root_dir, "output")
     folders: list = [
         f
-        for f in os.listdir(output_dir)
+        for f in (os.listdir(output_dir) if os.path.isdir(output_dir) else [])
         if os.path.isdir(os.path.join(output_dir, f))
     ]
-    return sorted(folders, reverse=True)
+    return sorted(set(folders) | set(remote_folders or []), reverse=True)
+
+
+def refresh_output_folders(state: StateModel) -> dict:
+    """Updates the folder dropdown with the local and remote folders, selecting the session's folder."""
+    return gr.update(
+        choices=list_output_folders(
+            state.root_dir, state.index_registry.remote_folders()
+        ),
+        value=state.timestamp,
+    )
@@ -1,13 +1,40 @@
-﻿import logging
+﻿"""
+Downloads GraphRAG index folders from Azure Blob Storage.
+
+Usage:
+    python -m src.utils.blob_storage --connection-string "UseDevelopmentStorage=true" --container graphrag
+
+The connection string `UseDevelopmentStorage=true` points to a local Azurite emulator
+(`azurite-blob --loose`), so the sync can be run and checked without an Azure account.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable
 
 import gradio as gr
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from azure.storage.blob import BlobProperties, BlobServiceClient, ContainerClient
+
+from src.utils.env_manager import get_env_int
+from src.utils.logging_manager import setup_logging
+
+# *in the local graphdata root, next to the downloaded `output/` folders
+MANIFEST_FILE: str = ".blob_manifest.json"
+PARTIAL_SUFFIX: str = ".part"
 
 
 def download_idx_from_storage(
-    state, storage_connection_str, storage_container_name
+    state, storage_connection_str, storage_container_name, on_demand=None
 ):
     """
     Downloads index files from Azure Blob Storage to a local directory.
@@ -18,6 +45,11 @@ def download_idx_from_storage(
     'graphdata'. It creates the necessary local folder structure if it
     does not already exist.
 
+    Blobs are listed once and synced by `sync_blobs`: unchanged files are skipped,
+    the others are streamed to disk concurrently and interrupted downloads resume.
+    In on-demand mode only the folder names are listed: the index registry fetches the
+    artifacts of a folder when it is first queried (see `RemoteIndex`).
+
     Args:
         state: The current state of the application, used for tracking and
                 updating context.
@@ -25,6 +57,9 @@ def download_idx_from_storage(
                                         Storage account.
         storage_container_name (str): The name of the container from which to
                                         download the blobs.
+        on_demand (bool | None, optional): Fetch artifacts on first use instead of
+                                        downloading everything. Defaults to None
+                                        (env: GRAPHRAG_BLOB_ON_DEMAND, default 1).
 
     Returns:
         The updated state after the download process is complete.
@@ -33,44 +68,32 @@ def download_idx_from_storage(
         Exception: If any error occurs during the download process,
                     the function will raise an exception.
     """
-    blob_service_client = BlobServiceClient.from_connection_string(
-        storage_connection_str
-    )
-    container_client = blob_service_client.get_container_client(
-        storage_container_name
+    container_client: ContainerClient = get_container_client(
+        storage_connection_str, storage_container_name
     )
-    # list outputs/ folder
-    blob_list = container_client.list_blobs(name_starts_with="output/")
-    date_folders = set()
-    for blob in blob_list:
-        # get outputs/ folder names
-        folder_path = os.path.dirname(blob.name)
-        logging.info(f"folderPath: {folder_path}")
-        folder_name = folder_path.split("/")[1]
-        gr.Info(f"got folderName: {folder_name}", duration=5)
-        if is_date_format_folder(folder_name):
-            date_folders.add(folder_path)
-
-    # if theres not downloaded folder, create new folder
-    if not os.path.exists("./graphdata"):
-        os.makedirs("./graphdata")
-
-    for folder in date_folders:
-        gr.Info(f"Downloading folder: {folder}", duration=5)
-        blobs_in_folder = container_client.list_blobs(name_starts_with=folder)
+    if on_demand is None:
+        on_demand = get_env_int("GRAPHRAG_BLOB_ON_DEMAND", 1) > 0
+    if on_demand:
+        # *imported here: remote_index builds on this module
+        from src.utils.remote_index import attach_remote_index
 
-        for blob in blobs_in_folder:
-            local_path = os.path.join("./graphdata", blob.name)
-            local_folder = os.path.dirname(local_path)
-            if not os.path.exists(local_folder):
-                os.makedirs(local_folder)
+        # *the button waits for the listing, the start-up does not (see `attach_configured_storage`)
+        folders: list[str] = attach_remote_index(state, container_client).result()
+        gr.Info(
+            f"Index folders available, artifacts are fetched on first query: {', '.join(folders)}",
+            duration=10,
+        )
+        return state
 
-            with open(local_path, "wb") as download_file:
-                download_stream = container_client.download_blob(blob.name)
-                download_file.write(download_stream.readall())
+    blobs: list[BlobProperties] = list_index_blobs(container_client)
+    for folder in sorted({os.path.dirname(blob.name) for blob in blobs}):
+        gr.Info(f"Downloading folder: {folder}", duration=5)
 
-        gr.Info(f"Downloaded RAGindexes to {folder}", duration=5)
-    gr.Info(f"All successfully downloaded index from storage!", duration=10)
+    stats: BlobSyncStats = sync_blobs(container_client, blobs, "./graphdata")
+    if stats.failed:
+        gr.Warning(f"Some index files could not be downloaded, retry to resume: {stats}")
+    else:
+        gr.Info(f"All successfully downloaded index from storage! {stats}", duration=10)
 
     return state
 
@@ -79,3 +102,324 @@ def is_date_format_folder(folder_name):
     """Function to search date format folder"""
     pattern = r"\d{8}-\d{6}"  # e.g.) 20240909-182823
     return re.match(pattern, folder_name) is not None
+
+
+def get_container_client(connection_string: str, container_name: str) -> ContainerClient:
+    """
+    A container client whose downloads stream in chunks of GRAPHRAG_BLOB_CHUNK_MB (default 4).
+
+    Requests give up after GRAPHRAG_BLOB_RETRY_TOTAL retries (default 2), about 2 s then 4 s apart,
+    and connections after GRAPHRAG_BLOB_CONNECT_TIMEOUT seconds (default 5). The SDK's defaults
+    (3 retries 18 s to 42 s apart, 20 s connection timeout) keep a request to an unreachable
+    storage busy for over a minute.
+    """
+    chunk_size: int = max(1, get_env_int("GRAPHRAG_BLOB_CHUNK_MB", 4)) * 1024**2
+    # !the SDK buffers the first GET of a download (32 MB by default) in memory
+    return BlobServiceClient.from_connection_string(
+        connection_string,
+        max_single_get_size=chunk_size,
+        max_chunk_get_size=chunk_size,
+        retry_total=max(0, get_env_int("GRAPHRAG_BLOB_RETRY_TOTAL", 2)),
+        initial_backoff=0,
+        increment_base=2,
+        random_jitter_range=1,
+        connection_timeout=max(1, get_env_int("GRAPHRAG_BLOB_CONNECT_TIMEOUT", 5)),
+    ).get_container_client(container_name)
+
+
+def list_index_blobs(container_client: ContainerClient) -> list[BlobProperties]:
+    """Lists the blobs of the date-formatted index folders under `output/` (one listing)."""
+    blobs: list[BlobProperties] = []
+    for blob in container_client.list_blobs(name_starts_with="output/"):
+        # get outputs/ folder names
+        parts: list[str] = blob.name.split("/")
+        if len(parts) > 2 and is_date_format_folder(parts[1]):
+            blobs.append(blob)
+    logging.info(f"found {len(blobs)} index blobs in {container_client.container_name}")
+    return blobs
+
+
+class BlobSyncStats:
+    """
+    Counters of a sync run.
+
+    Attributes:
+        files (int): Blobs considered.
+        downloaded (int): Blobs downloaded (fully or resumed).
+        resumed (int): Downloads continued from an interrupted partial file.
+        skipped (int): Blobs unchanged since the last sync.
+        failed (int): Blobs that could not be downloaded.
+        bytes (int): Bytes transferred.
+        seconds (float): Wall time of the run.
+    """
+
+    def __init__(self):
+        self.files: int = 0
+        self.downloaded: int = 0
+        self.resumed: int = 0
+        self.skipped: int = 0
+        self.failed: int = 0
+        self.bytes: int = 0
+        self.seconds: float = 0.0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        return self.bytes / 1024**2 / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "files": self.files,
+            "downloaded": self.downloaded,
+            "resumed": self.resumed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "throughput_mb_s": round(self.throughput_mb_s, 2),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.downloaded} downloaded ({self.resumed} resumed), {self.skipped} unchanged, "
+            f"{self.failed} failed; {self.bytes / 1024**2:.1f} MB in {self.seconds:.1f}s "
+            f"({self.throughput_mb_s:.1f} MB/s)"
+        )
+
+
+class BlobManifest:
+    """
+    The ETag, MD5 and size of every blob synced into a local directory, kept in `.blob_manifest.json`.
+
+    A blob whose ETag and size match its entry, and whose local file has that size, is unchanged.
+    The manifest is rewritten (atomically) after every finished file, so an interrupted sync keeps
+    what it already downloaded.
+
+    Attributes:
+        path (str): The manifest file.
+        entries (dict[str, dict[str, Any]]): Entry per blob name.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.entries: dict[str, dict[str, Any]] = {}
+        self._lock: threading.Lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as fi:
+                    self.entries = json.load(fi)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"ignoring unreadable blob manifest {path}: {e}")
+
+    def get(self, name: str) -> dict[str, Any] | None:
+        with self._lock:
+            return self.entries.get(name)
+
+    def set(self, name: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[name] = entry
+            temp_path: str = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as fo:
+                json.dump(self.entries, fo, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+
+def sync_blobs(
+    container_client: ContainerClient,
+    blobs: list[BlobProperties],
+    dest_dir: str,
+    max_concurrency: int | None = None,
+    on_progress: Callable[[BlobSyncStats], None] | None = None,
+) -> BlobSyncStats:
+    """
+    Downloads blobs into `dest_dir/<blob name>`, skipping unchanged files.
+
+    Files are downloaded by a pool of `max_concurrency` threads (env:
+    GRAPHRAG_BLOB_DOWNLOAD_CONCURRENCY, default 8) and streamed chunk by chunk to
+    `<file>.part`, which is renamed once complete and checked against the blob's MD5. A `.part`
+    left by an interrupted sync is continued from its size if the blob's ETag did not change.
+
+    Args:
+        container_client (ContainerClient): The container holding the blobs.
+        blobs (list[BlobProperties]): Blobs to sync, as listed from the container.
+        dest_dir (str): Local root directory.
+        max_concurrency (int | None, optional): Parallel downloads. Defaults to None (env).
+        on_progress (Callable[[BlobSyncStats], None] | None, optional): Called after every file.
+
+    Returns:
+        BlobSyncStats: Counters and throughput of the run.
+    """
+    max_concurrency = max(
+        1,
+        max_concurrency
+        if max_concurrency is not None
+        else get_env_int("GRAPHRAG_BLOB_DOWNLOAD_CONCURRENCY", 8),
+    )
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest: BlobManifest = BlobManifest(os.path.join(dest_dir, MANIFEST_FILE))
+    stats: BlobSyncStats = BlobSyncStats()
+    stats_lock: threading.Lock = threading.Lock()
+    start: float = time.perf_counter()
+
+    def sync(blob: BlobProperties) -> None:
+        local_path: str = os.path.join(dest_dir, *blob.name.split("/"))
+        if is_unchanged(blob, local_path, manifest):
+            with stats_lock:
+                stats.skipped += 1
+            return
+        transferred, resumed = download_blob(container_client, blob, local_path)
+        manifest.set(blob.name, manifest_entry(blob))
+        with stats_lock:
+            stats.downloaded += 1
+            stats.resumed += int(resumed)
+            stats.bytes += transferred
+
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="blob-sync"
+    ) as executor:
+        futures: dict = {executor.submit(sync, blob): blob for blob in blobs}
+        for future in as_completed(futures):
+            with stats_lock:
+                stats.files += 1
+                stats.seconds = time.perf_counter() - start
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"failed to download {futures[future].name}: {e}")
+                with stats_lock:
+                    stats.failed += 1
+            if on_progress is not None:
+                on_progress(stats)
+
+    stats.seconds = time.perf_counter() - start
+    logging.info(f"blob sync to {dest_dir}: {stats.to_dict()}")
+    return stats
+
+
+def is_unchanged(
+    blob: BlobProperties, local_path: str, manifest: BlobManifest
+) -> bool:
+    """Whether the local file is the current version of the blob (manifest entry, else its MD5)."""
+    if not os.path.exists(local_path) or os.path.getsize(local_path) != blob.size:
+        return False
+    entry: dict[str, Any] | None = manifest.get(blob.name)
+    if entry is not None:
+        return entry.get("etag") == blob.etag and entry.get("size") == blob.size
+
+    # *a file downloaded before the manifest existed is adopted if its content matches
+    md5: str | None = blob_md5(blob)
+    if md5 is None or file_md5(local_path) != md5:
+        return False
+    manifest.set(blob.name, manifest_entry(blob))
+    return True
+
+
+def download_blob(
+    container_client: ContainerClient, blob: BlobProperties, local_path: str
+) -> tuple[int, bool]:
+    """
+    Streams a blob to `local_path`, continuing an interrupted `.part` of the same ETag.
+
+    Returns:
+        tuple[int, bool]: Bytes transferred, and whether a partial file was resumed.
+    """
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    partial_path: str = local_path + PARTIAL_SUFFIX
+    etag_path: str = partial_path + ".etag"
+
+    offset: int = 0
+    if os.path.exists(partial_path) and _read_text(etag_path) == blob.etag:
+        offset = min(os.path.getsize(partial_path), blob.size)
+    else:
+        with open(etag_path, "w", encoding="utf-8") as fo:
+            fo.write(blob.etag or "")
+    resumed: bool = offset > 0
+
+    transferred: int = 0
+    if offset < blob.size or blob.size == 0:
+        try:
+            # !the ETag condition fails the download if the blob changes while it streams
+            stream = container_client.download_blob(
+                blob.name,
+                offset=offset if offset else None,
+                etag=blob.etag,
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except ResourceModifiedError:
+            os.remove(etag_path)
+            raise
+        with open(partial_path, "ab" if resumed else "wb") as fo:
+            for chunk in stream.chunks():
+                fo.write(chunk)
+                transferred += len(chunk)
+
+    md5: str | None = blob_md5(blob)
+    if md5 is not None and file_md5(partial_path) != md5:
+        # !a corrupt partial file would be resumed forever, start over next time
+        os.remove(partial_path)
+        os.remove(etag_path)
+        raise ValueError(f"MD5 mismatch for {blob.name}")
+    os.replace(partial_path, local_path)
+    os.remove(etag_path)
+    return transferred, resumed
+
+
+def manifest_entry(blob: BlobProperties) -> dict[str, Any]:
+    return {
+        "etag": blob.etag,
+        "md5": blob_md5(blob),
+        "size": blob.size,
+        "last_modified": blob.last_modified.isoformat() if blob.last_modified else None,
+    }
+
+
+def blob_md5(blob: BlobProperties) -> str | None:
+    """The base64 Content-MD5 of a blob, None if the service did not store one."""
+    md5: bytes | bytearray | None = (
+        blob.content_settings.content_md5 if blob.content_settings else None
+    )
+    return base64.b64encode(bytes(md5)).decode("ascii") if md5 else None
+
+
+def file_md5(path: str, chunk_size: int = 4 * 1024**2) -> str:
+    """The base64 MD5 of a local file (the format of Content-MD5)."""
+    digest = hashlib.md5()
+    with open(path, "rb") as fi:
+        for chunk in iter(lambda: fi.read(chunk_size), b""):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+def _read_text(path: str) -> str | None:
+    try:
+        with open(path, encoding="utf-8") as fi:
+            return fi.read()
+    except OSError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--connection-string", required=True)
+    parser.add_argument("--container", required=True)
+    parser.add_argument("--dest", default="graphdata", help="local graphdata root directory")
+    parser.add_argument("--concurrency", type=int, default=None, help="parallel downloads")
+    args = parser.parse_args()
+    setup_logging()
+
+    container_client: ContainerClient = get_container_client(
+        args.connection_string, args.container
+    )
+    stats: BlobSyncStats = sync_blobs(
+        container_client,
+        list_index_blobs(container_client),
+        args.dest,
+        max_concurrency=args.concurrency,
+        on_progress=lambda stats: logging.info(f"[{stats.files}] {stats}"),
+    )
+    print(json.dumps(stats.to_dict(), indent=2))
+    if stats.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
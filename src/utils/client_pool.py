@@ -0,0 +1,161 @@
+﻿import hashlib
+import logging
+import threading
+
+import httpx
+from graphrag.query.llm.oai.chat_openai import ChatOpenAI
+from graphrag.query.llm.oai.embedding import OpenAIEmbedding
+from graphrag.query.llm.oai.typing import OpenaiApiType
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from src.utils.env_manager import get_env_int
+
+
+def fingerprint_api_key(api_key: str | None) -> str:
+    """Short hash identifying an API key, so keys never appear in pool keys or logs."""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class OpenAIClientPool:
+    """
+    Long-lived graphrag chat and embedding clients, shared by every session of the process.
+
+    Creating a `ChatOpenAI` or `OpenAIEmbedding` builds new OpenAI clients, each with its own HTTP
+    connection pool, so a client created per message pays a TCP/TLS handshake for every query.
+    Pooled clients are keyed by (api_base, deployment, api_version, API key fingerprint) plus the
+    model and retry setting, and keep their connections alive between queries
+    (GRAPHRAG_HTTP_KEEPALIVE_SECONDS, default 120; GRAPHRAG_HTTP_MAX_KEEPALIVE, default 100).
+
+    `clear()` drops every client; it is called when `update_llm_settings` reloads the configuration.
+
+    Attributes:
+        created (int): Number of clients built since the pool was created.
+        reused (int): Number of requests served by an existing client.
+    """
+
+    def __init__(self):
+        self.created: int = 0
+        self.reused: int = 0
+        self._clients: dict[tuple, ChatOpenAI | OpenAIEmbedding] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def chat(
+        self,
+        api_key: str | None,
+        model: str,
+        deployment_name: str | None,
+        api_base: str | None,
+        api_version: str | None,
+        max_retries: int = 10,
+    ) -> ChatOpenAI:
+        """Returns the pooled Azure OpenAI chat client of a configuration."""
+        key: tuple = (
+            "chat",
+            api_base,
+            deployment_name,
+            api_version,
+            fingerprint_api_key(api_key),
+            model,
+            max_retries,
+        )
+        return self._get(
+            key,
+            lambda: ChatOpenAI(
+                api_key=api_key,
+                model=model,
+                deployment_name=deployment_name,
+                api_base=api_base,
+                api_version=api_version,
+                api_type=OpenaiApiType.AzureOpenAI,
+                max_retries=max_retries,
+            ),
+        )
+
+    def embedding(
+        self,
+        api_key: str | None,
+        model: str,
+        deployment_name: str | None,
+        api_base: str | None,
+        api_version: str | None,
+        max_retries: int = 10,
+    ) -> OpenAIEmbedding:
+        """Returns the pooled Azure OpenAI embedding client of a configuration."""
+        key: tuple = (
+            "embedding",
+            api_base,
+            deployment_name,
+            api_version,
+            fingerprint_api_key(api_key),
+            model,
+            max_retries,
+        )
+        return self._get(
+            key,
+            lambda: OpenAIEmbedding(
+                api_key=api_key,
+                api_base=api_base,
+                api_version=api_version,
+                api_type=OpenaiApiType.AzureOpenAI,
+                model=model,
+                deployment_name=deployment_name,
+                max_retries=max_retries,
+            ),
+        )
+
+    def clear(self) -> None:
+        """Drops every pooled client (closing the synchronous connection pools)."""
+        with self._lock:
+            clients: list[ChatOpenAI | OpenAIEmbedding] = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.sync_client.close()
+            except Exception as e:
+                logging.warning(f"failed to close openai client: {e}")
+        # *async connection pools belong to the event loop that used them, they are released with the clients
+        logging.info(f"openai client pool cleared ({len(clients)} clients)")
+
+    def stats(self) -> dict:
+        """Pool size and reuse counters."""
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+    def _get(self, key: tuple, factory) -> ChatOpenAI | OpenAIEmbedding:
+        with self._lock:
+            client: ChatOpenAI | OpenAIEmbedding | None = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            client = factory()
+            self._keep_alive(client)
+            self._clients[key] = client
+            self.created += 1
+        logging.info(
+            f"openai client created: {key[0]} {key[1]} {key[2]} (key {key[4]})"
+        )
+        return client
+
+    @staticmethod
+    def _keep_alive(client: ChatOpenAI | OpenAIEmbedding) -> None:
+        # !graphrag builds its OpenAI clients with the default 5s keep-alive, longer than typical
+        # !pauses between two chat messages would close the connection again
+        limits: httpx.Limits = httpx.Limits(
+            max_connections=1000,
+            max_keepalive_connections=get_env_int("GRAPHRAG_HTTP_MAX_KEEPALIVE", 100),
+            keepalive_expiry=get_env_int("GRAPHRAG_HTTP_KEEPALIVE_SECONDS", 120),
+        )
+        client.set_clients(
+            sync_client=client.sync_client.with_options(
+                http_client=DefaultHttpxClient(limits=limits)
+            ),
+            async_client=client.async_client.with_options(
+                http_client=DefaultAsyncHttpxClient(limits=limits)
+            ),
+        )
@@ -0,0 +1,371 @@
+﻿"""
+Compiles GraphRAG index folders into query snapshots that open without parsing parquet.
+
+Usage:
+    python -m src.utils.compiled_index --root graphdata [20240923-101940 ...]
+
+Every date folder of `<root>/output` is compiled when no folder is given. A snapshot is stored in
+`<artifacts_folder>/compiled` and is only used while the folder's parquet artifacts are unchanged.
+On Windows, compile while the app is stopped: a snapshot the app has open cannot be replaced.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.graph.graph_layout import load_graph_layout
+from src.utils.df_manager import QUERY_COLUMNS, get_artifacts_signature, open_tables
+from src.utils.embedding_index import ensure_entity_embedding_index
+from src.utils.env_manager import get_env_int
+from src.utils.lazy_table import LazyTable
+from src.utils.level_partitions import Partitions, partition_levels
+from src.utils.logging_manager import setup_logging
+
+# !bump this when the snapshot layout changes to ignore snapshots compiled before
+COMPILED_INDEX_VERSION: int = 1
+COMPILED_DIR: str = "compiled"
+MANIFEST_NAME: str = "manifest.json"
+# *stored as a float32 matrix instead of an Arrow list column
+EMBEDDING_COLUMN: str = "description_embedding"
+EMBEDDINGS_NAME: str = "entity_embeddings.npy"
+LEVEL_ENTITIES_NAME: str = "level_entities.arrow"
+LEVEL_REPORTS_NAME: str = "level_reports.arrow"
+
+
+class CompiledTable(LazyTable):
+    """
+    A compiled table, read from a memory-mapped Arrow IPC file instead of its parquet artifact.
+
+    Opening it maps the file without reading it, and columns are materialized on first request
+    as with `LazyTable`, but without decompressing or decoding parquet pages. The description
+    embeddings of `create_final_entities` come from the snapshot's float32 matrix, as read-only
+    row views of the mapped file. Mapped pages are shared through the page cache by every process
+    that opens the same snapshot.
+
+    Attributes:
+        path (str): Path of the parquet artifact the table was compiled from (file stats of
+                    sidecars and the graph layout stay stamped with it).
+        file (str): Path of the Arrow IPC file.
+        columns (list[str]): Data columns available in the snapshot.
+        num_rows (int): Number of rows.
+        frame (pd.DataFrame): The columns materialized so far.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file: str,
+        embeddings_file: str | None = None,
+        missing_embeddings: list[int] | None = None,
+    ):
+        self.path: str = path
+        self.file: str = file
+        # *kept open: the record batches are zero-copy views of the mapping
+        self._arrow: pa.Table = pa.ipc.open_file(pa.memory_map(file)).read_all()
+        self._embeddings_file: str | None = embeddings_file
+        self._missing_embeddings: list[int] = missing_embeddings or []
+        self.columns: list[str] = [
+            name
+            for name in self._arrow.column_names
+            if not name.startswith("__index_level_")
+        ] + ([EMBEDDING_COLUMN] if embeddings_file else [])
+        self.num_rows: int = self._arrow.num_rows
+        self.frame: pd.DataFrame = pd.DataFrame()
+        self._lock: threading.Lock = threading.Lock()
+
+    def _read(self, columns: list[str]) -> pd.DataFrame:
+        arrow_columns: list[str] = [
+            column for column in columns if column != EMBEDDING_COLUMN
+        ]
+        df: pd.DataFrame = (
+            self._arrow.select(arrow_columns).to_pandas(split_blocks=True)
+            if arrow_columns
+            else pd.DataFrame(index=pd.RangeIndex(self.num_rows))
+        )
+        if EMBEDDING_COLUMN in columns and self._embeddings_file:
+            # *plain ndarray rows: slicing a np.memmap row by row is several times slower
+            matrix: np.ndarray = np.asarray(np.load(self._embeddings_file, mmap_mode="r"))
+            rows: list[np.ndarray | None] = list(matrix)
+            for row in self._missing_embeddings:
+                rows[row] = None
+            df[EMBEDDING_COLUMN] = rows
+        return df
+
+    def _column_bytes(self, columns: list[str]) -> int:
+        nbytes: int = sum(
+            self._arrow.column(column).nbytes
+            for column in columns
+            if column in self._arrow.column_names
+        )
+        if EMBEDDING_COLUMN in columns and self._embeddings_file:
+            nbytes += os.path.getsize(self._embeddings_file)
+        return nbytes
+
+
+class CompiledIndex:
+    """
+    An opened compiled snapshot of an index folder.
+
+    Attributes:
+        directory (str): The snapshot's directory (`<artifacts_folder>/compiled`).
+        manifest (dict): Its manifest (version, artifacts signature, tables, levels).
+        tables (dict[str, CompiledTable]): Tables keyed by DataFrame name, as `open_tables` returns.
+    """
+
+    def __init__(self, artifacts_folder: str, directory: str, manifest: dict):
+        self.directory: str = directory
+        self.manifest: dict = manifest
+        self.tables: dict[str, CompiledTable] = {}
+        for df_name, spec in manifest["tables"].items():
+            embeddings: dict | None = spec.get("embeddings")
+            self.tables[df_name] = CompiledTable(
+                os.path.join(artifacts_folder, spec["source"]),
+                os.path.join(directory, spec["file"]),
+                os.path.join(directory, embeddings["file"]) if embeddings else None,
+                embeddings["missing_rows"] if embeddings else None,
+            )
+        self._partitions: Partitions | None = None
+
+    def level_partitions(self) -> Partitions:
+        """The precomputed entity and report partitions of every level (see `partition_levels`)."""
+        if self._partitions is None:
+            self._partitions = (
+                list(self.manifest["levels"]),
+                _read_arrow(os.path.join(self.directory, LEVEL_ENTITIES_NAME)),
+                _read_arrow(os.path.join(self.directory, LEVEL_REPORTS_NAME)),
+            )
+        return self._partitions
+
+
+def open_compiled_index(
+    artifacts_folder: str, signature: tuple
+) -> CompiledIndex | None:
+    """
+    Opens the compiled snapshot of an index folder if it was compiled from the current artifacts.
+
+    Args:
+        artifacts_folder (str): The folder path where the data files are stored.
+        signature (tuple): The folder's current `get_artifacts_signature`.
+
+    Returns:
+        CompiledIndex | None: The snapshot, None if it is missing, stale, broken or disabled
+                                (env: GRAPHRAG_COMPILED_INDEX=0).
+    """
+    if get_env_int("GRAPHRAG_COMPILED_INDEX", 1) <= 0:
+        return None
+    directory: str = os.path.join(artifacts_folder, COMPILED_DIR)
+    manifest_path: str = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, encoding="utf-8") as fi:
+            manifest: dict = json.load(fi)
+        if manifest.get("version") != COMPILED_INDEX_VERSION or manifest.get(
+            "signature"
+        ) != [list(entry) for entry in signature]:
+            logging.info(f"Compiled index {directory} is stale, read the artifacts")
+            return None
+        compiled: CompiledIndex = CompiledIndex(artifacts_folder, directory, manifest)
+    except (OSError, ValueError, KeyError, pa.ArrowException) as e:
+        logging.warning(f"Ignore broken compiled index {directory}: {e}")
+        return None
+    logging.info(f"Opened compiled index {directory}")
+    return compiled
+
+
+def compile_index(artifacts_folder: str) -> dict | None:
+    """
+    Compiles an index folder into a snapshot that `open_compiled_index` maps instead of reading parquet.
+
+    The snapshot holds one uncompressed Arrow IPC file per table with the columns of every query
+    path (`QUERY_COLUMNS`), the description embeddings as a float32 (entities, dimensions) `.npy`
+    matrix, and the per-level entity and report partitions, already joined to their entity and
+    report rows. The folder's graph layout and entity embedding index are built on the way, so the
+    first queries only open files. The snapshot directory is replaced atomically; on Windows this
+    fails while an app has the previous snapshot open, which is then kept.
+
+    Args:
+        artifacts_folder (str): The folder path where the data files are stored.
+
+    Returns:
+        dict | None: The manifest of the snapshot (None if the previous snapshot was kept).
+    """
+    start: float = time.perf_counter()
+    signature: tuple = get_artifacts_signature(artifacts_folder)
+    tables: dict[str, LazyTable] = open_tables(artifacts_folder)
+    directory: str = os.path.join(artifacts_folder, COMPILED_DIR)
+    tmp_directory: str = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    manifest: dict = {
+        "version": COMPILED_INDEX_VERSION,
+        "signature": [list(entry) for entry in signature],
+        "tables": {},
+        "levels": [],
+        "compiled_at": datetime.now().isoformat(),
+    }
+    frames: dict[str, pd.DataFrame] = {}
+    for df_name, table in tables.items():
+        wanted: set[str] | None = _compiled_columns(df_name)
+        arrow_table: pa.Table = pq.read_table(
+            table.path,
+            columns=[
+                column
+                for column in table.columns
+                if wanted is None or column in wanted
+            ],
+        )
+        spec: dict = {
+            "source": os.path.basename(table.path),
+            "file": f"{df_name}.arrow",
+            "rows": arrow_table.num_rows,
+        }
+        frames[df_name] = arrow_table.to_pandas()
+        if EMBEDDING_COLUMN in arrow_table.column_names:
+            matrix, missing_rows = _embedding_matrix(arrow_table.column(EMBEDDING_COLUMN))
+            np.save(os.path.join(tmp_directory, EMBEDDINGS_NAME), matrix)
+            spec["embeddings"] = {
+                "file": EMBEDDINGS_NAME,
+                "dimensions": int(matrix.shape[1]),
+                "missing_rows": missing_rows,
+            }
+            arrow_table = arrow_table.drop_columns([EMBEDDING_COLUMN])
+        _write_arrow(os.path.join(tmp_directory, spec["file"]), arrow_table)
+        manifest["tables"][df_name] = spec
+
+    empty: pd.DataFrame = pd.DataFrame()
+    entity_df: pd.DataFrame = frames.get("entity_df", empty)
+    if not entity_df.empty:
+        levels, level_entities, level_reports = partition_levels(
+            entity_df,
+            frames.get("report_df", empty),
+            frames.get("entity_embedding_df", empty),
+        )
+        manifest["levels"] = levels
+    else:
+        level_entities, level_reports = (
+            pd.DataFrame({"level": [], "row": [], "community": [], "rank": []}, dtype="int64"),
+            pd.DataFrame({"level": [], "row": []}, dtype="int64"),
+        )
+    _write_arrow(
+        os.path.join(tmp_directory, LEVEL_ENTITIES_NAME),
+        pa.Table.from_pandas(level_entities, preserve_index=False),
+    )
+    _write_arrow(
+        os.path.join(tmp_directory, LEVEL_REPORTS_NAME),
+        pa.Table.from_pandas(level_reports, preserve_index=False),
+    )
+
+    # *sidecars the first queries would otherwise build, stamped with the artifacts themselves
+    if "relationship_df" in tables:
+        load_graph_layout(
+            tables["relationship_df"].path,
+            frames["relationship_df"],
+            tables["entity_df"].path if "entity_df" in tables else None,
+        )
+    ensure_entity_embedding_index(
+        artifacts_folder, frames.get("entity_embedding_df", empty)
+    )
+
+    with open(os.path.join(tmp_directory, MANIFEST_NAME), "w", encoding="utf-8") as fo:
+        json.dump(manifest, fo, indent=2)
+    # !readers that mapped the previous snapshot keep their (unlinked) files
+    old_directory: str = f"{directory}.old-{os.getpid()}"
+    try:
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+    except OSError as e:
+        # !Windows does not rename a directory while a running app has its files mapped
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        logging.warning(
+            f"Kept the previous snapshot of {artifacts_folder}, it is in use ({str(e)}); "
+            "stop the app and compile again (until then, changed artifacts are read from parquet)"
+        )
+        return None
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    logging.info(
+        f"Compiled {len(manifest['tables'])} tables of {artifacts_folder} "
+        f"in {time.perf_counter() - start:.3f}s -> {directory}"
+    )
+    return manifest
+
+
+def _compiled_columns(df_name: str) -> set[str] | None:
+    """Columns of a table read by any query path, None for every column."""
+    columns: set[str] = set()
+    for query_columns in QUERY_COLUMNS.values():
+        if df_name in query_columns:
+            if query_columns[df_name] is None:
+                return None
+            columns.update(query_columns[df_name])
+    return columns
+
+
+def _embedding_matrix(column: pa.ChunkedArray) -> tuple[np.ndarray, list[int]]:
+    """A float32 (rows, dimensions) matrix of a list column, and the rows without a vector (left at zero)."""
+    embeddings: pa.Array = column.combine_chunks()
+    lengths: np.ndarray = (
+        pc.fill_null(pc.list_value_length(embeddings), 0).to_numpy().astype(np.int64)
+    )
+    valid: np.ndarray = embeddings.is_valid().to_numpy(zero_copy_only=False) & (lengths > 0)
+    dimensions: int = int(lengths.max()) if len(lengths) else 0
+    if (lengths[valid] != dimensions).any():
+        raise ValueError(f"{EMBEDDING_COLUMN} vectors have different dimensions")
+    matrix: np.ndarray = np.zeros((len(embeddings), dimensions), dtype=np.float32)
+    if valid.any():
+        values: np.ndarray = embeddings.filter(pa.array(valid)).flatten().to_numpy(
+            zero_copy_only=False
+        )
+        matrix[valid] = values.astype(np.float32).reshape(-1, dimensions)
+    return matrix, np.flatnonzero(~valid).tolist()
+
+
+def _write_arrow(path: str, table: pa.Table) -> None:
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_arrow(path: str) -> pd.DataFrame:
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("folders", nargs="*", help="index folders (default: every folder)")
+    parser.add_argument("--root", default="graphdata", help="local graphdata root directory")
+    args = parser.parse_args()
+    setup_logging()
+
+    output_dir: str = os.path.join(args.root, "output")
+    folders: list[str] = args.folders or sorted(
+        folder
+        for folder in os.listdir(output_dir)
+        if os.path.isdir(os.path.join(output_dir, folder, "artifacts"))
+    )
+    summary: dict[str, dict] = {}
+    for folder in folders:
+        manifest: dict | None = compile_index(os.path.join(output_dir, folder, "artifacts"))
+        summary[folder] = (
+            {df_name: spec["rows"] for df_name, spec in manifest["tables"].items()}
+            if manifest is not None
+            else {"kept": "previous snapshot in use"}
+        )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
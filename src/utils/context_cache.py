@@ -0,0 +1,172 @@
+﻿import logging
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from graphrag.query.context_builder.builders import (
+    GlobalContextBuilder,
+    LocalContextBuilder,
+)
+
+from src.utils.env_manager import get_env_int
+
+# *(index folder name, query type, community level)
+CacheKey = tuple[str, str, int]
+
+
+class ContextBuilderCacheEntry:
+    """
+    A built context builder together with the graphrag model lists it was created from.
+
+    Attributes:
+        context_builder (GlobalContextBuilder | LocalContextBuilder): The ready-to-use context builder.
+        models (dict[str, Any]): Converted model lists (reports, entities, text units ...) keyed by name.
+        signature (tuple): Artifacts signature of the index folder at build time.
+        nbytes (int): Estimated memory footprint of the entry.
+    """
+
+    def __init__(
+        self,
+        context_builder: GlobalContextBuilder | LocalContextBuilder,
+        models: dict[str, Any],
+        signature: tuple,
+        nbytes: int,
+    ):
+        self.context_builder: GlobalContextBuilder | LocalContextBuilder = (
+            context_builder
+        )
+        self.models: dict[str, Any] = models
+        self.signature: tuple = signature
+        self.nbytes: int = nbytes
+
+
+class ContextBuilderCache:
+    """
+    A bounded LRU cache of built graphrag context builders.
+
+    Entries are keyed by (index folder, query type, community level) and are evicted
+    least-recently-used first whenever the entry count or the estimated memory budget
+    is exceeded. An entry is dropped on lookup if the artifacts signature of its
+    folder has changed since it was built.
+
+    The cache is owned by the process-wide `IndexRegistry`, so every Gradio session shares it.
+
+    Attributes:
+        max_bytes (int): Memory budget for all entries (env: GRAPHRAG_CONTEXT_CACHE_MAX_MB, default 1024).
+        max_entries (int): Maximum number of entries (env: GRAPHRAG_CONTEXT_CACHE_MAX_ENTRIES, default 16).
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that required a rebuild.
+        evictions (int): Number of entries evicted due to the budget.
+        invalidations (int): Number of entries dropped due to changed artifacts.
+    """
+
+    def __init__(
+        self, max_bytes: int | None = None, max_entries: int | None = None
+    ):
+        self.max_bytes: int = (
+            max_bytes
+            if max_bytes is not None
+            else get_env_int("GRAPHRAG_CONTEXT_CACHE_MAX_MB", 1024) * 1024**2
+        )
+        self.max_entries: int = (
+            max_entries
+            if max_entries is not None
+            else get_env_int("GRAPHRAG_CONTEXT_CACHE_MAX_ENTRIES", 16)
+        )
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+        self._entries: OrderedDict[CacheKey, ContextBuilderCacheEntry] = (
+            OrderedDict()
+        )
+        self._lock: threading.RLock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory footprint of all cached entries."""
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(
+        self, key: CacheKey, signature: tuple
+    ) -> ContextBuilderCacheEntry | None:
+        """
+        Looks up a context builder and marks it as most recently used.
+
+        Args:
+            key (CacheKey): (index folder, query type, community level).
+            signature (tuple): Current artifacts signature of the index folder.
+
+        Returns:
+            ContextBuilderCacheEntry | None: The cached entry, or None on a miss or a stale entry.
+        """
+        with self._lock:
+            entry: ContextBuilderCacheEntry | None = self._entries.get(key)
+            if entry is not None and entry.signature != signature:
+                logging.info(f"context builder cache: artifacts changed {key}")
+                del self._entries[key]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, entry: ContextBuilderCacheEntry) -> None:
+        """
+        Stores a context builder and evicts least-recently-used entries over budget.
+
+        Args:
+            key (CacheKey): (index folder, query type, community level).
+            entry (ContextBuilderCacheEntry): The entry to store.
+        """
+        if entry.nbytes > self.max_bytes:
+            logging.warning(
+                f"context builder cache: {key} needs {entry.nbytes} bytes, "
+                f"more than the budget {self.max_bytes}. Not cached."
+            )
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            total: int = sum(e.nbytes for e in self._entries.values())
+            while len(self._entries) > self.max_entries or total > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                total -= evicted.nbytes
+                self.evictions += 1
+                logging.info(f"context builder cache: evicted {evicted_key}")
+
+    def invalidate(self, folder: str | None = None) -> None:
+        """
+        Drops cached entries.
+
+        Args:
+            folder (str | None, optional): Only drop entries of this index folder. Defaults to None (drop all).
+        """
+        with self._lock:
+            keys: list[CacheKey] = [
+                key
+                for key in self._entries
+                if folder is None or key[0] == folder
+            ]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current memory usage of the cache."""
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,174 @@
+﻿import html
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.utils.env_manager import get_env_int
+
+# *information panels of a chat response, in the order of the UI outputs
+PANELS: tuple[str, ...] = ("entities", "relationships", "sources", "reports")
+
+
+class ContextTable:
+    """
+    The records of one information panel of a response, rendered to HTML a page at a time.
+
+    A table is rendered either as an HTML table of `columns` (entities, relationships, global
+    search reports) or as one section per record, a `<h5>` heading followed by the record's raw
+    content (sources, local search reports). Rows are rendered with column-wise string operations,
+    so a page costs the same whatever the row count of the table.
+
+    Attributes:
+        records (pd.DataFrame): The records of the panel.
+        columns (list[str] | None): Columns of the HTML table, None for sections.
+        section (tuple[str, str, str] | None): (title column, content column, heading with a `{}`
+                                                for the title) of the sections, None for a table.
+        empty_html (str): HTML shown when there are no records.
+    """
+
+    def __init__(
+        self,
+        records: pd.DataFrame,
+        columns: list[str] | None = None,
+        section: tuple[str, str, str] | None = None,
+        empty_html: str = "<p>No Data Available</p>",
+    ):
+        self.records: pd.DataFrame = records.reset_index(drop=True)
+        self.columns: list[str] | None = columns
+        self.section: tuple[str, str, str] | None = section
+        self.empty_html: str = empty_html
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def page_count(self, page_rows: int) -> int:
+        return max(1, -(-len(self.records) // page_rows))
+
+    def render_page(self, page: int, page_rows: int | None = None) -> tuple[str, int]:
+        """
+        Renders one page of the table.
+
+        Args:
+            page (int): Page index, clamped to the existing pages.
+            page_rows (int | None, optional): Rows per page. Defaults to None
+                                                (env: GRAPHRAG_CONTEXT_PAGE_ROWS, default 20).
+
+        Returns:
+            tuple[str, int]: The HTML of the page, and the page index actually rendered.
+        """
+        if self.records.empty:
+            return self.empty_html, 0
+        page_rows = max(
+            1,
+            page_rows
+            if page_rows is not None
+            else get_env_int("GRAPHRAG_CONTEXT_PAGE_ROWS", 20),
+        )
+        page = min(max(page, 0), self.page_count(page_rows) - 1)
+        rows: pd.DataFrame = self.records.iloc[page * page_rows : (page + 1) * page_rows]
+        body: str = (
+            render_sections(rows, *self.section)
+            if self.section is not None
+            else render_table(rows, self.columns or list(rows.columns))
+        )
+        first: int = page * page_rows + 1
+        footer: str = (
+            f'<p class="context-table-footer">Rows {first}-{first + len(rows) - 1} of '
+            f"{len(self.records)} (page {page + 1} of {self.page_count(page_rows)})</p>"
+        )
+        return body + footer, page
+
+
+def render_table(records: pd.DataFrame, columns: list[str]) -> str:
+    """Renders the records as an HTML table like `DataFrame.to_html(index=False)` (escaped cells)."""
+    columns = [column for column in columns if column in records.columns]
+    header: str = "".join(f"<th>{html.escape(str(column))}</th>" for column in columns)
+    rows: pd.Series = pd.Series("<tr>", index=records.index)
+    for column in columns:
+        rows = rows + "<td>" + _escape(records[column]) + "</td>"
+    return (
+        '<table border="1" class="dataframe">\n'
+        f'<thead><tr style="text-align: right;">{header}</tr></thead>\n'
+        "<tbody>\n" + "\n".join((rows + "</tr>").tolist()) + "\n</tbody>\n</table>"
+    )
+
+
+def render_sections(
+    records: pd.DataFrame, title_column: str, content_column: str, heading: str
+) -> str:
+    """Renders every record as a `<h5>` heading (`heading` formatted with the title) and its raw content."""
+    prefix, _, suffix = heading.partition("{}")
+    titles: pd.Series = records[title_column].fillna("").astype(str)
+    contents: pd.Series = records[content_column].fillna("").astype(str)
+    return "".join(
+        ("\n\n<h5>" + prefix + titles + suffix + "</h5>\n" + contents).tolist()
+    )
+
+
+def _escape(values: pd.Series) -> pd.Series:
+    text: pd.Series = values.astype(object).where(values.notna(), "").astype(str)
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;")):
+        text = text.str.replace(char, entity, regex=False)
+    return text
+
+
+class ContextTableStore:
+    """
+    A bounded LRU store of the context tables of recent chat responses.
+
+    A response publishes its tables here and only sends a small placeholder per panel to the
+    browser; pages are rendered from the stored records when a panel is opened or paged. The store
+    is process-wide, sessions only keep the id of their last response.
+
+    Attributes:
+        max_entries (int): Maximum number of stored responses (env: GRAPHRAG_CONTEXT_TABLES_MAX_RESPONSES,
+                            default 256).
+    """
+
+    def __init__(self, max_entries: int | None = None):
+        self.max_entries: int = (
+            max_entries
+            if max_entries is not None
+            else get_env_int("GRAPHRAG_CONTEXT_TABLES_MAX_RESPONSES", 256)
+        )
+        self._entries: OrderedDict[str, dict[str, ContextTable]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def put(
+        self, tables: dict[str, ContextTable], response_id: str | None = None
+    ) -> str:
+        """
+        Stores the tables of a response and returns their id.
+
+        Args:
+            tables (dict[str, ContextTable]): Table per panel.
+            response_id (str | None, optional): Id of tables to replace, so an update of the same
+                                                response takes no new slot. Defaults to None (new id).
+
+        Returns:
+            str: The id of the stored tables.
+        """
+        response_id = response_id or secrets.token_hex(8)
+        with self._lock:
+            self._entries[response_id] = tables
+            self._entries.move_to_end(response_id)
+            while len(self._entries) > max(1, self.max_entries):
+                evicted_id, _ = self._entries.popitem(last=False)
+                logging.debug(f"context tables: evicted {evicted_id}")
+        return response_id
+
+    def get(self, response_id: str | None, panel: str) -> ContextTable | None:
+        """The table of a panel of a response, None if unknown or evicted."""
+        with self._lock:
+            tables: dict[str, ContextTable] | None = self._entries.get(response_id)
+            if tables is None:
+                return None
+            self._entries.move_to_end(response_id)
+            return tables.get(panel)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"responses": len(self._entries), "max_entries": self.max_entries}
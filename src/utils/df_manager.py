@@ -1,60 +1,205 @@
 ﻿import glob
 import logging
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import pandas as pd
 
-from src.state.state_model import StateModel
+from src.utils.lazy_table import LazyTable, log_load_stats
+from src.utils.tracing import span
 
+# *graphrag artifact read into each index DataFrame
+TABLES: dict[str, str] = {
+    "entity_df": "create_final_nodes",
+    "relationship_df": "create_final_relationships",
+    "text_unit_df": "create_final_text_units",
+    "report_df": "create_final_community_reports",
+    "entity_embedding_df": "create_final_entities",
+    "covariate_df": "create_final_covariates",
+}
 
-def read_df(artifacts_folder: str, state: StateModel):
+# !columns the graphrag indexer adapters read per query path (None means every column).
+# !tables missing from a query path are not read at all.
+QUERY_COLUMNS: dict[str, dict[str, list[str] | None]] = {
+    "global": {
+        "entity_df": ["title", "degree", "community", "level"],
+        "report_df": [
+            "community",
+            "level",
+            "title",
+            "summary",
+            "full_content",
+            "rank",
+        ],
+        "entity_embedding_df": [
+            "id",
+            "name",
+            "type",
+            "human_readable_id",
+            "description",
+            "text_unit_ids",
+        ],
+    },
+    "local": {
+        "entity_df": ["title", "degree", "community", "level"],
+        "report_df": [
+            "community",
+            "level",
+            "title",
+            "summary",
+            "full_content",
+            "rank",
+        ],
+        "entity_embedding_df": [
+            "id",
+            "name",
+            "type",
+            "human_readable_id",
+            "description",
+            "text_unit_ids",
+            "description_embedding",
+        ],
+        "relationship_df": [
+            "id",
+            "human_readable_id",
+            "source",
+            "target",
+            "description",
+            "weight",
+            "rank",
+            "text_unit_ids",
+        ],
+        "text_unit_df": [
+            "id",
+            "text",
+            "n_tokens",
+            "document_ids",
+            "entity_ids",
+            "relationship_ids",
+        ],
+        "covariate_df": None,
+    },
+}
+
+
+def read_df(
+    artifacts_folder: str,
+    query_type: str | None = None,
+    tables: dict[str, LazyTable] | None = None,
+) -> dict[str, LazyTable]:
     """
-    Reads data from Parquet files located in the specified 'artifacts' folder and stores it in global DataFrames.
+    Reads data from Parquet files located in the specified 'artifacts' folder.
+
+    The tables are read concurrently, and only the columns the given query path needs are read.
+    Files are opened as `LazyTable`s, so calling this again with the returned tables only reads
+    the columns that are still missing (e.g. the heavy `text` and `description_embedding`
+    columns on the first local query after global ones).
 
     Args:
         artifacts_folder (str): The folder path where the data files are stored.
+        query_type (str | None, optional): "global" or "local" to read only the columns of that query path.
+                                            Defaults to None (every column of every table).
+        tables (dict[str, LazyTable] | None, optional): Tables opened by a previous call for the same folder.
+                                                        Defaults to None (open the folder again).
+
+    Returns:
+        dict[str, LazyTable]: Tables keyed by DataFrame name, with the requested columns materialized:
+            entity_df (create_final_nodes), relationship_df (create_final_relationships),
+            text_unit_df (create_final_text_units), report_df (create_final_community_reports),
+            entity_embedding_df (create_final_entities), covariate_df (create_final_covariates).
+    """
+    if tables is None:
+        tables = open_tables(artifacts_folder)
 
-    Globals:
-        entity_df (pd.DataFrame): DataFrame for entity data.
-        relationship_df (pd.DataFrame): DataFrame for relationship data.
-        text_unit_df (pd.DataFrame): DataFrame for text unit data.
-        report_df (pd.DataFrame): DataFrame for report data.
-        entity_embedding_df (pd.DataFrame): DataFrame for entity embedding data.
-        covariate_df (pd.DataFrame): DataFrame for covariate data.
-    """
-    tables = {
-        "entity_df": "create_final_nodes",
-        "relationship_df": "create_final_relationships",
-        "text_unit_df": "create_final_text_units",
-        "report_df": "create_final_community_reports",
-        "entity_embedding_df": "create_final_entities",
-        "covariate_df": "create_final_covariates",
+    columns: dict[str, list[str] | None] = (
+        QUERY_COLUMNS[query_type]
+        if query_type in QUERY_COLUMNS
+        else {df_name: None for df_name in TABLES}
+    )
+    requested: dict[str, LazyTable] = {
+        df_name: table
+        for df_name, table in tables.items()
+        if df_name in columns and table.missing_columns(columns[df_name])
     }
+    if requested:
+        with span(
+            "read_df", query_type=query_type, tables=sorted(requested)
+        ) as read_span:
+            start: float = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(requested)) as executor:
+                futures: dict[str, Future] = {
+                    df_name: executor.submit(table.load, columns[df_name])
+                    for df_name, table in requested.items()
+                }
+                stats: dict[str, dict] = {
+                    df_name: future.result() for df_name, future in futures.items()
+                }
+            read_span.set_attributes(
+                columns=sum(len(s["columns"]) for s in stats.values()),
+                bytes=sum(s["bytes"] for s in stats.values()),
+            )
+        log_load_stats(stats, time.perf_counter() - start)
+    return tables
 
-    for df_name, file_prefix in tables.items():
+
+def open_tables(artifacts_folder: str) -> dict[str, LazyTable]:
+    """
+    Opens the latest parquet file of each graphrag table in the folder without reading any column.
+
+    Args:
+        artifacts_folder (str): The folder path where the data files are stored.
+
+    Returns:
+        dict[str, LazyTable]: Lazily loaded tables keyed by DataFrame name.
+    """
+    tables: dict[str, LazyTable] = {}
+    for df_name, file_prefix in TABLES.items():
         file_pattern = os.path.join(
             artifacts_folder, f"{file_prefix}*.parquet"
         )
         matching_files = glob.glob(file_pattern)
         if matching_files:
             latest_file = max(matching_files, key=os.path.getctime)
-            df = pd.read_parquet(latest_file)
-            if df_name == "entity_df":
-                state.entity_df = df
-            if df_name == "relationship_df":
-                state.relationship_df = df
-            if df_name == "text_unit_df":
-                state.text_unit_df = df
-            if df_name == "report_df":
-                state.report_df = df
-            if df_name == "entity_embedding_df":
-                state.entity_embedding_df = df
-            if df_name == "covariate_df":
-                state.covariate_df = df
-
-            # globals()[df_name] = df
-            logging.info(f"Successfully loaded {df_name} from {latest_file}")
+            tables[df_name] = LazyTable(latest_file)
+            logging.info(f"Successfully opened {df_name} from {latest_file}")
         else:
             logging.warning(
                 f"No matching file found for {df_name} in {artifacts_folder}. Initializing as an empty DataFrame."
             )
+    return tables
+
+
+def get_artifacts_signature(artifacts_folder: str) -> tuple:
+    """
+    Builds a cheap signature of the parquet artifacts in the specified folder.
+
+    The signature is made of the file name, modification time and size of every parquet file,
+    so it changes whenever graphrag re-writes or a storage download replaces an artifact.
+
+    Args:
+        artifacts_folder (str): The folder path where the data files are stored.
+
+    Returns:
+        tuple: A sorted tuple of (file name, mtime in ns, size in bytes) entries.
+    """
+    signature: list[tuple[str, int, int]] = []
+    for path in glob.glob(os.path.join(artifacts_folder, "*.parquet")):
+        stat: os.stat_result = os.stat(path)
+        signature.append(
+            (os.path.basename(path), stat.st_mtime_ns, stat.st_size)
+        )
+    return tuple(sorted(signature))
+
+
+def estimate_df_bytes(*dfs: pd.DataFrame) -> int:
+    """
+    Estimates the in-memory size of the given DataFrames, including python string objects.
+
+    Args:
+        *dfs (pd.DataFrame): DataFrames to measure.
+
+    Returns:
+        int: The total number of bytes used by the DataFrames.
+    """
+    return int(sum(df.memory_usage(index=True, deep=True).sum() for df in dfs))
@@ -0,0 +1,104 @@
+﻿import logging
+import re
+import threading
+import unicodedata
+from typing import Any
+
+import numpy as np
+from diskcache import Cache
+from graphrag.query.llm.base import BaseTextEmbedding
+
+from src.utils.tracing import span
+
+
+def normalize_query_text(text: str) -> str:
+    """Normalizes a query for cache lookups (unicode NFKC, collapsed whitespace)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedTextEmbedding(BaseTextEmbedding):
+    """
+    A text embedder that looks query embeddings up in a disk-backed cache before calling the API.
+
+    Entries are keyed by (normalized text, embedding model, deployment), so repeated or templated
+    questions are embedded once, also across restarts, and changing the embedding settings never
+    returns vectors of another model. Vectors are stored as float32 bytes. The size bound and
+    least-recently-used eviction are handled by the `diskcache.Cache` (see `shared_resources`).
+
+    Attributes:
+        embedder (BaseTextEmbedding): The wrapped embedder (e.g. `OpenAIEmbedding`) called on a miss.
+        cache (Cache): The disk-backed cache shared by every embedder of the process.
+        model (str): Embedding model name, part of the cache key.
+        deployment_name (str | None): Embedding deployment name, part of the cache key.
+        hits (int): Number of embeddings served from the cache.
+        misses (int): Number of embeddings requested from the wrapped embedder.
+    """
+
+    def __init__(
+        self,
+        embedder: BaseTextEmbedding,
+        cache: Cache,
+        model: str,
+        deployment_name: str | None = None,
+    ):
+        self.embedder: BaseTextEmbedding = embedder
+        self.cache: Cache = cache
+        self.model: str = model
+        self.deployment_name: str | None = deployment_name
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def embed(self, text: str, **kwargs: Any) -> list[float]:
+        """Embed text, calling the wrapped embedder only on a cache miss."""
+        with span("embedding", model=self.model) as embedding_span:
+            key: tuple = self._key(text)
+            embedding: list[float] | None = self._lookup(key)
+            embedding_span.set_attribute("cache_hit", embedding is not None)
+            if embedding is None:
+                embedding = self.embedder.embed(text, **kwargs)
+                self._store(key, embedding)
+        return embedding
+
+    async def aembed(self, text: str, **kwargs: Any) -> list[float]:
+        """Embed text asynchronously, calling the wrapped embedder only on a cache miss."""
+        with span("embedding", model=self.model) as embedding_span:
+            key: tuple = self._key(text)
+            embedding: list[float] | None = self._lookup(key)
+            embedding_span.set_attribute("cache_hit", embedding is not None)
+            if embedding is None:
+                embedding = await self.embedder.aembed(text, **kwargs)
+                self._store(key, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this embedder."""
+        lookups: int = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _key(self, text: str) -> tuple:
+        return (normalize_query_text(text), self.model, self.deployment_name)
+
+    def _lookup(self, key: tuple) -> list[float] | None:
+        value: bytes | None = self.cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logging.info(
+            f"query embedding cache {'miss' if value is None else 'hit'}: {self.stats()}"
+        )
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.float32).tolist()
+
+    def _store(self, key: tuple, embedding: list[float]) -> None:
+        vector: np.ndarray = np.asarray(embedding, dtype=np.float32)
+        # !never persist a failed embedding (empty or NaN after all chunks failed)
+        if vector.size and np.isfinite(vector).all():
+            self.cache.set(key, vector.tobytes())
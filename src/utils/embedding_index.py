@@ -0,0 +1,234 @@
+﻿import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from src.utils.env_manager import get_env_int
+
+if TYPE_CHECKING:
+    # *`graphrag.vector_stores` also imports the Azure AI Search and identity SDKs (~0.3 s),
+    # *so the stores are only imported when an index is opened
+    from graphrag.vector_stores import BaseVectorStore, VectorStoreDocument
+
+# !bump this when the layout of the stored documents changes to force a rebuild
+EMBEDDING_INDEX_VERSION: int = 1
+COLLECTION_NAME: str = "entity_description_embeddings"
+MANIFEST_NAME: str = f"{COLLECTION_NAME}.manifest.json"
+SOURCE_PREFIX: str = "create_final_entities"
+
+# *vector store backend -> folder under the artifacts folder holding its collection
+VECTOR_STORE_BACKENDS: dict[str, str] = {
+    "lancedb": "lancedb",
+    "numpy": "numpy_index",
+}
+DEFAULT_VECTOR_STORE_BACKEND: str = "lancedb"
+
+# *one build at a time per lancedb folder
+_build_locks: dict[str, threading.Lock] = {}
+_build_locks_guard: threading.Lock = threading.Lock()
+
+
+def ensure_entity_embedding_index(
+    artifacts_folder: str,
+    entity_embedding_df: pd.DataFrame,
+    backend: str | None = None,
+) -> "BaseVectorStore":
+    """
+    Returns the persistent entity description embedding index of an index folder, building it only if needed.
+
+    The index lives in `<artifacts_folder>/lancedb` (or `numpy_index`) and is stamped with a manifest
+    holding the content hash of `create_final_entities`. As long as the manifest matches the current
+    artifacts, the existing collection is opened as is, so entity embeddings are written once per index
+    folder instead of on every local query, and survive restarts.
+
+    Args:
+        artifacts_folder (str): The folder path where the index artifacts are stored.
+        entity_embedding_df (pd.DataFrame): The `create_final_entities` DataFrame used to (re)build the index.
+        backend (str | None, optional): "lancedb" or "numpy" (`NumpyVectorStore`, an in-process float32 matrix).
+                                        Defaults to None (env: GRAPHRAG_VECTOR_STORE, default "lancedb").
+
+    Returns:
+        BaseVectorStore: A connected vector store whose collection holds the entity description embeddings.
+    """
+    backend = get_vector_store_backend(backend)
+    db_uri: str = os.path.join(artifacts_folder, VECTOR_STORE_BACKENDS[backend])
+    store: "BaseVectorStore" = _new_store(backend)
+    store.connect(db_uri=db_uri)
+
+    with _get_build_lock(db_uri):
+        manifest_path: str = os.path.join(db_uri, MANIFEST_NAME)
+        manifest: dict = _read_manifest(manifest_path)
+        source: dict | None = _stat_source(artifacts_folder)
+        content_hash: str | None = _resolve_content_hash(
+            artifacts_folder, source, manifest
+        )
+
+        if (
+            manifest.get("version") == EMBEDDING_INDEX_VERSION
+            and content_hash is not None
+            and manifest.get("content_hash") == content_hash
+            and _collection_exists(store)
+        ):
+            _open_collection(store)
+            if manifest.get("source") != source:
+                # *artifact was touched but not changed, remember the new stat to skip re-hashing
+                _write_manifest(manifest_path, {**manifest, "source": source})
+            logging.info(
+                f"Reuse entity embedding index {db_uri} (hash: {content_hash[:12]})"
+            )
+            return store
+
+        logging.info(f"Build entity embedding index {db_uri}")
+        documents: "list[VectorStoreDocument]" = to_entity_documents(
+            entity_embedding_df
+        )
+        store.load_documents(documents=documents, overwrite=True)
+        if content_hash is not None:
+            _write_manifest(
+                manifest_path,
+                {
+                    "version": EMBEDDING_INDEX_VERSION,
+                    "collection_name": COLLECTION_NAME,
+                    "content_hash": content_hash,
+                    "source": source,
+                    "count": len(documents),
+                    "built_at": datetime.now().isoformat(),
+                },
+            )
+        logging.info(f"Stored {len(documents)} entity embeddings to {db_uri}")
+    return store
+
+
+def get_vector_store_backend(backend: str | None = None) -> str:
+    """Resolves the vector store backend name (env: GRAPHRAG_VECTOR_STORE), falling back to LanceDB."""
+    backend = (
+        backend
+        or os.environ.get("GRAPHRAG_VECTOR_STORE")
+        or DEFAULT_VECTOR_STORE_BACKEND
+    ).lower()
+    if backend not in VECTOR_STORE_BACKENDS:
+        logging.warning(
+            f"Unknown vector store backend {backend}, use {DEFAULT_VECTOR_STORE_BACKEND}"
+        )
+        return DEFAULT_VECTOR_STORE_BACKEND
+    return backend
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the sha256 content hash of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fi:
+        for chunk in iter(lambda: fi.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _new_store(backend: str) -> "BaseVectorStore":
+    if backend == "numpy":
+        from src.utils.numpy_vector_store import NumpyVectorStore
+
+        return NumpyVectorStore(
+            collection_name=COLLECTION_NAME,
+            mmap=bool(get_env_int("GRAPHRAG_VECTOR_STORE_MMAP", 1)),
+        )
+    from graphrag.vector_stores.lancedb import LanceDBVectorStore
+
+    return LanceDBVectorStore(collection_name=COLLECTION_NAME)
+
+
+def _collection_exists(store: "BaseVectorStore") -> bool:
+    from src.utils.numpy_vector_store import NumpyVectorStore
+
+    if isinstance(store, NumpyVectorStore):
+        return store.exists()
+    return COLLECTION_NAME in store.db_connection.table_names()
+
+
+def _open_collection(store: "BaseVectorStore") -> None:
+    from src.utils.numpy_vector_store import NumpyVectorStore
+
+    if isinstance(store, NumpyVectorStore):
+        store.open()
+    else:
+        store.document_collection = store.db_connection.open_table(
+            COLLECTION_NAME
+        )
+
+
+def _get_build_lock(db_uri: str) -> threading.Lock:
+    with _build_locks_guard:
+        return _build_locks.setdefault(os.path.abspath(db_uri), threading.Lock())
+
+
+def _stat_source(artifacts_folder: str) -> dict | None:
+    matching_files: list[str] = glob.glob(
+        os.path.join(artifacts_folder, f"{SOURCE_PREFIX}*.parquet")
+    )
+    if not matching_files:
+        return None
+    latest_file: str = max(matching_files, key=os.path.getctime)
+    stat: os.stat_result = os.stat(latest_file)
+    return {
+        "file": os.path.basename(latest_file),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def _resolve_content_hash(
+    artifacts_folder: str, source: dict | None, manifest: dict
+) -> str | None:
+    if source is None:
+        return None
+    # *same file stat as the last build: trust the recorded hash instead of reading the file again
+    if manifest.get("source") == source and manifest.get("content_hash"):
+        return manifest["content_hash"]
+    return hash_file(os.path.join(artifacts_folder, source["file"]))
+
+
+def _read_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as fi:
+            return json.load(fi)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignore broken manifest {manifest_path}: {e}")
+        return {}
+
+
+def _write_manifest(manifest_path: str, manifest: dict) -> None:
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path: str = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fo:
+        json.dump(manifest, fo, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def to_entity_documents(entity_embedding_df: pd.DataFrame) -> "list[VectorStoreDocument]":
+    """Same documents as `store_entity_semantic_embeddings`, without converting to `Entity` first."""
+    from graphrag.vector_stores import VectorStoreDocument
+
+    if entity_embedding_df.empty:
+        return []
+    df: pd.DataFrame = entity_embedding_df.drop_duplicates(subset=["name"])
+    return [
+        VectorStoreDocument(
+            id=str(entity_id),
+            text=description,
+            vector=(
+                vector.tolist() if isinstance(vector, np.ndarray) else vector
+            ),
+            attributes={"title": name},
+        )
+        for entity_id, name, description, vector in zip(
+            df["id"], df["name"], df["description"], df["description_embedding"]
+        )
+    ]
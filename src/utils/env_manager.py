@@ -1,13 +1,37 @@
 ﻿import copy
+import logging
 import os
+from typing import TYPE_CHECKING
 
-from src.state.state_model import StateModel
+if TYPE_CHECKING:
+    # *state_model imports the caches that read their budgets through this module
+    from src.state.state_model import StateModel
 
 
-def save_initial_environ(state: StateModel) -> None:
+def save_initial_environ(state: "StateModel") -> None:
     """save initial env info to gradio state
 
     Args:
         state (StateModel): A class to represent the state model for managing graphrag/gradio information.
     """
     state.initial_environ = copy.deepcopy(os.environ)
+
+
+def get_env_int(key: str, default: int) -> int:
+    """read an integer tuning knob from environ
+
+    Args:
+        key (str): environ variable name.
+        default (int): value used when the variable is unset or not an integer.
+
+    Returns:
+        int: parsed value of the environ variable or `default`.
+    """
+    value: str | None = os.getenv(key)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"Invalid integer for {key}: {value}. Use {default}.")
+        return default
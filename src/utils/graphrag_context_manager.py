@@ -1,6 +1,7 @@
-﻿import logging
-import os
+﻿import copy
+import logging
 
+import tiktoken
 from graphrag.model.community_report import CommunityReport
 from graphrag.model.covariate import Covariate
 from graphrag.model.entity import Entity
@@ -15,24 +16,25 @@ from graphrag.query.context_builder.entity_extraction import (
 )
 from graphrag.query.indexer_adapters import (
     read_indexer_covariates,
-    read_indexer_entities,
     read_indexer_relationships,
-    read_indexer_reports,
     read_indexer_text_units,
 )
-from graphrag.query.input.loaders.dfs import store_entity_semantic_embeddings
-from graphrag.query.llm.oai.embedding import OpenAIEmbedding
-from graphrag.query.llm.oai.typing import OpenaiApiType
-from graphrag.query.structured_search.global_search.community_context import (
-    GlobalCommunityContext,
-)
-from graphrag.query.structured_search.local_search.mixed_context import (
-    LocalSearchMixedContext,
-)
-from graphrag.vector_stores import BaseVectorStore
+from graphrag.query.llm.base import BaseTextEmbedding
 
+from src.state.index_registry import IndexSnapshot
 from src.state.state_model import StateModel
-from src.utils.df_manager import read_df
+from src.utils.context_cache import (
+    CacheKey,
+    ContextBuilderCache,
+    ContextBuilderCacheEntry,
+)
+from src.utils.df_manager import estimate_df_bytes
+from src.utils.embedding_cache import CachedTextEmbedding
+from src.utils.traced_context import (
+    TracedGlobalCommunityContext,
+    TracedLocalSearchMixedContext,
+)
+from src.utils.tracing import current_span, span
 
 
 def get_context_builder(
@@ -43,7 +45,7 @@ def get_context_builder(
 ) -> GlobalContextBuilder | LocalContextBuilder:
     """
     Builds and returns a context builder based on the specified query type and
-    community level, initializing it with relevant data from the state.
+    community level, initializing it with relevant data from the index registry.
 
     This function selects between a global or local context builder based on the
     `query_type` parameter. It reads necessary data from the specified folder
@@ -73,98 +75,261 @@ def get_context_builder(
     Notes:
         - The function modifies the state timestamp to reflect the currently selected
             folder.
-        - If the selected folder is not the same as the current timestamp, it
-            re-reads the dataframe from the artifacts folder associated with the
-            selected folder.
+        - The selected folder's data is looked up in `state.index_registry`, which
+            keeps several folders loaded and re-reads a folder only when its
+            artifacts change.
+        - Built context builders are kept in `state.index_registry.context_cache` keyed by
+            (folder, query type, community level) and reused until the folder's
+            artifacts change.
+        - Local search opens the folder's persistent entity embedding index
+            instead of re-ingesting every embedding into LanceDB per query.
+        - If the folder is being prefetched (`prefetch_index`), this waits for that
+            load instead of starting a second one.
     """
-    root_dir: str = f"{state.root_dir}/output"
     logging.info(f"current selected_folder: {selected_folder}")
     logging.info(f"selected folder before this call: {state.timestamp}")
 
-    # *read dataframe again if user selecte other graphrag output folder
-    if (selected_folder != None) and (selected_folder != state.timestamp):
-        selected_folder: str = os.path.join(root_dir, selected_folder)
-        artifacts_folder: str = os.path.join(selected_folder, "artifacts")
-        read_df(artifacts_folder, state)
-        state.timestamp = selected_folder
-
-    api_key: str = state.param.embeddings.llm.api_key
-    llm_model: str = state.param.embeddings.llm.model
-    llm_deployment: str = state.param.embeddings.llm.deployment_name
-    api_base: str = state.param.embeddings.llm.api_base
-    api_version: str = state.param.embeddings.llm.api_version
-
-    try:
-        if query_type == "global":
-            reports: list[CommunityReport] = read_indexer_reports(
-                state.report_df, state.entity_df, community_level
-            )
-            entities: list[Entity] = read_indexer_entities(
-                state.entity_df, state.entity_embedding_df, community_level
-            )
-            context_builder: GlobalContextBuilder = GlobalCommunityContext(
-                community_reports=reports,
-                entities=entities,
-                token_encoder=state.token_encoder,
-            )
-            return context_builder
+    with span(
+        "context_builder.get",
+        folder=selected_folder,
+        query_type=query_type,
+        community_level=community_level,
+        folder_switched=selected_folder is not None
+        and selected_folder != state.timestamp,
+    ):
+        if (selected_folder != None) and (selected_folder != state.timestamp):
+            state.timestamp = selected_folder
 
-        elif query_type == "local":
-            reports: list[CommunityReport] = read_indexer_reports(
-                state.report_df, state.entity_df, community_level
-            )
-            text_units: list[TextUnit] = read_indexer_text_units(
-                state.text_unit_df
-            )
+        # *switching folders is a registry lookup; a folder is read again only if its artifacts were re-written,
+        # *otherwise only the columns this query type needs that are not loaded yet are read
+        # *waits for a background prefetch of the folder started from the dropdown, if any
+        snapshot: IndexSnapshot = state.snapshot(query_type)
 
-            # *integrate entity_df and entitiy_embedding_df
-            entities: list[Entity] = read_indexer_entities(
-                state.entity_df, state.entity_embedding_df, community_level
-            )
-            # !load description embeddings to an in-memory lancedb vectorstore
-            entity_description_embeddings: BaseVectorStore = (
-                store_entity_semantic_embeddings(
-                    entities=entities,
-                    vectorstore=state.description_embedding_store,
-                )
-            )
+        text_embedder: BaseTextEmbedding | None = None
+        if query_type == "local":
+            api_key: str = state.param.embeddings.llm.api_key
+            llm_model: str = state.param.embeddings.llm.model
+            llm_deployment: str = state.param.embeddings.llm.deployment_name
+            api_base: str = state.param.embeddings.llm.api_base
+            api_version: str = state.param.embeddings.llm.api_version
 
-            relationships: list[Relationship] = read_indexer_relationships(
-                state.relationship_df
-            )
-            if state.covariate_df.empty:
-                covariates = None
-            else:
-                claims: list[Covariate] = read_indexer_covariates(
-                    state.covariate_df
-                )
-                covariates: dict = {"claims": claims}
-
-            text_embedder: OpenAIEmbedding = OpenAIEmbedding(
-                api_key=api_key,
-                api_base=api_base,
-                api_version=api_version,
-                api_type=OpenaiApiType.AzureOpenAI,
+            # *repeated queries are embedded from the disk cache instead of calling the API
+            # *the embedding client is pooled per configuration, so its HTTP connections survive between queries
+            text_embedder = CachedTextEmbedding(
+                state.client_pool.embedding(
+                    api_key=api_key,
+                    model=llm_model,
+                    deployment_name=llm_deployment,
+                    api_base=api_base,
+                    api_version=api_version,
+                    max_retries=20,
+                ),
+                cache=state.query_embedding_cache,
                 model=llm_model,
                 deployment_name=llm_deployment,
-                max_retries=20,
             )
 
-            context_builder: LocalContextBuilder = LocalSearchMixedContext(
-                community_reports=reports,  # ! things to summarize entity/relationthip
-                text_units=text_units,
-                entities=entities,  # ! entity type (human / organization etc) list
-                relationships=relationships,
-                covariates=covariates,
-                entity_text_embeddings=state.description_embedding_store,
-                embedding_vectorstore_key=EntityVectorStoreKey.ID,
-                text_embedder=text_embedder,
-                token_encoder=state.token_encoder,
+        try:
+            return build_context_builder(
+                snapshot,
+                state.index_registry.context_cache,
+                query_type,
+                community_level,
+                state.token_encoder,
+                text_embedder,
+            )
+
+        except Exception as e:
+            logging.error(f"error: {e}")
+            import traceback
+
+            traceback.print_exc()
+
+
+def build_context_builder(
+    snapshot: IndexSnapshot,
+    context_cache: ContextBuilderCache,
+    query_type: str,
+    community_level: str,
+    token_encoder: tiktoken.Encoding,
+    text_embedder: BaseTextEmbedding | None = None,
+) -> GlobalContextBuilder | LocalContextBuilder:
+    """
+    Returns the context builder of an index snapshot for a query type and community level,
+    building it from the snapshot's DataFrames only if it is not cached yet.
+
+    Args:
+        snapshot (IndexSnapshot): The loaded index folder to build the context from.
+        context_cache (ContextBuilderCache): Cache of context builders built so far.
+        query_type (str): "global" or "local".
+        community_level (str): The level of community to query.
+        token_encoder (tiktoken.Encoding): Token encoder for text tokenization.
+        text_embedder (BaseTextEmbedding | None, optional): Query embedder of the session's local search,
+                                                            set on a per-query copy of the cached builder.
+                                                            Defaults to None (e.g. when warming up).
+
+    Returns:
+        GlobalContextBuilder | LocalContextBuilder: The context builder of the query type.
+    """
+    # !reuse the context builder built for the same folder/query type/level
+    cache_key: CacheKey = (snapshot.folder, query_type, int(community_level))
+    cached: ContextBuilderCacheEntry | None = context_cache.get(
+        cache_key, snapshot.signature
+    )
+    logging.info(
+        f"context builder cache {'hit' if cached else 'miss'}: {cache_key} {context_cache.stats()}"
+    )
+    current_span().set_attribute("context_cache_hit", cached is not None)
+
+    if query_type == "global":
+        if cached is not None:
+            return cached.context_builder
+
+        # *reports and entities of every level are precomputed when the snapshot is loaded
+        reports: list[CommunityReport] = snapshot.level_partitions.reports(
+            community_level
+        )
+        entities: list[Entity] = snapshot.level_partitions.entities(
+            community_level
+        )
+        context_builder: GlobalContextBuilder = TracedGlobalCommunityContext(
+            community_reports=reports,
+            entities=entities,
+            # *report and text unit rows are counted from the folder's precomputed token counts
+            token_encoder=snapshot.token_encoder(token_encoder),
+        )
+        context_cache.put(
+            cache_key,
+            ContextBuilderCacheEntry(
+                context_builder=context_builder,
+                models={"reports": reports, "entities": entities},
+                signature=snapshot.signature,
+                # *the model lists belong to the snapshot's level partitions
+                nbytes=0,
+            ),
+        )
+        return context_builder
+
+    elif query_type == "local":
+        if cached is not None:
+            return with_text_embedder(cached.context_builder, text_embedder)
+
+        reports: list[CommunityReport] = snapshot.level_partitions.reports(
+            community_level
+        )
+        text_units: list[TextUnit] = read_indexer_text_units(
+            snapshot.text_unit_df
+        )
+
+        # *entity_df integrated with entitiy_embedding_df, precomputed per level
+        entities: list[Entity] = snapshot.level_partitions.entities(
+            community_level
+        )
+
+        relationships: list[Relationship] = read_indexer_relationships(
+            snapshot.relationship_df
+        )
+        if snapshot.covariate_df.empty:
+            covariates = None
+        else:
+            claims: list[Covariate] = read_indexer_covariates(
+                snapshot.covariate_df
             )
-            return context_builder
+            covariates: dict = {"claims": claims}
+
+        context_builder: LocalContextBuilder = TracedLocalSearchMixedContext(
+            community_reports=reports,  # ! things to summarize entity/relationthip
+            text_units=text_units,
+            entities=entities,  # ! entity type (human / organization etc) list
+            relationships=relationships,
+            covariates=covariates,
+            # !the folder's persistent description embedding index (built only when artifacts change)
+            entity_text_embeddings=snapshot.description_embedding_store,
+            embedding_vectorstore_key=EntityVectorStoreKey.ID,
+            # !shared by every session, each query gets a copy with its session's embedder
+            text_embedder=None,
+            # *report and text unit rows are counted from the folder's precomputed token counts
+            token_encoder=snapshot.token_encoder(token_encoder),
+        )
+        context_cache.put(
+            cache_key,
+            ContextBuilderCacheEntry(
+                context_builder=context_builder,
+                models={
+                    "reports": reports,
+                    "text_units": text_units,
+                    "entities": entities,
+                    "relationships": relationships,
+                    "covariates": covariates,
+                },
+                signature=snapshot.signature,
+                nbytes=estimate_df_bytes(
+                    snapshot.text_unit_df,
+                    snapshot.relationship_df,
+                    snapshot.covariate_df,
+                ),
+            ),
+        )
+        return with_text_embedder(context_builder, text_embedder)
+
+
+def with_text_embedder(
+    context_builder: LocalContextBuilder, text_embedder: BaseTextEmbedding | None
+) -> LocalContextBuilder:
+    """
+    A shallow copy of a cached local context builder that embeds the query with a session's embedder.
+
+    The cached builder is shared by every session while the embedding settings (API key, deployment,
+    model) belong to each session's `state.param`, so the embedder is never set on the cached builder.
+    The copy shares the converted models and the embedding index, which queries only read.
+
+    Args:
+        context_builder (LocalContextBuilder): The cached builder.
+        text_embedder (BaseTextEmbedding | None): Query embedder of the session (None: the cached builder
+                                                  is returned, e.g. when warming up).
+
+    Returns:
+        LocalContextBuilder: The builder to run the query with.
+    """
+    if text_embedder is None:
+        return context_builder
+    request_builder: LocalContextBuilder = copy.copy(context_builder)
+    request_builder.text_embedder = text_embedder
+    return request_builder
+
+
+def prefetch_index(
+    state: StateModel,
+    query_type: str,
+    community_level: str,
+    selected_folder: str,
+) -> None:
+    """
+    Starts loading and warming up the selected index folder in the background.
+
+    Called when the "Select Index Folder" dropdown changes, so the first query on the folder
+    does not pay for reading the artifacts (`read_df`), converting them to graphrag models
+    and opening the entity embedding index (local search). Queries arriving while the
+    warm-up runs wait for it in `IndexRegistry.get` instead of loading the folder twice.
+
+    Args:
+        state (StateModel): The current state of the application.
+        query_type (str): The selected query type ("global" or "local").
+        community_level (str): The selected community level.
+        selected_folder (str): The index folder selected in the dropdown.
+    """
+    if not selected_folder:
+        return
+
+    context_cache: ContextBuilderCache = state.index_registry.context_cache
+    token_encoder: tiktoken.Encoding = state.token_encoder
 
-    except Exception as e:
-        logging.error(f"error: {e}")
-        import traceback
+    def warm_up(snapshot: IndexSnapshot) -> None:
+        build_context_builder(
+            snapshot, context_cache, query_type, community_level, token_encoder
+        )
+        if query_type == "local":
+            snapshot.description_embedding_store
+            snapshot.graph_layout
 
-        traceback.print_exc()
+    state.index_registry.prefetch(selected_folder, query_type, warm_up)
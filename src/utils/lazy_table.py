@@ -0,0 +1,107 @@
+﻿import logging
+import threading
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+class LazyTable:
+    """
+    A parquet artifact whose columns are read from disk only when first requested.
+
+    Each call to `load` reads just the requested columns that are not in memory yet and
+    appends them to a new DataFrame, so heavy columns (e.g. `text`, `description_embedding`)
+    stay on disk until a query path actually needs them.
+
+    Attributes:
+        path (str): Path of the parquet file.
+        columns (list[str]): Data columns available in the file.
+        num_rows (int): Number of rows in the file.
+        frame (pd.DataFrame): The columns materialized so far.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._metadata: pq.FileMetaData = pq.read_metadata(path)
+        schema: pq.ParquetSchema = self._metadata.schema
+        self.columns: list[str] = [
+            name
+            for name in schema.to_arrow_schema().names
+            if not name.startswith("__index_level_")
+        ]
+        self.num_rows: int = self._metadata.num_rows
+        self.frame: pd.DataFrame = pd.DataFrame()
+        self._lock: threading.Lock = threading.Lock()
+
+    def missing_columns(self, columns: list[str] | None = None) -> list[str]:
+        """Returns the requested columns (default: all) that exist in the file but are not loaded yet."""
+        wanted: list[str] = self.columns if columns is None else columns
+        return [
+            column
+            for column in wanted
+            if column in self.columns and column not in self.frame.columns
+        ]
+
+    def load(self, columns: list[str] | None = None) -> dict:
+        """
+        Materializes the requested columns.
+
+        Args:
+            columns (list[str] | None, optional): Columns to make available. Defaults to None (every column).
+
+        Returns:
+            dict: Load stats of this call (columns read, seconds, compressed bytes read from disk).
+        """
+        with self._lock:
+            missing: list[str] = self.missing_columns(columns)
+            if not missing:
+                return {"columns": [], "seconds": 0.0, "bytes": 0}
+
+            start: float = time.perf_counter()
+            df: pd.DataFrame = self._read(missing)
+            if self.frame.columns.empty:
+                frame: pd.DataFrame = df
+            else:
+                # *rows come from the same file in the same order, align them by position
+                df.index = self.frame.index
+                frame = pd.concat([self.frame, df], axis=1)
+            # !publish a new object so frames handed out earlier are never mutated
+            self.frame = frame
+
+            return {
+                "columns": missing,
+                "seconds": time.perf_counter() - start,
+                "bytes": self._column_bytes(missing),
+            }
+
+    def _read(self, columns: list[str]) -> pd.DataFrame:
+        return pd.read_parquet(self.path, columns=columns)
+
+    def _column_bytes(self, columns: list[str]) -> int:
+        """Compressed on-disk size of the given columns."""
+        nbytes: int = 0
+        for i in range(self._metadata.num_row_groups):
+            row_group: pq.RowGroupMetaData = self._metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                column: pq.ColumnChunkMetaData = row_group.column(j)
+                if column.path_in_schema.split(".")[0] in columns:
+                    nbytes += column.total_compressed_size
+        return nbytes
+
+    def __repr__(self) -> str:
+        return f"LazyTable({self.path}, loaded={list(self.frame.columns)}/{len(self.columns)})"
+
+
+def log_load_stats(stats: dict[str, dict], seconds: float) -> None:
+    """Logs per-table load time and bytes of a `read_df` call that took `seconds` overall."""
+    for df_name, stat in stats.items():
+        if stat["columns"]:
+            logging.info(
+                f"Loaded {df_name}: {len(stat['columns'])} columns, "
+                f"{stat['bytes'] / 1024**2:.2f} MB in {stat['seconds'] * 1000:.1f} ms"
+            )
+    total_bytes: int = sum(stat["bytes"] for stat in stats.values())
+    logging.info(
+        f"read_df: {len(stats)} tables, {total_bytes / 1024**2:.2f} MB in {seconds * 1000:.1f} ms"
+    )
@@ -0,0 +1,328 @@
+﻿import logging
+import threading
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from graphrag.model.community_report import CommunityReport
+from graphrag.model.entity import Entity
+
+# *(levels, entity partitions, report partitions), see `partition_levels`
+Partitions = tuple[list[int], pd.DataFrame, pd.DataFrame]
+
+
+class LevelPartitions:
+    """
+    Community reports and entities of an index, precomputed for every community level.
+
+    `read_indexer_reports` and `read_indexer_entities` filter the nodes under the community level
+    and convert the result to graphrag models on every call. Here the community and rank of each
+    entity are resolved for all levels at once (`partition_levels`, also stored by compiled
+    snapshots), every report and entity row is converted once, and each level only keeps lists
+    of those models, built on the first use of the level, so switching the level is a lookup.
+
+    Levels above the deepest level of the index resolve to the deepest one and levels below the
+    first one are empty, as filtering with `level <= community_level` would give.
+
+    Attributes:
+        levels (list[int]): Community levels present in the index.
+        sources (tuple[pd.DataFrame, ...]): The (entity_df, report_df, entity_embedding_df) the partitions were built from.
+        build_seconds (float): Time spent building the partitions.
+    """
+
+    def __init__(
+        self,
+        entity_df: pd.DataFrame,
+        report_df: pd.DataFrame,
+        entity_embedding_df: pd.DataFrame,
+        partitions: Partitions | None = None,
+    ):
+        start: float = time.perf_counter()
+        self.sources: tuple[pd.DataFrame, ...] = (
+            entity_df,
+            report_df,
+            entity_embedding_df,
+        )
+        self.levels: list[int] = []
+        self._reports: dict[int, list[CommunityReport]] = {}
+        self._entities: dict[int, list[Entity]] = {}
+        self._all_reports: list[CommunityReport] = []
+        self._base_entities: dict[int, Entity] = {}
+        # *level -> report rows / (entity rows, communities, ranks), turned into models on first use
+        self._report_rows: dict[int, list[int]] = {}
+        self._entity_rows: dict[int, tuple[list[int], list[int], list[int]]] = {}
+        self._lock: threading.Lock = threading.Lock()
+        if partitions is None and not entity_df.empty:
+            partitions = partition_levels(entity_df, report_df, entity_embedding_df)
+        if partitions is not None:
+            self._build(report_df, entity_embedding_df, *partitions)
+        self.build_seconds: float = time.perf_counter() - start
+        logging.info(
+            f"level partitions: {len(self.levels)} levels built in {self.build_seconds * 1000:.1f} ms"
+        )
+
+    def is_built_from(self, *dfs: pd.DataFrame) -> bool:
+        """Whether the partitions were built from these very DataFrame objects."""
+        return len(dfs) == len(self.sources) and all(
+            df is source for df, source in zip(dfs, self.sources)
+        )
+
+    def reports(self, community_level: int | str) -> list[CommunityReport]:
+        """Community reports under a community level (same as `read_indexer_reports`)."""
+        level: int = self._resolve(community_level)
+        if level not in self._reports:
+            self._build_level(level)
+        return self._reports[level]
+
+    def entities(self, community_level: int | str) -> list[Entity]:
+        """Entities under a community level (same as `read_indexer_entities`)."""
+        level: int = self._resolve(community_level)
+        if level not in self._entities:
+            self._build_level(level)
+        return self._entities[level]
+
+    def _resolve(self, community_level: int | str) -> int:
+        community_level = int(community_level)
+        if self.levels and community_level > self.levels[-1]:
+            return self.levels[-1]
+        return community_level
+
+    def _build(
+        self,
+        report_df: pd.DataFrame,
+        entity_embedding_df: pd.DataFrame,
+        levels: list[int],
+        level_entities: pd.DataFrame,
+        level_reports: pd.DataFrame,
+    ) -> None:
+        self.levels = list(levels)
+        self._all_reports = to_community_reports(report_df)
+        for level, rows in level_reports.groupby("level", sort=False)["row"]:
+            self._report_rows[int(level)] = rows.tolist()
+
+        # *entities are converted once without community/rank, then shared per level with those set
+        entity_rows: np.ndarray = np.unique(level_entities["row"].to_numpy())
+        self._base_entities = dict(
+            zip(
+                entity_rows.tolist(),
+                to_entities(entity_embedding_df.iloc[entity_rows]),
+            )
+        )
+        for level, partition in level_entities.groupby("level", sort=False):
+            self._entity_rows[int(level)] = (
+                partition["row"].tolist(),
+                partition["community"].tolist(),
+                partition["rank"].tolist(),
+            )
+
+    def _build_level(self, level: int) -> None:
+        with self._lock:
+            if level in self._reports:
+                return
+            # !every level gets its own shallow copies of the reports because
+            # !the global context writes level-dependent community weights into `attributes`
+            reports: list[CommunityReport] = [
+                _replace(self._all_reports[row], attributes=None)
+                for row in self._report_rows.get(level, [])
+            ]
+            rows, communities, ranks = self._entity_rows.get(level, ([], [], []))
+            self._entities[level] = [
+                _replace(
+                    self._base_entities[row], community_ids=[str(community)], rank=rank
+                )
+                for row, community, rank in zip(rows, communities, ranks)
+            ]
+            # *published last: `reports` and `entities` check it without the lock
+            self._reports[level] = reports
+
+
+def partition_levels(
+    entity_df: pd.DataFrame,
+    report_df: pd.DataFrame,
+    entity_embedding_df: pd.DataFrame,
+) -> Partitions:
+    """
+    Resolves which entities and reports are under every community level of an index.
+
+    Args:
+        entity_df (pd.DataFrame): Nodes with `title`, `degree`, `community` and `level`.
+        report_df (pd.DataFrame): Community reports with `community` and `level`.
+        entity_embedding_df (pd.DataFrame): Entities with `name`, the rows entity models are read from.
+
+    Returns:
+        Partitions: The levels of the index, the (level, row, community, rank) of every entity
+                    under each level (`row` is the position of the entity in `entity_embedding_df`),
+                    and the (level, row) of every report under each level (position in `report_df`).
+    """
+    nodes: pd.DataFrame = entity_df[["title", "degree", "community", "level"]].copy()
+    nodes["community"] = nodes["community"].fillna(-1).astype(int)
+
+    # *title x level tables, carried forward so each column covers every level <= it
+    levels: list[int] = sorted(int(level) for level in nodes["level"].unique())
+    by_level: pd.DataFrame = nodes.groupby(["title", "level"]).agg(
+        community=("community", "max"), rank=("degree", "min")
+    )
+    communities: pd.DataFrame = (
+        by_level["community"]
+        .unstack("level")
+        .reindex(columns=levels)
+        .ffill(axis=1)
+        .cummax(axis=1)
+    )
+    ranks: pd.DataFrame = (
+        by_level["rank"]
+        .unstack("level")
+        .reindex(columns=levels)
+        .ffill(axis=1)
+        .cummin(axis=1)
+    )
+
+    # *first row of every entity name, as `drop_duplicates(subset=["name"])` keeps
+    names: pd.Series = (
+        entity_embedding_df["name"]
+        if "name" in entity_embedding_df.columns
+        else pd.Series(dtype=object)
+    )
+    entity_rows: pd.Series = pd.Series(
+        np.arange(len(names)), index=names.to_numpy()
+    )
+    entity_rows = entity_rows[~entity_rows.index.duplicated()]
+    report_levels: np.ndarray = (
+        report_df["level"].astype(int).to_numpy()
+        if not report_df.empty
+        else np.zeros(0, dtype=np.int64)
+    )
+    report_communities: pd.Series = (
+        report_df["community"].astype(str) if not report_df.empty else pd.Series(dtype=str)
+    )
+
+    entities: list[pd.DataFrame] = []
+    reports: list[pd.DataFrame] = []
+    for level in levels:
+        level_communities: pd.Series = communities[level].dropna().astype(int)
+        rows: pd.Series = entity_rows.reindex(level_communities.index)
+        known: np.ndarray = rows.notna().to_numpy()
+        entities.append(
+            pd.DataFrame(
+                {
+                    "level": level,
+                    "row": rows[known].astype(np.int64).to_numpy(),
+                    "community": level_communities[known].to_numpy(),
+                    "rank": ranks[level]
+                    .reindex(level_communities.index)[known]
+                    .astype(np.int64)
+                    .to_numpy(),
+                }
+            )
+        )
+        community_ids: set[str] = set(level_communities.astype(str))
+        reports.append(
+            pd.DataFrame(
+                {
+                    "level": level,
+                    "row": np.flatnonzero(
+                        (report_levels <= level)
+                        & report_communities.isin(community_ids).to_numpy()
+                    ),
+                }
+            )
+        )
+    return (
+        levels,
+        _concat(entities, {"level": "int64", "row": "int64", "community": "int64", "rank": "int64"}),
+        _concat(reports, {"level": "int64", "row": "int64"}),
+    )
+
+
+def to_community_reports(report_df: pd.DataFrame) -> list[CommunityReport]:
+    """
+    Converts report rows to models, as `read_community_reports` with the community as id and
+    short id and no embeddings, but column-wise instead of one `iterrows` Series per row.
+    """
+    if report_df.empty:
+        return []
+    communities: list[Any] = report_df["community"].tolist()
+    return [
+        CommunityReport(
+            id=str(community),
+            short_id=_optional_str(community),
+            title=str(title),
+            community_id=str(community),
+            summary=str(summary),
+            full_content=str(full_content),
+            rank=None if rank is None else float(rank),
+        )
+        for community, title, summary, full_content, rank in zip(
+            communities,
+            report_df["title"].tolist(),
+            report_df["summary"].tolist(),
+            report_df["full_content"].tolist(),
+            report_df["rank"].tolist(),
+        )
+    ]
+
+
+def to_entities(entity_embedding_df: pd.DataFrame) -> list[Entity]:
+    """
+    Converts `create_final_entities` rows to models without community and rank, as `read_entities`
+    with graphrag's indexer column names, but column-wise instead of one `iterrows` Series per row.
+    """
+    if entity_embedding_df.empty:
+        return []
+    df: pd.DataFrame = entity_embedding_df
+    embeddings: list[Any] = (
+        df["description_embedding"].tolist()
+        if "description_embedding" in df.columns
+        else [None] * len(df)
+    )
+    return [
+        Entity(
+            id=str(entity_id),
+            short_id=_optional_str(short_id),
+            title=str(title),
+            type=_optional_str(entity_type),
+            description=_optional_str(description),
+            description_embedding=_optional_list(embedding),
+            text_unit_ids=_optional_list(text_unit_ids),
+        )
+        for entity_id, short_id, title, entity_type, description, embedding, text_unit_ids in zip(
+            df["id"].tolist(),
+            df["human_readable_id"].tolist(),
+            df["name"].tolist(),
+            df["type"].tolist(),
+            df["description"].tolist(),
+            embeddings,
+            df["text_unit_ids"].tolist(),
+        )
+    ]
+
+
+def _replace(model: Any, **changes: Any) -> Any:
+    """
+    A shallow copy of a model with some fields changed, as `dataclasses.replace` without
+    re-inspecting the fields and re-running `__init__` (graphrag models have no `__post_init__`).
+    """
+    clone: Any = object.__new__(type(model))
+    clone.__dict__.update(model.__dict__, **changes)
+    return clone
+
+
+def _optional_str(value: Any) -> str | None:
+    return None if value is None else str(value)
+
+
+def _optional_list(value: Any) -> list | None:
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if not isinstance(value, list):
+        raise ValueError(f"value is not a list: {value} ({type(value)})")
+    return value
+
+
+def _concat(frames: list[pd.DataFrame], dtypes: dict[str, str]) -> pd.DataFrame:
+    if not frames:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    return pd.concat(frames, ignore_index=True).astype(dtypes)
@@ -0,0 +1,211 @@
+﻿import json
+import os
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from graphrag.model.types import TextEmbedder
+from graphrag.vector_stores import (
+    BaseVectorStore,
+    VectorStoreDocument,
+    VectorStoreSearchResult,
+)
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    An in-process vector store holding every embedding in one contiguous float32 matrix.
+
+    Rows are L2-normalized when documents are loaded, so a search is one matrix product
+    followed by a partial sort (`np.argpartition`) of the k best rows. For indexes of up to a
+    few hundred thousand entities this is faster than a LanceDB round trip. With `db_uri`
+    set, the matrix is saved as `<collection_name>.npy` next to the document metadata and
+    opened memory-mapped, so several processes share one copy through the page cache.
+
+    Scores are cosine similarities. For the unit-length OpenAI embeddings they rank documents
+    in the same order as LanceDB's L2 distance.
+
+    Attributes:
+        matrix (np.ndarray): (documents, dimensions) normalized float32 embeddings.
+        ids (list[str]): Document ids, one per matrix row.
+        texts (list[str | None]): Document texts, one per matrix row.
+        attributes (list[dict]): Document attributes, one per matrix row.
+        mmap (bool): Whether the persisted matrix is opened memory-mapped.
+    """
+
+    def __init__(self, collection_name: str, mmap: bool = True, **kwargs: Any):
+        super().__init__(collection_name, **kwargs)
+        self.mmap: bool = mmap
+        self.matrix: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self.ids: list[str] = []
+        self.texts: list[str | None] = []
+        self.attributes: list[dict] = []
+        self._rows: dict[str, int] = {}
+
+    def connect(self, **kwargs: Any) -> None:
+        """Sets the folder the collection is persisted to (`db_uri`, optional)."""
+        self.db_connection = kwargs.get("db_uri")
+
+    def exists(self) -> bool:
+        """Whether the collection has been persisted to `db_uri`."""
+        return self.db_connection is not None and all(
+            os.path.exists(path) for path in self._paths()
+        )
+
+    def open(self) -> None:
+        """Loads the persisted collection, memory-mapping the matrix if `mmap` is set."""
+        matrix_path, documents_path = self._paths()
+        matrix: np.ndarray = np.load(matrix_path, mmap_mode="r" if self.mmap else None)
+        documents: pd.DataFrame = pd.read_parquet(documents_path)
+        self._set(
+            matrix,
+            documents["id"].tolist(),
+            documents["text"].tolist(),
+            [json.loads(attributes) for attributes in documents["attributes"]],
+        )
+
+    def load_documents(
+        self, documents: list[VectorStoreDocument], overwrite: bool = True
+    ) -> None:
+        """Load documents into the matrix, and persist them if `db_uri` is set."""
+        documents = [document for document in documents if document.vector is not None]
+        if not overwrite:
+            documents = [
+                VectorStoreDocument(
+                    id=doc_id, text=text, vector=vector.tolist(), attributes=attributes
+                )
+                for doc_id, text, vector, attributes in zip(
+                    self.ids, self.texts, self.matrix, self.attributes
+                )
+            ] + documents
+
+        matrix: np.ndarray = (
+            np.asarray([document.vector for document in documents], dtype=np.float32)
+            if documents
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        if len(matrix):
+            norms: np.ndarray = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        ids: list[str] = [str(document.id) for document in documents]
+        texts: list[str | None] = [document.text for document in documents]
+        attributes: list[dict] = [document.attributes for document in documents]
+
+        if self.db_connection is not None:
+            matrix_path, documents_path = self._paths()
+            os.makedirs(self.db_connection, exist_ok=True)
+            # *write to temp files first so readers never see a half-written collection
+            with open(f"{matrix_path}.tmp", "wb") as fo:
+                np.save(fo, matrix)
+            pd.DataFrame(
+                {
+                    "id": ids,
+                    "text": texts,
+                    "attributes": [json.dumps(attr) for attr in attributes],
+                }
+            ).to_parquet(f"{documents_path}.tmp")
+            os.replace(f"{documents_path}.tmp", documents_path)
+            os.replace(f"{matrix_path}.tmp", matrix_path)
+            if self.mmap:
+                matrix = np.load(matrix_path, mmap_mode="r")
+
+        self._set(matrix, ids, texts, attributes)
+
+    def filter_by_id(self, include_ids: list[str] | list[int]) -> Any:
+        """Build a query filter to filter documents by id (matrix rows to search)."""
+        if len(include_ids) == 0:
+            self.query_filter = None
+        else:
+            self.query_filter = np.asarray(
+                [self._rows[str(i)] for i in include_ids if str(i) in self._rows],
+                dtype=np.int64,
+            )
+        return self.query_filter
+
+    def similarity_search_by_vector(
+        self, query_embedding: list[float], k: int = 10, **kwargs: Any
+    ) -> list[VectorStoreSearchResult]:
+        """Perform a vector-based similarity search."""
+        return self.similarity_search_by_vectors([query_embedding], k)[0]
+
+    def similarity_search_by_vectors(
+        self, query_embeddings: list[list[float]], k: int = 10
+    ) -> list[list[VectorStoreSearchResult]]:
+        """
+        Searches several query embeddings with one matrix product.
+
+        Args:
+            query_embeddings (list[list[float]]): The query embeddings.
+            k (int, optional): Number of results per query. Defaults to 10.
+
+        Returns:
+            list[list[VectorStoreSearchResult]]: Results per query, most similar first.
+                                                Result documents carry no vector.
+        """
+        if not len(self.ids) or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+
+        queries: np.ndarray = np.asarray(query_embeddings, dtype=np.float32)
+        norms: np.ndarray = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+
+        rows: np.ndarray | None = self.query_filter
+        matrix: np.ndarray = self.matrix if rows is None else self.matrix[rows]
+        scores: np.ndarray = queries @ matrix.T
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in query_embeddings]
+
+        # *partial sort: only the k best columns per query are ordered
+        top: np.ndarray = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores: np.ndarray = np.take_along_axis(scores, top, axis=1)
+        order: np.ndarray = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+
+        return [
+            [
+                VectorStoreSearchResult(
+                    document=VectorStoreDocument(
+                        id=self.ids[row],
+                        text=self.texts[row],
+                        vector=None,
+                        attributes=self.attributes[row],
+                    ),
+                    score=float(score),
+                )
+                for row, score in zip(query_rows, query_scores)
+            ]
+            for query_rows, query_scores in zip(top, top_scores)
+        ]
+
+    def similarity_search_by_text(
+        self, text: str, text_embedder: TextEmbedder, k: int = 10, **kwargs: Any
+    ) -> list[VectorStoreSearchResult]:
+        """Perform a similarity search using a given input text."""
+        query_embedding = text_embedder(text)
+        if query_embedding:
+            return self.similarity_search_by_vector(query_embedding, k)
+        return []
+
+    def _set(
+        self,
+        matrix: np.ndarray,
+        ids: list[str],
+        texts: list[str | None],
+        attributes: list[dict],
+    ) -> None:
+        self.matrix = matrix
+        self.ids = ids
+        self.texts = texts
+        self.attributes = attributes
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self.document_collection = matrix
+
+    def _paths(self) -> tuple[str, str]:
+        return (
+            os.path.join(self.db_connection, f"{self.collection_name}.npy"),
+            os.path.join(self.db_connection, f"{self.collection_name}.parquet"),
+        )
@@ -0,0 +1,416 @@
+﻿import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import openai
+import tiktoken
+from graphrag.query.llm.base import BaseLLM, BaseLLMCallback
+from graphrag.query.llm.text_utils import num_tokens
+
+from src.utils.tracing import span
+
+
+class TokenBucket:
+    """
+    A per-minute budget (tokens or requests) refilled continuously.
+
+    Attributes:
+        per_minute (int): Budget per minute. 0 disables the bucket.
+        available (float): Budget that can be spent right now.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute: int = per_minute
+        self.available: float = float(per_minute)
+        self._updated: float = time.monotonic()
+        self._lock: threading.Lock = threading.Lock()
+
+    def try_acquire(self, amount: float) -> float:
+        """Spends `amount` if available and returns 0, otherwise returns the seconds to wait before retrying."""
+        if self.per_minute <= 0:
+            return 0.0
+        # *a single request larger than the bucket would wait forever, let it drain the bucket instead
+        amount = min(amount, self.per_minute)
+        with self._lock:
+            now: float = time.monotonic()
+            self.available = min(
+                self.per_minute,
+                self.available + (now - self._updated) * self.per_minute / 60,
+            )
+            self._updated = now
+            if self.available >= amount:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) * 60 / self.per_minute
+
+    async def acquire(self, amount: float) -> None:
+        """Waits until `amount` can be spent."""
+        while (wait := self.try_acquire(amount)) > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    A concurrency limit sized from observed latency and rate limiting (AIMD).
+
+    Every successful call raises the limit additively (+1 per `limit` calls). A 429 halves it, and
+    a latency well above the best latency seen (the service is queueing) shrinks it by 10%.
+    Only calls started after the last decrease can trigger another one, so a burst of errors
+    from calls that were already in flight counts once.
+    Waiters are woken in FIFO order. The limiter works across event loops and threads.
+
+    Attributes:
+        min_limit (int): Lower bound of the limit.
+        max_limit (int): Upper bound of the limit.
+        limit (float): Current concurrency limit.
+        in_flight (int): Calls holding a slot.
+        throttles (int): Number of 429s reported.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial_limit: int | None = None,
+        latency_tolerance: float = 2.0,
+        latency_slack: float = 0.05,
+    ):
+        self.min_limit: int = max(1, min_limit)
+        self.max_limit: int = max(self.min_limit, max_limit)
+        self.limit: float = float(
+            min(self.max_limit, max(self.min_limit, initial_limit or self.max_limit // 2))
+        )
+        self.latency_tolerance: float = latency_tolerance
+        self.latency_slack: float = latency_slack
+        self.in_flight: int = 0
+        self.throttles: int = 0
+        self.latency_ewma: float | None = None
+        self.latency_floor: float | None = None
+        self._last_decrease: float = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a slot."""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Waits for a free slot."""
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # *the slot was handed over right before the cancellation, give it back
+                    self.in_flight -= 1
+            self._wake()
+            raise
+
+    def release(
+        self,
+        started: float,
+        latency: float | None = None,
+        throttled: bool = False,
+    ) -> None:
+        """
+        Frees a slot and adapts the limit to the outcome of the call.
+
+        Args:
+            started (float): `time.monotonic()` when the call was sent.
+            latency (float | None, optional): Latency of a successful call. Defaults to None (no adaptation).
+            throttled (bool, optional): Whether the call was rejected with a 429. Defaults to False.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                self._decrease(started, 0.5, "rate limited")
+            elif latency is not None:
+                self.latency_ewma = (
+                    latency
+                    if self.latency_ewma is None
+                    else 0.8 * self.latency_ewma + 0.2 * latency
+                )
+                self.latency_floor = (
+                    latency
+                    if self.latency_floor is None
+                    else min(self.latency_floor, latency)
+                )
+                # *the slack keeps jitter of very fast calls from looking like queueing
+                if (
+                    self.latency_ewma
+                    > self.latency_tolerance * self.latency_floor + self.latency_slack
+                ):
+                    self._decrease(started, 0.9, "latency")
+                    # *slowly forget the best latency so a permanently slower service is not punished forever
+                    self.latency_floor *= 1.05
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def stats(self) -> dict:
+        """Current limit, usage and latency of the limiter."""
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "throttles": self.throttles,
+            "latency_ewma": round(self.latency_ewma or 0.0, 3),
+            "latency_floor": round(self.latency_floor or 0.0, 3),
+        }
+
+    def _decrease(self, started: float, factor: float, reason: str) -> None:
+        # *calls sent before the last decrease saw the old limit, they do not count again
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.min_limit, self.limit * factor)
+        logging.info(f"llm concurrency limit lowered to {self.limit:.1f} ({reason})")
+
+    def _wake(self) -> None:
+        with self._lock:
+            while self._waiters and self.in_flight < int(self.limit):
+                waiter: asyncio.Future = self._waiters.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight += 1
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class LLMRateController:
+    """
+    Admission control for one LLM deployment, shared by every session of the process.
+
+    A call waits for a slot of the adaptive concurrency limiter, then for the requests-per-minute
+    and tokens-per-minute buckets of the deployment quota.
+
+    Attributes:
+        concurrency (AdaptiveConcurrencyLimiter): Adaptive concurrency limit.
+        tokens (TokenBucket): Tokens-per-minute bucket (prompt + max completion tokens).
+        requests (TokenBucket): Requests-per-minute bucket.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        tokens_per_minute: int = 0,
+        requests_per_minute: int = 0,
+    ):
+        self.concurrency: AdaptiveConcurrencyLimiter = AdaptiveConcurrencyLimiter(
+            max_limit=max_concurrency
+        )
+        self.tokens: TokenBucket = TokenBucket(tokens_per_minute)
+        self.requests: TokenBucket = TokenBucket(requests_per_minute)
+
+    @property
+    def quota(self) -> tuple[int, int, int]:
+        """(tokens per minute, requests per minute, max concurrency) the controller was built with."""
+        return (
+            self.tokens.per_minute,
+            self.requests.per_minute,
+            self.concurrency.max_limit,
+        )
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncGenerator[None, None]:
+        """
+        Holds an admission slot for one LLM call.
+
+        Raising `openai.RateLimitError` inside the block counts as a 429 for the limiter, any
+        other exception frees the slot without adapting the limit.
+        """
+        await self.concurrency.acquire()
+        start: float = time.monotonic()
+        try:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            start = time.monotonic()
+            yield
+        except openai.RateLimitError:
+            self.concurrency.release(start, throttled=True)
+            raise
+        except BaseException:
+            self.concurrency.release(start)
+            raise
+        else:
+            self.concurrency.release(start, latency=time.monotonic() - start)
+
+    def stats(self) -> dict:
+        """Limiter state and remaining quota."""
+        return {
+            **self.concurrency.stats(),
+            "tokens_available": round(self.tokens.available),
+            "tokens_per_minute": self.tokens.per_minute,
+            "requests_available": round(self.requests.available),
+            "requests_per_minute": self.requests.per_minute,
+        }
+
+
+class RateLimitedLLM(BaseLLM):
+    """
+    Sends the calls of a graphrag LLM through an `LLMRateController`, retrying 429s itself.
+
+    The wrapped LLM should be created with `max_retries=0`, so rate limit errors reach this class
+    instead of being retried blindly by tenacity and the OpenAI client. Here each 429 shrinks the
+    shared concurrency limit, and the call waits for the `retry-after` hint (or an exponential
+    backoff) before it is queued again.
+
+    Attributes:
+        llm (BaseLLM): The wrapped LLM (e.g. `ChatOpenAI`).
+        controller (LLMRateController): The admission control of the deployment.
+        token_encoder (tiktoken.Encoding): Encoder used to estimate the prompt tokens of a call.
+        max_retries (int): Retries of rate limited or failed connections.
+        max_retry_wait (float): Upper bound of a backoff in seconds.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        controller: LLMRateController,
+        token_encoder: tiktoken.Encoding,
+        max_retries: int = 10,
+        max_retry_wait: float = 10.0,
+    ):
+        self.llm: BaseLLM = llm
+        self.controller: LLMRateController = controller
+        self.token_encoder: tiktoken.Encoding = token_encoder
+        self.max_retries: int = max_retries
+        self.max_retry_wait: float = max_retry_wait
+
+    def __getattr__(self, name: str) -> Any:
+        # *model, deployment_name etc. of the wrapped LLM
+        return getattr(self.llm, name)
+
+    def generate(
+        self,
+        messages: str | list[Any],
+        streaming: bool = True,
+        callbacks: list[BaseLLMCallback] | None = None,
+        **kwargs: Any,
+    ) -> str:
+        """Generate a response (synchronous calls are not rate controlled)."""
+        return self.llm.generate(messages, streaming, callbacks, **kwargs)
+
+    def stream_generate(
+        self,
+        messages: str | list[Any],
+        callbacks: list[BaseLLMCallback] | None = None,
+        **kwargs: Any,
+    ) -> Generator[str, None, None]:
+        """Generate a response with streaming (synchronous calls are not rate controlled)."""
+        yield from self.llm.stream_generate(messages, callbacks, **kwargs)
+
+    async def agenerate(
+        self,
+        messages: str | list[Any],
+        streaming: bool = True,
+        callbacks: list[BaseLLMCallback] | None = None,
+        **kwargs: Any,
+    ) -> str:
+        """Generate a response asynchronously once admitted by the controller."""
+        estimated_tokens: int = self._estimate_tokens(messages, kwargs)
+        with span(
+            "llm.generate", estimated_tokens=estimated_tokens, streaming=False
+        ) as llm_span:
+            for attempt in range(self.max_retries + 1):
+                llm_span.set_attribute("attempts", attempt + 1)
+                try:
+                    queued: float = time.perf_counter()
+                    async with self.controller.slot(estimated_tokens):
+                        queued_ms: float = (time.perf_counter() - queued) * 1000
+                        llm_span.set_attribute("queued_ms", round(queued_ms, 3))
+                        response: str = await self.llm.agenerate(
+                            messages=messages,
+                            streaming=streaming,
+                            callbacks=callbacks,
+                            **kwargs,
+                        )
+                        llm_span.set_attribute("response_chars", len(response or ""))
+                        return response
+                except (openai.RateLimitError, openai.APIConnectionError) as e:
+                    llm_span.set_attribute("retried_error", type(e).__name__)
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self._backoff(attempt, e))
+        return ""
+
+    async def astream_generate(
+        self,
+        messages: str | list[Any],
+        callbacks: list[BaseLLMCallback] | None = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[str, None]:
+        """Generate a response with streaming once admitted by the controller."""
+        estimated_tokens: int = self._estimate_tokens(messages, kwargs)
+        with span(
+            "llm.generate", estimated_tokens=estimated_tokens, streaming=True
+        ) as llm_span:
+            for attempt in range(self.max_retries + 1):
+                llm_span.set_attribute("attempts", attempt + 1)
+                started: bool = False
+                try:
+                    queued: float = time.perf_counter()
+                    async with self.controller.slot(estimated_tokens):
+                        queued_ms: float = (time.perf_counter() - queued) * 1000
+                        llm_span.set_attribute("queued_ms", round(queued_ms, 3))
+                        chunks: int = 0
+                        async for token in self.llm.astream_generate(
+                            messages=messages, callbacks=callbacks, **kwargs
+                        ):
+                            started = True
+                            chunks += 1
+                            llm_span.set_attribute("chunks", chunks)
+                            yield token
+                    return
+                except (openai.RateLimitError, openai.APIConnectionError) as e:
+                    llm_span.set_attribute("retried_error", type(e).__name__)
+                    # !tokens already shown cannot be taken back, only retry before the first one
+                    if started or attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self._backoff(attempt, e))
+
+    def _estimate_tokens(
+        self, messages: str | list[Any], kwargs: dict[str, Any]
+    ) -> int:
+        if isinstance(messages, str):
+            text: str = messages
+        else:
+            text = "\n".join(
+                str(message.get("content", "")) if isinstance(message, dict) else str(message)
+                for message in messages
+            )
+        return num_tokens(text, self.token_encoder) + int(kwargs.get("max_tokens", 0))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response: Any = getattr(error, "response", None)
+        headers: Any = getattr(response, "headers", None) or {}
+        retry_after: str | None = headers.get("retry-after-ms")
+        if retry_after is not None:
+            return min(self.max_retry_wait, float(retry_after) / 1000)
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(self.max_retry_wait, float(retry_after))
+            except ValueError:
+                pass
+        return min(self.max_retry_wait, 2**attempt + random.random())
@@ -0,0 +1,196 @@
+﻿import fnmatch
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+from azure.storage.blob import BlobPrefix, BlobProperties, ContainerClient
+
+from src.utils.blob_storage import BlobSyncStats, is_date_format_folder, sync_blobs
+from src.utils.df_manager import QUERY_COLUMNS, TABLES
+from src.utils.tracing import span
+
+
+class RemoteIndex:
+    """
+    Index folders kept in Blob Storage and fetched into the local output directory on demand.
+
+    Listing only reads the folder names (`output/<folder>/` prefixes), so the folders can be
+    selected without downloading anything; they are kept in `folders`, and a local directory is
+    only created when their first artifact is fetched. The first query of a folder fetches the
+    parquet tables its query path reads (see `QUERY_COLUMNS`); other artifacts (graphml,
+    intermediates, stats, vector stores) are fetched by `fetch` when something first opens them.
+    Folders that were not listed are local only and never looked up in the container. Fetched
+    files go through `sync_blobs`, so they are streamed, resumable and skipped when unchanged.
+
+    Attributes:
+        container_client (ContainerClient): The container holding `output/`.
+        output_dir (str): The local graphrag `output` directory.
+        folders (list[str]): The date-formatted index folders of the container, most recent first
+                                (empty until `list_folders`).
+        fetches (int): Number of fetches that downloaded at least one blob.
+    """
+
+    def __init__(self, container_client: ContainerClient, output_dir: str):
+        self.container_client: ContainerClient = container_client
+        self.output_dir: str = output_dir
+        self.folders: list[str] = []
+        self.fetches: int = 0
+        # *folder -> its artifact blobs, listed once per folder
+        self._listings: dict[str, list[BlobProperties]] = {}
+        # *(folder, query type or artifact prefix) already fetched
+        self._fetched: set[tuple[str, str | None]] = set()
+        self._lock: threading.Lock = threading.Lock()
+        self._folder_locks: dict[str, threading.Lock] = {}
+
+    def list_folders(self) -> list[str]:
+        """Lists the date-formatted index folders of the container into `folders` and returns them."""
+        folders: list[str] = []
+        for item in self.container_client.walk_blobs(
+            name_starts_with="output/", delimiter="/"
+        ):
+            if not isinstance(item, BlobPrefix):
+                continue
+            folder: str = item.name.rstrip("/").split("/")[-1]
+            if is_date_format_folder(folder):
+                folders.append(folder)
+        self.folders = sorted(folders, reverse=True)
+        logging.info(f"remote index: {len(folders)} folders in {self.container_client.container_name}")
+        return self.folders
+
+    def ensure_tables(self, folder: str, query_type: str | None = None) -> None:
+        """
+        Fetches the parquet tables a query path reads from a folder (every table if None).
+
+        Args:
+            folder (str): Index folder name.
+            query_type (str | None, optional): "global" or "local". Defaults to None.
+        """
+        key: tuple[str, str | None] = (folder, query_type)
+        if (
+            folder not in self.folders
+            or key in self._fetched
+            or (folder, None) in self._fetched
+        ):
+            return
+        df_names: list[str] = (
+            list(QUERY_COLUMNS[query_type]) if query_type in QUERY_COLUMNS else list(TABLES)
+        )
+        patterns: list[str] = [f"{TABLES[df_name]}*.parquet" for df_name in df_names]
+        with self._get_folder_lock(folder):
+            if key in self._fetched:
+                return
+            self._sync(
+                folder,
+                [
+                    blob
+                    for blob in self._listing(folder)
+                    if "/" not in self._artifact_name(folder, blob)
+                    and any(
+                        fnmatch.fnmatch(self._artifact_name(folder, blob), pattern)
+                        for pattern in patterns
+                    )
+                ],
+                reason=f"tables ({query_type or 'all'})",
+            )
+            self._fetched.add(key)
+
+    def fetch(self, folder: str, artifact: str) -> str:
+        """
+        Fetches an artifact of a folder, or every artifact under it if it ends with "/", on first access.
+
+        Args:
+            folder (str): Index folder name.
+            artifact (str): Path relative to the folder's `artifacts` directory (e.g. "stats.json", "lancedb/").
+
+        Returns:
+            str: The local path of the artifact.
+        """
+        key: tuple[str, str | None] = (folder, f"artifact:{artifact}")
+        local_path: str = os.path.join(
+            self.output_dir, folder, "artifacts", *artifact.rstrip("/").split("/")
+        )
+        if folder not in self.folders or key in self._fetched:
+            return local_path
+        with self._get_folder_lock(folder):
+            if key not in self._fetched:
+                self._sync(
+                    folder,
+                    [
+                        blob
+                        for blob in self._listing(folder)
+                        if (
+                            self._artifact_name(folder, blob).startswith(artifact)
+                            if artifact.endswith("/")
+                            else self._artifact_name(folder, blob) == artifact
+                        )
+                    ],
+                    reason=artifact,
+                )
+                self._fetched.add(key)
+        return local_path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "container": self.container_client.container_name,
+                "folders": len(self.folders),
+                "listed_folders": len(self._listings),
+                "fetched": len(self._fetched),
+                "fetches": self.fetches,
+            }
+
+    def _listing(self, folder: str) -> list[BlobProperties]:
+        with self._lock:
+            listing: list[BlobProperties] | None = self._listings.get(folder)
+        if listing is None:
+            listing = list(
+                self.container_client.list_blobs(
+                    name_starts_with=f"output/{folder}/artifacts/"
+                )
+            )
+            with self._lock:
+                self._listings[folder] = listing
+        return listing
+
+    def _sync(self, folder: str, blobs: list[BlobProperties], reason: str) -> None:
+        if not blobs:
+            return
+        with span(
+            "remote_index.fetch", folder=folder, reason=reason, blobs=len(blobs)
+        ) as fetch_span:
+            # *blob names start with output/, the graphdata root is the parent of output_dir
+            stats: BlobSyncStats = sync_blobs(
+                self.container_client, blobs, os.path.dirname(self.output_dir)
+            )
+            fetch_span.set_attributes(**stats.to_dict())
+        if stats.failed:
+            raise RuntimeError(f"failed to fetch {reason} of {folder}: {stats}")
+        if stats.downloaded:
+            with self._lock:
+                self.fetches += 1
+            logging.info(f"remote index: fetched {reason} of {folder}: {stats}")
+
+    @staticmethod
+    def _artifact_name(folder: str, blob: BlobProperties) -> str:
+        return blob.name[len(f"output/{folder}/artifacts/") :]
+
+    def _get_folder_lock(self, folder: str) -> threading.Lock:
+        with self._lock:
+            return self._folder_locks.setdefault(folder, threading.Lock())
+
+
+def attach_remote_index(state, container_client: ContainerClient) -> Future:
+    """
+    Makes the index registry fetch the folders of a container on demand, listed in the background.
+
+    Args:
+        state (StateModel): The application state, whose index registry is shared by all sessions.
+        container_client (ContainerClient): The container holding `output/`.
+
+    Returns:
+        Future: Resolves to the remote index folders, most recent first (see `IndexRegistry.attach_remote`).
+    """
+    return state.index_registry.attach_remote(
+        RemoteIndex(container_client, state.index_registry.output_dir)
+    )
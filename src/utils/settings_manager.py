@@ -2,9 +2,8 @@
 import os
 
 import gradio as gr
-from graphrag.index.progress import PrintProgressReporter
-from graphrag.prompt_tune.loader.config import read_config_parameters
 
+from src.config.config_loader import read_settings
 from src.state.state_model import StateModel
 
 
@@ -47,7 +46,7 @@ def update_llm_settings(
         - This function directly modifies the `.env` file at the specified path.
         - After updating the environment variables, it resets the Python environment
             to its initial state and reloads settings from `settings.yaml` using
-            `read_config_parameters`.
+            `read_settings`.
     """
     env_file: str = f'{os.getenv("GRAPHRAG_INPUT_BASE_DIR", "graphdata")}/.env'
 
@@ -86,9 +85,9 @@ def update_llm_settings(
     os.environ.update(state.initial_environ)
     print("Restored to initial state:", dict(os.environ))
 
-    state.param = read_config_parameters(
-        root="./graphdata", reporter=PrintProgressReporter("")
-    )
+    state.param = read_settings("./graphdata")
+    # !pooled clients hold the previous endpoints and keys
+    state.client_pool.clear()
 
     gr.Info("Settings have been updated successfully!")
     print("*" * 30)
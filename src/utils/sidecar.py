@@ -0,0 +1,67 @@
+﻿import json
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+METADATA_KEY: bytes = b"graphrag_sidecar"
+
+
+def stat_file(path: str) -> dict:
+    """File name, modification time and size of a file, to stamp data derived from it."""
+    stat: os.stat_result = os.stat(path)
+    return {
+        "file": os.path.basename(path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def read_sidecar(
+    path: str, stamp: dict, columns: list[str] | None = None
+) -> pd.DataFrame | None:
+    """
+    Reads a parquet sidecar written by `write_sidecar`, or returns None if it is missing or stale.
+
+    Args:
+        path (str): Path of the sidecar.
+        stamp (dict): Expected stamp (version, source file stats, settings...); any difference makes it stale.
+        columns (list[str] | None, optional): Columns to read, all of which must exist. Defaults to None (every column).
+
+    Returns:
+        pd.DataFrame | None: The sidecar's data, or None if it must be rebuilt.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        schema: pa.Schema = pq.read_schema(path)
+        metadata: dict = json.loads((schema.metadata or {}).get(METADATA_KEY, b"{}"))
+        if metadata != stamp or any(
+            column not in schema.names for column in columns or []
+        ):
+            logging.info(f"Sidecar {path} is stale")
+            return None
+        return pd.read_parquet(path, columns=columns)
+    except (OSError, ValueError, pa.ArrowException) as e:
+        logging.warning(f"Ignore broken sidecar {path}: {e}")
+        return None
+
+
+def write_sidecar(path: str, stamp: dict, df: pd.DataFrame) -> None:
+    """
+    Atomically writes a DataFrame as a parquet sidecar stamped with `stamp`.
+
+    A failed write (e.g. read-only index folder) is logged and ignored: the data is then
+    recomputed on the next load instead of read.
+    """
+    table: pa.Table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(stamp).encode()})
+    tmp_path: str = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Failed to write sidecar {path}: {e}")
@@ -0,0 +1,54 @@
+﻿import logging
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """
+    Wall-clock phases of the app startup, from the process start to the server listening.
+
+    Attributes:
+        started_at (float): `time.perf_counter()` at the start of the first phase (the process start for app.py).
+        phases (dict[str, float]): Seconds spent in each phase, in order.
+    """
+
+    def __init__(self, started_at: float | None = None):
+        self.started_at: float = (
+            started_at if started_at is not None else time.perf_counter()
+        )
+        self.phases: dict[str, float] = {}
+        self._last: float = self.started_at
+
+    def mark(self, name: str) -> None:
+        """Ends a phase that ran since the previous phase ended (e.g. the module imports)."""
+        now: float = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        """Times the enclosed code as a phase."""
+        self._last = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started_at
+
+    def to_dict(self) -> dict[str, float]:
+        """Milliseconds per phase, with the time to the end of the last phase as "total"."""
+        timings: dict[str, float] = {
+            name: round(seconds * 1000, 1) for name, seconds in self.phases.items()
+        }
+        timings["total"] = round(self.total * 1000, 1)
+        return timings
+
+    def log(self) -> None:
+        logging.info(
+            "startup: "
+            + ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.to_dict().items())
+        )
@@ -0,0 +1,170 @@
+﻿import logging
+import os
+import threading
+import time
+from typing import Any
+
+import pandas as pd
+import tiktoken
+
+from src.utils.sidecar import read_sidecar, stat_file, write_sidecar
+
+# !bump this when the sidecar layout or the counting changes to force a recount
+TOKEN_COUNTS_VERSION: int = 1
+TOKEN_COUNTS_DIR: str = "token_counts"
+
+# *long text columns whose token counts dominate context packing, per index DataFrame
+TOKEN_COUNT_COLUMNS: dict[str, list[str]] = {
+    "report_df": ["summary", "full_content"],
+    "text_unit_df": ["text"],
+}
+
+# *one count at a time per sidecar file
+_count_locks: dict[str, threading.Lock] = {}
+_count_locks_guard: threading.Lock = threading.Lock()
+
+
+def load_token_counts(
+    source_path: str,
+    df: pd.DataFrame,
+    columns: list[str],
+    token_encoder: tiktoken.Encoding,
+) -> dict[str, int]:
+    """
+    Returns the token count of every text of the given columns, from the artifact's sidecar.
+
+    Counts live in `<artifacts_folder>/token_counts/<artifact>.<encoding>.parquet`, one
+    `<column>_tokens` column per text column, row-aligned with the artifact. The sidecar is
+    stamped with the artifact's file stat; it is (re)written only when missing or stale, so a
+    folder is tokenized once and later loads (also after restarts) just read the counts.
+
+    Args:
+        source_path (str): Path of the parquet artifact the DataFrame was read from.
+        df (pd.DataFrame): The artifact's DataFrame, holding at least the `columns`.
+        columns (list[str]): Text columns to count.
+        token_encoder (tiktoken.Encoding): Encoder of the context builders.
+
+    Returns:
+        dict[str, int]: Token count per (non-empty) text.
+    """
+    columns = [column for column in columns if column in df.columns]
+    if df.empty or not columns:
+        return {}
+
+    sidecar_path: str = token_counts_path(source_path, token_encoder.name)
+    with _get_count_lock(sidecar_path):
+        stamp: dict = {
+            "version": TOKEN_COUNTS_VERSION,
+            "encoding": token_encoder.name,
+            "source": stat_file(source_path),
+            "rows": len(df),
+        }
+        counts: pd.DataFrame | None = read_sidecar(
+            sidecar_path, stamp, [f"{column}_tokens" for column in columns]
+        )
+        if counts is None:
+            start: float = time.perf_counter()
+            counts = pd.DataFrame(
+                {
+                    f"{column}_tokens": count_tokens(
+                        df[column].tolist(), token_encoder
+                    )
+                    for column in columns
+                }
+            )
+            write_sidecar(sidecar_path, stamp, counts)
+            logging.info(
+                f"Counted tokens of {os.path.basename(source_path)} {columns} "
+                f"in {time.perf_counter() - start:.3f}s -> {sidecar_path}"
+            )
+
+    token_counts: dict[str, int] = {}
+    for column in columns:
+        for text, tokens in zip(df[column].tolist(), counts[f"{column}_tokens"]):
+            if isinstance(text, str) and text:
+                token_counts[text] = int(tokens)
+    return token_counts
+
+
+def count_tokens(texts: list[Any], token_encoder: tiktoken.Encoding) -> list[int]:
+    """Token counts of the given texts (0 for missing ones), batched when the encoder supports it."""
+    values: list[str] = [text if isinstance(text, str) else "" for text in texts]
+    encode_batch = getattr(token_encoder, "encode_batch", None)
+    if encode_batch is not None:
+        return [len(tokens) for tokens in encode_batch(values)]
+    return [len(token_encoder.encode(value)) for value in values]
+
+
+def token_counts_path(source_path: str, encoding_name: str) -> str:
+    """Path of the token count sidecar of a parquet artifact."""
+    artifact: str = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(
+        os.path.dirname(source_path),
+        TOKEN_COUNTS_DIR,
+        f"{artifact}.{encoding_name}.parquet",
+    )
+
+
+class PrecountedTokenEncoder:
+    """
+    A token encoder for the context builders that counts context rows from precomputed token counts.
+
+    graphrag packs contexts by calling `num_tokens` (`len(token_encoder.encode(text))`) on every
+    candidate row (`id|title|...|content|rank\\n`). When a field of the row is a text with a known
+    count (report summary/content, text unit), only the short remaining fields are tokenized and
+    the known count is added, so packing no longer re-tokenizes the long texts on every query.
+    Other texts are encoded by the wrapped encoder.
+
+    The count of a row is the sum over its fields, which can differ from encoding the joined row
+    by a token at a field boundary; context budgets are soft limits, so this is accepted. For rows
+    with precounted fields `encode` returns a `range` standing in for the token ids: only its
+    length is meaningful, so this encoder must only be handed to token counting code.
+
+    Attributes:
+        token_encoder (tiktoken.Encoding): The wrapped encoder.
+        counts (dict[str, int]): Token count per known text.
+        delimiter (str): Column delimiter of the context rows.
+    """
+
+    def __init__(
+        self,
+        token_encoder: tiktoken.Encoding,
+        counts: dict[str, int],
+        delimiter: str = "|",
+    ):
+        self.token_encoder: tiktoken.Encoding = token_encoder
+        self.counts: dict[str, int] = counts
+        self.delimiter: str = delimiter
+
+    def __getattr__(self, name: str) -> Any:
+        # *name, decode etc. of the wrapped encoder
+        return getattr(self.token_encoder, name)
+
+    def encode(self, text: str, *args: Any, **kwargs: Any) -> list[int] | range:
+        if not self.counts:
+            return self.token_encoder.encode(text, *args, **kwargs)
+
+        precounted: int = 0
+        found: bool = False
+        rest: list[str] = []
+        for field in text.split(self.delimiter):
+            # !the last field of a row carries the row's newline
+            value: str = field[:-1] if field.endswith("\n") else field
+            tokens: int | None = self.counts.get(value) if value else None
+            if tokens is None:
+                rest.append(field)
+            else:
+                found = True
+                precounted += tokens
+                rest.append(field[len(value) :])
+        if not found:
+            return self.token_encoder.encode(text, *args, **kwargs)
+        return range(
+            precounted
+            + len(self.token_encoder.encode(self.delimiter.join(rest), *args, **kwargs))
+        )
+
+
+def _get_count_lock(sidecar_path: str) -> threading.Lock:
+    with _count_locks_guard:
+        return _count_locks.setdefault(os.path.abspath(sidecar_path), threading.Lock())
@@ -0,0 +1,73 @@
+﻿from typing import Any
+
+import pandas as pd
+from graphrag.query.llm.text_utils import num_tokens
+from graphrag.query.structured_search.global_search.community_context import (
+    GlobalCommunityContext,
+)
+from graphrag.query.structured_search.local_search.mixed_context import (
+    LocalSearchMixedContext,
+)
+
+from src.utils.tracing import Span, span
+
+
+def _set_context_attributes(
+    context_span: Any,
+    context_text: str | list[str],
+    context_records: dict[str, pd.DataFrame],
+    token_encoder: Any,
+) -> None:
+    """Records the batch count, tokens and record counts of a built context on its span."""
+    if not isinstance(context_span, Span):
+        # *counting tokens is not free, skip it when tracing is off
+        return
+    chunks: list[str] = [context_text] if isinstance(context_text, str) else context_text
+    context_span.set_attributes(
+        batches=len(chunks),
+        context_tokens=sum(num_tokens(chunk, token_encoder) for chunk in chunks),
+        records={
+            name: len(records)
+            for name, records in context_records.items()
+            if isinstance(records, pd.DataFrame)
+        },
+    )
+
+
+class TracedGlobalCommunityContext(GlobalCommunityContext):
+    """`GlobalCommunityContext` whose `build_context` is traced as a "context.build" span."""
+
+    def build_context(
+        self, *args: Any, **kwargs: Any
+    ) -> tuple[str | list[str], dict[str, pd.DataFrame]]:
+        with span(
+            "context.build",
+            query_type="global",
+            reports=len(self.community_reports),
+            max_tokens=kwargs.get("max_tokens"),
+            shuffle_data=kwargs.get("shuffle_data", True),
+        ) as context_span:
+            context_text, context_records = super().build_context(*args, **kwargs)
+            _set_context_attributes(
+                context_span, context_text, context_records, self.token_encoder
+            )
+        return context_text, context_records
+
+
+class TracedLocalSearchMixedContext(LocalSearchMixedContext):
+    """`LocalSearchMixedContext` whose `build_context` is traced as a "context.build" span."""
+
+    def build_context(
+        self, *args: Any, **kwargs: Any
+    ) -> tuple[str | list[str], dict[str, pd.DataFrame]]:
+        with span(
+            "context.build",
+            query_type="local",
+            max_tokens=kwargs.get("max_tokens"),
+            top_k_mapped_entities=kwargs.get("top_k_mapped_entities"),
+        ) as context_span:
+            context_text, context_records = super().build_context(*args, **kwargs)
+            _set_context_attributes(
+                context_span, context_text, context_records, self.token_encoder
+            )
+        return context_text, context_records
@@ -0,0 +1,192 @@
+﻿import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Generator
+from contextlib import contextmanager
+from typing import Any
+
+# *span of the code running now; asyncio tasks inherit it, so map calls nest under the search span
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """
+    A timed operation of a chat request, with attributes (token counts, batch sizes, cache hits...).
+
+    Attributes:
+        name (str): Operation name, e.g. "global.map_batch".
+        trace_id (str): Id shared by every span of a request (32 hex chars).
+        span_id (str): Id of this span (16 hex chars).
+        parent_span_id (str | None): Id of the enclosing span.
+        attributes (dict[str, Any]): Attributes of the operation.
+    """
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict[str, Any]):
+        self.name: str = name
+        self.trace_id: str = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id: str = secrets.token_hex(8)
+        self.parent_span_id: str | None = parent.span_id if parent else None
+        self.attributes: dict[str, Any] = dict(attributes)
+        self.start_ns: int = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        """The span in the field layout of OTLP/JSON."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error}
+            if self.error
+            else {"code": "OK"},
+        }
+
+
+class NoopSpan:
+    """Stands in for `Span` when tracing is off, so instrumented code needs no checks."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+
+_NOOP_SPAN: NoopSpan = NoopSpan()
+
+
+def current_span() -> Span | NoopSpan:
+    """The span of the code running now, to add attributes to it (a no-op span if there is none)."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+class JsonLinesSpanExporter:
+    """
+    Appends finished spans as JSON lines (one span per line) to a file.
+
+    Attributes:
+        path (str): The trace file.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, span: Span) -> None:
+        line: str = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as fo:
+                fo.write(line + "\n")
+
+
+_exporter: JsonLinesSpanExporter | None = None
+_exporter_lock: threading.Lock = threading.Lock()
+_exporter_path: str | None = None
+
+
+def get_exporter() -> JsonLinesSpanExporter | None:
+    """The span exporter of GRAPHRAG_TRACE_FILE, or None if tracing is off (variable unset)."""
+    global _exporter, _exporter_path
+    path: str | None = os.getenv("GRAPHRAG_TRACE_FILE") or None
+    if path != _exporter_path:
+        with _exporter_lock:
+            _exporter = JsonLinesSpanExporter(path) if path else None
+            _exporter_path = path
+            if path:
+                logging.info(f"tracing spans to {path}")
+    return _exporter
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Generator[Span | NoopSpan, None, None]:
+    """
+    Traces the enclosed block as a child of the current span.
+
+    Spans are exported to GRAPHRAG_TRACE_FILE (JSON lines in the OTLP/JSON span layout) when the
+    block ends. Without the variable this is a no-op. An exception raised by the block marks the
+    span as failed and is re-raised.
+
+    Args:
+        name (str): Operation name.
+        **attributes: Initial attributes, more can be set on the yielded span.
+
+    Yields:
+        Span: The span, to set attributes known only inside the block.
+    """
+    exporter: JsonLinesSpanExporter | None = get_exporter()
+    if exporter is None:
+        yield _NOOP_SPAN
+        return
+
+    current: Span = Span(name, _current_span.get(), attributes)
+    token: contextvars.Token = _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        # *a generator closed early (e.g. a stream the client stopped reading) did not fail
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # !an async generator may be resumed in another context than the one it started in
+            _current_span.set(None)
+        try:
+            exporter.export(current)
+        except OSError as e:
+            logging.warning(f"failed to export span {name}: {e}")
+
+
+@contextmanager
+def activate(parent: Span | NoopSpan) -> Generator[None, None, None]:
+    """Makes `parent` the current span for the enclosed block (no-op for a no-op span)."""
+    if not isinstance(parent, Span):
+        yield
+        return
+    token: contextvars.Token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+async def aiter_in_span(
+    iterator: AsyncIterator, parent: Span | NoopSpan
+) -> AsyncGenerator:
+    """
+    Iterates an async iterator with `parent` as the current span of every step.
+
+    An async generator (e.g. `send_message`) may be resumed by the UI in a new context at every
+    yield, which would lose its span; re-activating it per step keeps the spans of the nested
+    search under the request span.
+    """
+    while True:
+        with activate(parent):
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield item